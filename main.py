@@ -20,8 +20,8 @@ from datetime import time as datetime_time
 import pytz
 import signal
 import sys
-import threading
 import re
+import uuid
 import asyncio
 from typing import Dict, Any
 
@@ -36,9 +36,9 @@ from telegram.ext import (
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters,
     ContextTypes,
-    PicklePersistence,
     ApplicationBuilder,
 )
 
@@ -63,6 +63,8 @@ try:
         safe_update_calendar_event,
         safe_delete_calendar_event,
         safe_log_missed_call,
+        refresh_google_credentials,
+        google_status,
     )
     print("✅ Импорт safe_google успешен")
 except ImportError as e:
@@ -73,15 +75,37 @@ except ImportError as e:
         print("   3. Отсутствует какая-то функция")
         raise  # Останавливаем выполнение
 
+from utils.async_google import sheets, calendar, run_blocking, shutdown_executor
+from utils.write_behind import write_buffer, flush_write_buffer_job, FLUSH_INTERVAL
+from utils.records import records_repo, refresh_records_job, FULL_RELOAD_TTL
+from utils.schedule import load_schedule_index
+from utils.services import get_service_catalog, load_service_catalog, invalidate_service_catalog
 from utils.slots import find_available_slots
 from utils.reminders import (
-    send_reminders,
+    reminder_scheduler,
     handle_confirm_reminder,
     handle_cancel_reminder,
 )
-from utils.admin import load_admins, notify_admins
+from utils.admin import load_admins, get_admin_ids, notify_admins, ADMIN_CHAT_IDS
 from utils.validation import validate_name, validate_phone
-from utils.settings import load_settings_from_table
+from utils.settings import get_settings, invalidate_settings
+from utils.cache import cache, log_cache_stats_job, STATS_INTERVAL
+from utils.dispatcher import dispatcher, PRIORITY_BOOKING
+from utils.persistence import SQLitePersistence
+from utils.update_processor import PerChatUpdateProcessor
+from utils.callback_router import CallbackRouter, NOT_FOUND
+from utils.outbox import outbox, flush_outbox_job, FLUSH_INTERVAL as OUTBOX_FLUSH_INTERVAL
+from utils.id_allocator import id_allocator
+from utils.reservations import reservations, time_to_minutes, HOLD_TTL
+from utils.calendar_mirror import calendar_mirror, sync_calendar_mirror_job, SYNC_INTERVAL
+from utils.quota import (
+    set_google_priority,
+    google_priority,
+    quota_status,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_ADMIN,
+    PRIORITY_BACKGROUND,
+)
 
 def clean_phone_number(phone_str: str) -> str:
     """Очищает номер телефона от апострофов, пробелов, дефисов"""
@@ -168,42 +192,11 @@ class RateLimiter:
 
 rate_limiter = RateLimiter(max_requests=15, window=60)
 
-# --- КЭШИРОВАНИЕ НАСТРОЕК С TTL ---
-_settings_cache: Dict[str, Any] = {}
-_settings_cache_timestamp: float = 0
-_cache_lock = threading.Lock()
-CACHE_TTL: int = 300  # 5 минут
+# --- НАСТРОЙКИ (регион «settings» единого кэша, utils/cache.py) ---
 
 
 def get_cached_settings() -> Dict[str, Any]:
-    global _settings_cache, _settings_cache_timestamp
-    now = time.time()
-    if _settings_cache and (now - _settings_cache_timestamp) <= CACHE_TTL:
-        return _settings_cache
-    with _cache_lock:
-        now = time.time()
-        if not _settings_cache or (now - _settings_cache_timestamp) > CACHE_TTL:
-            try:
-                raw = safe_get_sheet_data(SHEET_ID, "Настройки!A3:B") or []
-                _settings_cache = {
-                    str(row[0]).strip(): str(row[1]).strip()
-                    for row in raw
-                    if len(row) >= 2 and row[0] and row[1]
-                }
-                _settings_cache_timestamp = now
-                missing = [
-                    k
-                    for k in ["Время начала работы", "Время окончания работы"]
-                    if k not in _settings_cache
-                ]
-                if missing:
-                    logger.warning(f"! Отсутствуют настройки: {missing}")
-            except Exception as e:
-                logger.error(f"❌ Ошибка загрузки настроек: {e}")
-                if not _settings_cache:
-                    _settings_cache = {}
-                    _settings_cache_timestamp = now
-        return _settings_cache
+    return get_settings()
 
 
 def get_setting(key: str, default: str = "") -> str:
@@ -211,52 +204,26 @@ def get_setting(key: str, default: str = "") -> str:
 
 
 def invalidate_settings_cache():
-    global _settings_cache, _settings_cache_timestamp
-    with _cache_lock:
-        _settings_cache = {}
-        _settings_cache_timestamp = 0
-        logger.info("🧹 Кэш настроек сброшен")
+    invalidate_settings()
 
 
-# --- КЭШИРОВАНИЕ УСЛУГ ---
-_services_cache = None
-_services_cache_timestamp = 0
-SERVICES_CACHE_TTL = 300
+# --- КАТАЛОГ УСЛУГ (utils/services.py) ---
 
 
 def get_cached_services():
-    global _services_cache, _services_cache_timestamp
-    now = time.time()
-    if (
-        _services_cache is None
-        or (now - _services_cache_timestamp) > SERVICES_CACHE_TTL
-    ):
-        try:
-            _services_cache = safe_get_sheet_data(SHEET_ID, "Услуги!A3:G") or []
-            _services_cache_timestamp = now
-        except Exception as e:
-            logger.error(f"❌ Ошибка загрузки услуг: {e}")
-            _services_cache = []
-    return _services_cache
+    """Строки листа «Услуги» как есть (для старых вызовов)."""
+    return get_service_catalog().rows
 
 
 def calculate_service_step(subservice: str) -> int:
-    services = get_cached_services()
-    for row in services:
-        if len(row) > 1 and row[1] == subservice:
-            try:
-                duration = int(row[2]) if row[2] else 0
-                buffer = int(row[3]) if row[3] else 0
-                return duration + buffer
-            except (ValueError, TypeError):
-                break
+    total = get_service_catalog().total_minutes(subservice)
+    if total is not None:
+        return total
     return int(get_setting("Дефолтный шаг услуги", "60"))
 
 
 def invalidate_services_cache():
-    global _services_cache, _services_cache_timestamp
-    _services_cache = None
-    _services_cache_timestamp = 0
+    invalidate_service_catalog()
 
 
 # --- LOGGING SETUP ---
@@ -337,12 +304,16 @@ async def cleanup_old_sessions_job(context: ContextTypes.DEFAULT_TYPE):
         if now - data.get("_last_activity", now) > max_age
     ]
     for user_id in to_remove:
-        try:
-            del context.application.user_data[user_id]
-        except KeyError:
-            pass
+        context.application.drop_user_data(user_id)  # Удаляется и из persistence
     if to_remove:
         logger.info(f"🧹 Очищено {len(to_remove)} старых сессий")
+    persistence = context.application.persistence
+    if isinstance(persistence, SQLitePersistence):
+        # Сессии, не загруженные в память (ленивая загрузка), чистим прямо в базе
+        purged = persistence.purge(max_age)
+        if purged:
+            logger.info(f"🧹 Удалено из базы сессий: {purged}")
+    outbox.purge()
 
 
 # --- CLEANUP STUCK RESERVATIONS WITH WAITING LIST CHECK ---
@@ -368,7 +339,8 @@ async def cleanup_stuck_reservations_job(context: ContextTypes.DEFAULT_TYPE):
                         if (now - booking_dt).total_seconds() > 1800:
                             event_id = temp_booking.get("event_id")
                             if event_id:
-                                safe_delete_calendar_event(CALENDAR_ID, event_id)
+                                await calendar.delete_event(event_id)
+                            reservations.release(user_id)
                             slot_date = temp_booking.get("date")
                             slot_time = temp_booking.get("time")
                             slot_specialist = temp_booking.get("specialist")
@@ -378,7 +350,7 @@ async def cleanup_stuck_reservations_job(context: ContextTypes.DEFAULT_TYPE):
                                 )
                                 processed_slots += 1
                             if user_id in context.application.user_data:
-                                del context.application.user_data[user_id]
+                                context.application.drop_user_data(user_id)
                             stuck_count += 1
                     except (ValueError, TypeError):
                         pass
@@ -395,30 +367,27 @@ async def cleanup_stuck_reservations_job(context: ContextTypes.DEFAULT_TYPE):
 
 async def health_check_job(context: ContextTypes.DEFAULT_TYPE):
     try:
-        test_data = safe_get_sheet_data(SHEET_ID, "Настройки!A1:B1") or []
+        test_data = await sheets.get("Настройки!A1:B1") or []
 
-        # Проверяем календарь - ищем события на сегодня
-        today_start = datetime.now(TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
-        tomorrow_start = today_start + timedelta(days=1)
-        
-        test_events = (
-            safe_get_calendar_events(
-                CALENDAR_ID,
-                today_start.isoformat(),
-                tomorrow_start.isoformat(),
-            )
-            or []
-        )
+        # Проверяем календарь: синхронизация зеркала по syncToken + события на сегодня из индекса
+        calendar_ok = await calendar_mirror.ensure_fresh()
+        today_events = calendar_mirror.events_on(datetime.now(TIMEZONE).date())
 
         active_users = len(context.application.user_data)
         active_jobs = len(context.job_queue.jobs())
+        breakers = google_status()
+        quota = quota_status()
         logger.info(
-            f"🏥 Health Check: Sheets={bool(test_data)}, Calendar={bool(test_events)}, Users={active_users}, Jobs={active_jobs}"
+            f"🏥 Health Check: Sheets={bool(test_data)}, Calendar={calendar_ok}, Events today={len(today_events)}, Users={active_users}, Jobs={active_jobs}, Google={breakers}, Quota={quota}"
         )
         log_business_event(
             "health_check",
             sheets_connected=bool(test_data),
-            calendar_connected=bool(test_events),
+            calendar_connected=calendar_ok,
+            calendar_events_today=len(today_events),
+            google_breakers=breakers,
+            google_quota=quota,
+            callback_routes=callback_router.stats(),
             active_users=active_users,
             active_jobs=active_jobs,
         )
@@ -427,6 +396,16 @@ async def health_check_job(context: ContextTypes.DEFAULT_TYPE):
         await notify_admins(context, f"🚨 Health Check failed: {e}")
 
 
+# --- GOOGLE TOKEN REFRESH ---
+
+
+async def refresh_google_token_job(context: ContextTypes.DEFAULT_TYPE):
+    # Обновляем токен заранее и вне event loop, чтобы клики пользователей не ждали OAuth
+    refreshed = await run_blocking(refresh_google_credentials, default=False)
+    if not refreshed:
+        logger.warning("⚠️ Не удалось заранее обновить Google токен")
+
+
 # --- LOCK FILE ---
 
 
@@ -497,6 +476,9 @@ def remove_lock_file():
 
 ACTIVE_STATUSES = {"подтверждено", "ожидает оплаты", "забронировано", "изменено клиентом"}
 CANCELLABLE_STATUSES = {"подтверждено", "ожидает оплаты", "забронировано", "изменено клиентом"}
+SIDE_EFFECT_TIMEOUT = 15  # Секунды на сообщение клиенту / уведомление админов после записи
+# Запись ещё в outbox (row_number = None): писать в неё по номеру строки нельзя
+RECORD_NOT_SAVED_YET = "⏳ Запись {} ещё сохраняется в таблицу. Повторите через минуту."
 
 # --- HELPERS ---
 
@@ -573,6 +555,21 @@ def validate_date_format(date_str: str) -> bool:
         return False
 
 
+# --- ДАННЫЕ ЭКРАНОВ (ОДИН batchGet НА ЭКРАН) ---
+# Экран заранее объявляет, какие диапазоны ему нужны, и получает их одним запросом.
+# График специалистов сюда не входит — он берётся из ScheduleIndex (utils/schedule.py).
+SCREEN_DATA_RANGES = {
+    "new_calls": ("Обратные звонки!A3:J",),
+}
+
+
+async def load_screen_data(screen: str) -> list:
+    """Загружает все диапазоны экрана одним запросом; возвращает списки строк в порядке объявления."""
+    ranges = SCREEN_DATA_RANGES[screen]
+    data = await sheets.batch_get(ranges) or {}
+    return [data.get(r) or [] for r in ranges]
+
+
 # --- CHECK WAITING LIST (С ПОДДЕРЖКОЙ ПРИОРИТЕТА И БЛИЗКИХ СЛОТОВ) ---
 
 
@@ -586,9 +583,9 @@ async def check_waiting_list(
         MAX_NOTIFY = int(
             get_setting("Максимальное количество уведомлений из листа ожидания", "1")
         )
-        waiting_list = safe_get_sheet_data(SHEET_ID, "Лист ожидания!A3:L") or []
+        waiting_list = await sheets.get("Лист ожидания!A3:L") or []
         candidates = []
-        for idx, row in enumerate(waiting_list, start=2):
+        for idx, row in enumerate(waiting_list, start=3):  # данные с 3-й строки
             if len(row) < 12:
                 continue
             wait_date = str(row[7]).strip() if len(row) > 7 and row[7] else ""
@@ -624,22 +621,29 @@ async def check_waiting_list(
                     continue
         candidates.sort(key=lambda x: (-x["priority"], x["diff"]))
         notified = 0
-        for cand in candidates[:MAX_NOTIFY]:
-            try:
-                await context.bot.send_message(
-                    chat_id=cand["chat_id"],
-                    text=f"🎉 Появилось свободное время!\n📅 Дата: {slot_date}\n⏰ Время: {slot_time} (запрашивали {cand['req_time']})\n👩‍💼 Специалист: {specialist}\nНажмите /start для записи.",
-                )
-                updated = list(cand["row"])
-                updated[10] = "уведомлен"
-                safe_update_sheet_row(SHEET_ID, "Лист ожидания", cand["idx"], updated)
-                notified += 1
-                logger.info(
-                    f"✅ Уведомлён клиент: {cand['chat_id']}, приоритет {cand['priority']}"
+        selected = candidates[:MAX_NOTIFY]
+        results = await dispatcher.send_many(
+            context.bot,
+            [
+                (
+                    cand["chat_id"],
+                    f"🎉 Появилось свободное время!\n📅 Дата: {slot_date}\n⏰ Время: {slot_time} (запрашивали {cand['req_time']})\n👩‍💼 Специалист: {specialist}\nНажмите /start для записи.",
+                    {},
                 )
-            except Exception as e:
-                logger.error(f"❌ Ошибка уведомления: {e}")
+                for cand in selected
+            ],
+        )
+        for cand, result in zip(selected, results):
+            if isinstance(result, Exception):
+                logger.error(f"❌ Ошибка уведомления: {result}")
+                continue
+            write_buffer.queue_cell("Лист ожидания", f"K{cand['idx']}", "уведомлен")
+            notified += 1
+            logger.info(
+                f"✅ Уведомлён клиент: {cand['chat_id']}, приоритет {cand['priority']}"
+            )
         if notified:
+            await write_buffer.flush()
             logger.info(f"📢 Уведомлено {notified} клиентов из листа ожидания")
     except Exception as e:
         logger.error(f"❌ Ошибка в check_waiting_list: {e}", exc_info=True)
@@ -775,7 +779,7 @@ async def show_record_details(
     # 2. Имеет статус "подтверждено"
     # 3. Не прошедшая по дате/времени
     
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.by_id(record_id)
     target_record = None
     now = datetime.now(TIMEZONE)
     
@@ -867,278 +871,117 @@ async def _validate_booking_checks(
     service_type: str,
     specialist: str
 ):
-    # ЕСЛИ ЭТО ИЗМЕНЕНИЕ ЗАПИСИ - ПРОПУСКАЕМ ПРОВЕРКУ ПОВТОРНОЙ ЗАПИСИ
-    if context.user_data.get("modify_mode"):
-        logger.info(f"🔄 Изменение записи: пропускаем проверку повторной записи")
-        
-        # ПРОПУСКАЕМ проверки 2 и 3 (повторные записи и телефон)
-        # Выполняем ТОЛЬКО проверку 1 (занятость специалиста)
-        
-        records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-        ss = context.user_data.get("subservice", "")
-        service_duration = calculate_service_step(ss)
-        
-        # Преобразуем новое время
-        try:
-            new_start = TIMEZONE.localize(
-                datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
-            )
-            new_end = new_start + timedelta(minutes=service_duration)
-        except ValueError:
-            return False, "❌ Неверный формат даты/времени"
-        
-        # === ТОЛЬКО ПРОВЕРКА 1: СПЕЦИАЛИСТ ЗАНЯТ? ===
-        for r in records:
-            if len(r) > 8:
-                record_specialist = str(r[5]).strip() if len(r) > 5 else ""  # ← ИСПРАВЛЕНО
-                record_status = str(r[8]).strip() if len(r) > 8 else ""      # ← ИСПРАВЛЕНО
-                record_date = str(r[6]).strip() if len(r) > 6 else ""        # ← ИСПРАВЛЕНО
-                
-                # Проверяем только подтвержденные записи того же специалиста в тот же день
-                if (record_specialist == specialist and 
-                    record_status == "подтверждено" and 
-                    record_date == date_str):
-                    
-                    record_time = str(r[7]).strip() if len(r) > 7 else ""    # ← ИСПРАВЛЕНО
-                    record_service = str(r[4]).strip() if len(r) > 4 else "" # ← ИСПРАВЛЕНО
-                    
-                    try:
-                        record_start = TIMEZONE.localize(
-                            datetime.strptime(f"{record_date} {record_time}", "%d.%m.%Y %H:%M")
-                        )
-                        record_duration = calculate_service_step(record_service)
-                        record_end = record_start + timedelta(minutes=record_duration)
-                        
-                        # Проверяем пересечение времени
-                        if max(new_start, record_start) < min(new_end, record_end):
-                            return (
-                                False,
-                                f"❌ Специалист {specialist} уже занят в это время.\n"
-                                f"Выберите другое время или специалиста."
-                            )
-                    except (ValueError, TypeError):
-                        continue
-        
-        # Все проверки пройдены
-        return True, None
-    
-    if not date_str or date_str in ["Неизвестно", "None", "none", ""]:
-        return False, "❌ Ошибка: дата не указана."
-    
-    if not time_str or time_str in ["Неизвестно", "None", "none", ""]:
-        return False, "❌ Ошибка: время не указано."
-    
-    if not specialist or specialist in ["любой", "None", "none", ""]:
-        return False, "❌ Ошибка: специалист не выбран."
-    
-    # ДЛЯ ОТЛАДКИ: вывести полученные данные
-    print(f"=== DEBUG ВХОДНЫЕ ДАННЫЕ ВАЛИДАЦИИ ===")
-    print(f"date_str: '{date_str}'")
-    print(f"time_str: '{time_str}'")
-    print(f"specialist: '{specialist}'")
-    print(f"name: '{name}'")
-    print(f"phone: '{phone}'")
-
     """
     Проверяет возможность бронирования с учетом:
     1. Занятости специалиста
     2. Занятости клиента (по телефону)
     3. Повторной записи в категории
+
+    Все проверки — по индексам records_repo в памяти: записи специалиста на дату
+    (интервалы в минутах) и записи с этим телефоном, каждая просматривается один раз.
     """
-    
-    # Получаем все записи
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-    
-    # Получаем данные текущей услуги
-    ss = context.user_data.get("subservice", "")
-    service_duration = calculate_service_step(ss)
-    
-    # Преобразуем новое время
+    modify_mode = context.user_data.get("modify_mode")
+
+    if not modify_mode:
+        if not date_str or date_str in ["Неизвестно", "None", "none", ""]:
+            return False, "❌ Ошибка: дата не указана."
+
+        if not time_str or time_str in ["Неизвестно", "None", "none", ""]:
+            return False, "❌ Ошибка: время не указано."
+
+        if not specialist or specialist in ["любой", "None", "none", ""]:
+            return False, "❌ Ошибка: специалист не выбран."
+
+    # Новое время в минутах от начала суток
     try:
-        new_start = TIMEZONE.localize(
-            datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
-        )
-        new_end = new_start + timedelta(minutes=service_duration)
-    except ValueError:
+        datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
+    except (ValueError, TypeError):
         return False, "❌ Неверный формат даты/времени"
-    
-    # ДЛЯ ОТЛАДКИ:
-    print(f"=== DEBUG ВАЛИДАЦИЯ ===")
-    print(f"Проверяем запись: {date_str} {time_str} к {specialist}")
-    print(f"Услуга: {ss}, Длительность: {service_duration} мин")
-    print(f"Новое время: {new_start.strftime('%H:%M')}-{new_end.strftime('%H:%M')}")
-    print(f"Ищем пересечения...")
-    
-    print(f"Всего записей в базе: {len(records)}")
-    for i, r in enumerate(records[:5]):  # первые 5 записей
-        if len(r) > 8:
-            print(f"  [{i}] {r[1]}: {r[6]} {r[7]} к {r[5]}")
-    
-    # ← ДОБАВИТЬ ЭТОТ БЛОК ↓↓↓
-    # РАСШИРЕННАЯ ОТЛАДКА ДЛЯ ТЕЛЕФОНА
-    print(f"=== DEBUG ТЕЛЕФОННАЯ ПРОВЕРКА ===")
-    print(f"Клиент: {name}, Телефон: {phone}")
-    print(f"Ищем записи с телефоном {phone}:")
-    phone_matches = 0
-    for i, r in enumerate(records):
-        if len(r) > 8 and str(r[2]).strip() == phone:
-            phone_matches += 1
-            try:
-                record_start = TIMEZONE.localize(
-                    datetime.strptime(f"{r[6]} {r[7]}", "%d.%m.%Y %H:%M")
-                )
-                record_duration = calculate_service_step(r[4] if len(r) > 4 else "")
-                record_end = record_start + timedelta(minutes=record_duration)
-                
-                print(f"  [{i}] {r[1]}: {r[6]} {r[7]} ({record_start.strftime('%H:%M')}-{record_end.strftime('%H:%M')})")
-                print(f"     Пересекается? {max(new_start, record_start) < min(new_end, record_end)}")
-            except (ValueError, TypeError):
-                print(f"  [{i}] {r[1]}: ОШИБКА парсинга времени")
-    print(f"Всего записей с этим телефоном: {phone_matches}")
-    print(f"=== КОНЕЦ ОТЛАДКИ ===")
-    # ← КОНЕЦ ДОБАВЛЕНИЯ ↑
-    
-    # === ПРОВЕРКА 1: СПЕЦИАЛИСТ ЗАНЯТ? ===
-    for r in records:
-        if len(r) > 8:
-            record_specialist = str(r[5]).strip() if len(r) > 5 else ""       # ← ИСПРАВЛЕНО
-            record_status = str(r[8]).strip() if len(r) > 8 else ""           # ← ИСПРАВЛЕНО
-            record_date = str(r[6]).strip() if len(r) > 6 else ""             # ← ИСПРАВЛЕНО
-            
-            # Проверяем только подтвержденные записи того же специалиста в тот же день
-            if (record_specialist == specialist and 
-                record_status == "подтверждено" and 
-                record_date == date_str):
-                
-                record_time = str(r[7]).strip() if len(r) > 7 else ""         # ← ИСПРАВЛЕНО
-                record_service = str(r[4]).strip() if len(r) > 4 else ""      # ← ИСПРАВЛЕНО
-                
-                try:
-                    record_start = TIMEZONE.localize(
-                        datetime.strptime(f"{record_date} {record_time}", "%d.%m.%Y %H:%M")
-                    )
-                    record_duration = calculate_service_step(record_service)
-                    record_end = record_start + timedelta(minutes=record_duration)
-                    
-                    # ДЛЯ ОТЛАДКИ:
-                    print(f"  Сравниваем с: {r[1]} {record_time}-{record_end.strftime('%H:%M')} ({record_service})")
-                    
-                    # Проверяем пересечение времени
-                    if max(new_start, record_start) < min(new_end, record_end):
-                        return (
-                            False,
-                            f"❌ Специалист {specialist} уже занят в это время.\n"
-                            f"Выберите другое время или специалиста."
-                        )
-                except (ValueError, TypeError):
-                    continue
-    
-    # === ПРОВЕРКА 2: КЛИЕНТ (ПО ТЕЛЕФОНУ) ЗАНЯТ? ===
-    for r in records:
-        if len(r) > 8:
-            record_phone = str(r[2]).strip() if len(r) > 2 else ""            # ← ИСПРАВЛЕНО
-            record_status = str(r[8]).strip() if len(r) > 8 else ""           # ← ИСПРАВЛЕНО
-            record_date = str(r[6]).strip() if len(r) > 6 else ""             # ← ИСПРАВЛЕНО
-                     
-            # Проверяем тот же телефон (разные люди могут использовать один телефон)
-            if (record_phone == phone and 
-                record_status == "подтверждено" and 
-                record_date == date_str):
-                
-                record_name = str(r[1]).strip() if len(r) > 1 else ""         # ← ИСПРАВЛЕНО
-                record_time = str(r[7]).strip() if len(r) > 7 else ""         # ← ИСПРАВЛЕНО
-                record_service = str(r[4]).strip() if len(r) > 4 else ""      # ← ИСПРАВЛЕНО
-                record_specialist = str(r[5]).strip() if len(r) > 5 else ""   # ← ИСПРАВЛЕНО
-                
-                try:
-                    record_start = TIMEZONE.localize(
-                        datetime.strptime(f"{record_date} {record_time}", "%d.%m.%Y %H:%M")
-                    )
-                    record_duration = calculate_service_step(record_service)
-                    record_end = record_start + timedelta(minutes=record_duration)
-                    
-                    # Проверяем пересечение времени
-                    if max(new_start, record_start) < min(new_end, record_end):
-                        # Если имя совпадает - это тот же человек
-                        if record_name.lower() == name.lower():
-                            return (
-                                False,
-                                f"❌ У вас уже есть запись на это время:\n"
-                                f"Выберите другое время или специалиста."                            )
-                        else:
-                            # Разные люди, но один телефон (семья) - РАЗРЕШАЕМ
-                            logger.info(f"⚠️ Разные люди используют один телефон: {record_name} и {name}")
+    ss = context.user_data.get("subservice", "")
+    new_start = time_to_minutes(time_str)
+    new_end = new_start + calculate_service_step(ss)
+    logger.debug(
+        f"🔎 Проверка записи: {date_str} {time_str} к {specialist}, услуга {ss}, клиент {name} ({phone})"
+    )
 
-                            # Пропускаем проверку, разрешаем запись
-                            continue
+    await records_repo.ensure_fresh()
 
-                except (ValueError, TypeError):
-                    continue
+    # === ПРОВЕРКА 1: СПЕЦИАЛИСТ ЗАНЯТ? ===
+    # Подтверждённые записи этого специалиста на эту дату. При изменении записи старая
+    # запись клиента тоже учитывается: новое время не может её пересекать (соседний слот — может)
+    for busy_start, busy_end, _ in reservations.booked_intervals(specialist, date_str):
+        if busy_start < new_end and new_start < busy_end:
+            return (
+                False,
+                f"❌ Специалист {specialist} уже занят в это время.\n"
+                f"Выберите другое время или специалиста."
+            )
 
-    # === ПРОВЕРКА 3: ПОВТОРНАЯ ЗАПИСЬ В КАТЕГОРИИ ===
-    # Проверяем по телефону (разные люди могут использовать один телефон)
+    # ЕСЛИ ЭТО ИЗМЕНЕНИЕ ЗАПИСИ - ПРОПУСКАЕМ ПРОВЕРКИ 2 И 3 (повторные записи и телефон)
+    if modify_mode:
+        logger.info(f"🔄 Изменение записи: пропускаем проверку повторной записи")
+        return True, None
+
+    # === ПРОВЕРКИ 2 И 3: ОДИН ПРОХОД ПО ЗАПИСЯМ С ЭТИМ ТЕЛЕФОНОМ ===
+    # (разные люди могут использовать один телефон)
+    today_date = datetime.now(TIMEZONE).date()
     repeat_records = []
     phone_conflict = False
-    different_name_same_phone = False
-    
-    for r in records:
-        # ← ИЗМЕНЕНИЕ: проверяем ДОСТАТОЧНОЕ количество колонок
-        if len(r) > 8:  # ← МЕНЯЕМ с >4 на >8 (нужен доступ к r[8] - статус)
-            record_name = str(r[1]).strip() if len(r) > 1 else ""             
-            record_phone = str(r[2]).strip() if len(r) > 2 else ""            
-            record_category = str(r[3]).strip() if len(r) > 3 else ""         
-            record_status = str(r[8]).strip() if len(r) > 8 else ""           # ← ТЕПЕРЬ БЕЗОПАСНО                          
-
-            # Проверяем что дата записи не прошедшая (только будущие записи)
-            date_cell = r[6] if len(r) > 6 else ""
-            if isinstance(date_cell, datetime):
-                record_date_str = date_cell.strftime("%d.%m.%Y")
-            else:
-                record_date_str = str(date_cell).strip()
-            try:
-                record_date_obj = datetime.strptime(record_date_str, "%d.%m.%Y").date()
-                today_date = datetime.now(TIMEZONE).date()
-                
-                # Пропускаем прошедшие записи
-                if record_date_obj < today_date:
-                    continue  # ← пропускаем эту запись
-            except:
-                pass  # Если ошибка формата даты - проверяем дальше       
-
-            # Тот же телефон в той же категории
-            if (record_phone == phone and 
-                record_category == service_type and 
-                record_status == "подтверждено"):
-                
-                # Проверяем совпадает ли имя
-                if record_name.lower() == name.lower():
-                    # Тот же человек (имя + телефон) в той же категории
-                    repeat_records.append({
-                        "category": record_category,
-                        "service": str(r[4]).strip() if len(r) > 4 else "",
-                        "specialist": str(r[5]).strip() if len(r) > 5 else "",
-                        "date": str(r[6]).strip() if len(r) > 6 else "",
-                        "time": str(r[7]).strip() if len(r) > 7 else "",
-                    })
-                else:
-                    # Разные имена, но один телефон
-                    different_name_same_phone = True
-                    phone_conflict = {
-                        "name": record_name,
-                        "category": record_category,
-                        "service": str(r[4]).strip() if len(r) > 4 else "",
-                        "date": str(r[6]).strip() if len(r) > 6 else "",
-                        "time": str(r[7]).strip() if len(r) > 7 else "",
-                    }
-    
+
+    for rec in await records_repo.by_phone(phone):
+        # Индекс ищет по цифрам телефона, а совпадением считается, как и раньше, та же строка
+        if rec.phone != phone or rec.status != "подтверждено":
+            continue
+        same_person = rec.name.lower() == name.lower()
+
+        # 2. Клиент уже записан на пересекающееся время в этот день
+        if rec.date == date_str:
+            record_start = time_to_minutes(rec.time)
+            if record_start is not None and record_start < new_end and new_start < record_start + calculate_service_step(rec.service):
+                if same_person:
+                    return (
+                        False,
+                        f"❌ У вас уже есть запись на это время:\n"
+                        f"Выберите другое время или специалиста."
+                    )
+                # Разные люди, но один телефон (семья) - РАЗРЕШАЕМ
+                logger.info(f"⚠️ Разные люди используют один телефон: {rec.name} и {name}")
+
+        # 3. Повторная запись в категории (только будущие записи)
+        if rec.category != service_type:
+            continue
+        try:
+            if datetime.strptime(rec.date, "%d.%m.%Y").date() < today_date:
+                continue
+        except ValueError:
+            pass  # Если ошибка формата даты - проверяем дальше
+        if same_person:
+            # Тот же человек (имя + телефон) в той же категории
+            repeat_records.append({
+                "category": rec.category,
+                "service": rec.service,
+                "specialist": rec.specialist,
+                "date": rec.date,
+                "time": rec.time,
+            })
+        else:
+            # Разные имена, но один телефон
+            phone_conflict = {
+                "name": rec.name,
+                "category": rec.category,
+                "service": rec.service,
+                "date": rec.date,
+                "time": rec.time,
+            }
+
     if repeat_records:
         context.user_data["repeat_booking_conflict"] = repeat_records[0]
         return "CONFIRM_REPEAT", None
-    
+
     if phone_conflict:
         context.user_data["phone_conflict"] = phone_conflict
-        return "CONFIRM_PHONE", None  
-             
+        return "CONFIRM_PHONE", None
+
     # Если все проверки пройдены
     return True, None
 
@@ -1157,58 +1000,49 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not org_name_setting:
         org_name_display = "⚠️ Название заведения не задано в настройках"
     else:
-        # Загружаем данные из листа "График специалистов", начиная с A3
-        data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
-        found = False
-        for row in data:
-            # Проверяем, совпадает ли имя специалиста (столбец A) с названием заведения
-            if len(row) > 0 and str(row[0]).strip() == org_name_setting:
-                found = True
-                # --- ОПТИМАЛЬНЫЙ ВАРИАНТ РАСПИСАНИЯ ---
-                # Ожидаем 7 значений: Пн (C), Вт (D), Ср (E), Чт (F), Пт (G), Сб (H), Вс (I)
-                daily_schedules = []
-                day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-                
-                # Читаем расписание из строки
-                for i in range(7):
-                    index = i + 2
-                    if index < len(row):
-                        daily_schedules.append(str(row[index]).strip())
-                    else:
-                        daily_schedules.append("")
+        # Строка заведения (столбец A = название заведения) из индекса графика
+        org_schedule = (await load_schedule_index()).get(org_name_setting)
+        found = org_schedule is not None
+        if found:
+            # --- ОПТИМАЛЬНЫЙ ВАРИАНТ РАСПИСАНИЯ ---
+            # Ожидаем 7 значений: Пн (C), Вт (D), Ср (E), Чт (F), Пт (G), Сб (H), Вс (I)
+            day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+        
+            # Расписание по дням уже разобрано в индексе графика
+            daily_schedules = list(org_schedule.cells)
 
-                # Создаем список строк для вывода
-                schedule_lines = []
+            # Создаем список строк для вывода
+            schedule_lines = []
+        
+            # Просто проходим по всем дням недели
+            for i, schedule in enumerate(daily_schedules):
+                if schedule:  # если не пустое
+                    day_name = day_names[i]
+                    # Добавляем пробелы после запятых
+                    pretty_schedule = schedule.replace(",", ", ")
                 
-                # Просто проходим по всем дням недели
-                for i, schedule in enumerate(daily_schedules):
-                    if schedule:  # если не пустое
-                        day_name = day_names[i]
-                        # Добавляем пробелы после запятых
-                        pretty_schedule = schedule.replace(",", ", ")
-                        
-                        # Фиксированное форматирование для красивого отображения
-                        if day_name == "Пн" and daily_schedules[0:5] == [schedule]*5:
-                            # Все дни Пн-Пт одинаковые - группируем
-                            schedule_lines.append(f"Пн-Пт   {pretty_schedule}")
-                            # Помечаем обработанные дни
-                            daily_schedules[1:5] = [""]*4  # Вт, Ср, Чт, Пт
-                        elif day_name == "Сб":
-                            schedule_lines.append(f"Сб      {pretty_schedule}")
-                        elif day_name == "Вс":
-                            if schedule.lower() == "выходной":
-                                schedule_lines.append(f"Вс      Выходной")
-                            else:
-                                schedule_lines.append(f"Вс      {pretty_schedule}")
+                    # Фиксированное форматирование для красивого отображения
+                    if day_name == "Пн" and daily_schedules[0:5] == [schedule]*5:
+                        # Все дни Пн-Пт одинаковые - группируем
+                        schedule_lines.append(f"Пн-Пт   {pretty_schedule}")
+                        # Помечаем обработанные дни
+                        daily_schedules[1:5] = [""]*4  # Вт, Ср, Чт, Пт
+                    elif day_name == "Сб":
+                        schedule_lines.append(f"Сб      {pretty_schedule}")
+                    elif day_name == "Вс":
+                        if schedule.lower() == "выходной":
+                            schedule_lines.append(f"Вс      Выходной")
                         else:
-                            # Для остальных дней
-                            schedule_lines.append(f"{day_name}     {pretty_schedule}")
+                            schedule_lines.append(f"Вс      {pretty_schedule}")
+                    else:
+                        # Для остальных дней
+                        schedule_lines.append(f"{day_name}     {pretty_schedule}")
 
-                if schedule_lines:
-                    schedule_text = "Мы работаем:\n" + "\n".join(schedule_lines)
-                else:
-                    schedule_text = "График работы не указан."
-                # --- КОНЕЦ ОПТИМАЛЬНОГО ВАРИАНТА ---
+            if schedule_lines:
+                schedule_text = "Мы работаем:\n" + "\n".join(schedule_lines)
+            else:
+                schedule_text = "График работы не указан."
+            # --- КОНЕЦ ОПТИМАЛЬНОГО ВАРИАНТА ---
 
         if not found:
             org_name_display = f"⚠️ Заведение '{org_name_setting}' не найдено в графике."
@@ -1279,6 +1113,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return MENU
 
 
+# Маршруты inline-кнопок заполняет setup_callback_routes() при регистрации обработчиков
+callback_router = CallbackRouter()
+
+
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -1295,37 +1133,23 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     context.user_data["_last_click_time"] = current_time
     # === /ЗАЩИТА ===
-    
-    await update_last_activity(update, context)
-    data = query.data
 
-# === СИГНАЛЬНЫЙ ПРИНТ (для уверенности что функция вызывается) ===
-    # Этот print используем sys.stdout напрямую чтобы обойти логирование
-    import sys
-    sys.stdout.write(f"\n\n{'='*80}\n")
-    sys.stdout.write(f"🚨🚨🚨 button_handler ВЫЗВАН! data='{data}'\n")
-    sys.stdout.write(f"🚨 User ID: {update.effective_user.id}\n")
-    sys.stdout.write(f"{'='*80}\n\n")
-    sys.stdout.flush()  # ← ВАЖНО: принудительно выводим в консоль
-
-    # === ЛОГИРОВАНИЕ (для файла logs/bot.log) ===
-    logger.info("=" * 80)
-    logger.info(f"🎯 НАЖАТА КНОПКА: '{data}'")
-    logger.info(f"🎯 User ID: {update.effective_user.id}")
-    logger.info(f"🎯 Username: {update.effective_user.username}")
-    logger.info(f"🎯 Время: {datetime.now().strftime('%H:%M:%S.%f')}")
-    
-    # ← СПЕЦИАЛЬНО ДЛЯ call_admin_
-    if data.startswith("call_admin_"):
-        logger.info(f"🔥 ОБНАРУЖЕН call_admin_! Номер: {data.split('call_admin_', 1)[1]}")
-    
-    logger.info("=" * 80)
-    
-    logger.info(f"🔄 DEBUG button_handler: Нажата кнопка с data='{data}'")
     logger.info(
-        f"🔄 DEBUG: Текущий state={context.user_data.get('state')}, priority={context.user_data.get('priority')}"
+        f"🎯 Кнопка '{data}' от {update.effective_user.id}: "
+        f"state={context.user_data.get('state')}, priority={context.user_data.get('priority')}"
     )
 
+    # Обработчик выбирается по таблице маршрутов (setup_callback_routes), без цепочки if
+    result = await callback_router.dispatch(update, context, data)
+    if result is NOT_FOUND:
+        await query.edit_message_text("❌ Неизвестная команда.")
+        return MENU
+    return result
+
+
+async def handle_back_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка «Назад»: шаг назад по текущему состоянию."""
+    query = update.callback_query
     back_map = {
         SELECT_SUBSERVICE: select_service_type,
         SHOW_PRICE_INFO: select_subservice,
@@ -1352,696 +1176,586 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         AWAITING_REPEAT_CONFIRMATION: lambda u, c: select_time(u, c),  # ← если нужно
     }
 
-    # ПРОСТАЯ ОТЛАДКА - только в консоль
-    print(f"=== НАЖАТА КНОПКА: {data} ===")
-    print(f"Состояние пользователя: {context.user_data.get('state')}")
-
-    # Если кнопка "back" - логируем подробнее
-    if data == "back":
-        print(f"=== BACK КНОПКА ===")
-        print(f"Текущее состояние: {context.user_data.get('state')}")
-        print(f"Доступные состояния в back_map: {list(back_map.keys())}")
-
-    if data == "back":
-        state = context.user_data.get("state")
-        logger.info(f"DEBUG back: state={state}, back_map keys={list(back_map.keys())}")
-
-        if state in back_map:
-            logger.info(f"DEBUG back: нашли обработчик для состояния {state}")
-            return await back_map[state](update, context)
-
-        elif state in (CONFIRM_RESERVATION, AWAITING_REPEAT_CONFIRMATION):
-            await query.edit_message_text(
-                "❌ Возврат невозможен. Подтвердите или отмените запись."
-            )
-            return
+    state = context.user_data.get("state")
+    logger.info(f"DEBUG back: state={state}, back_map keys={list(back_map.keys())}")
 
-        elif state == AWAITING_ADMIN_SEARCH:
-            return await handle_record_command(update, context)
-        else:
-            await start(update, context)
-            return MENU
+    if state in back_map:
+        logger.info(f"DEBUG back: нашли обработчик для состояния {state}")
+        return await back_map[state](update, context)
 
-    if data.startswith("call_admin_"):
-        phone = data.split("call_admin_", 1)[1]
-        
-        # === СИГНАЛЬНЫЙ ПРИНТ В КОНСОЛЬ ===
-        import sys
-        sys.stdout.write(f"\n\n{'📞'*20}\n")
-        sys.stdout.write(f"📞 ОБРАБОТКА КНОПКИ 'ПОЗВОНИТЬ АДМИНУ'\n")
-        sys.stdout.write(f"📞 Номер админа: {phone}\n")
-        sys.stdout.write(f"📞 User ID: {update.effective_user.id}\n")
-        sys.stdout.write(f"{'📞'*20}\n\n")
-        sys.stdout.flush()
-        
-        # === ЛОГИРОВАНИЕ В ФАЙЛ ===
-        logger.info("📞" * 40)
-        logger.info(f"📞 ОБРАБОТКА КНОПКИ 'ПОЗВОНИТЬ АДМИНУ'")
-        logger.info(f"📞 Номер админа: {phone}")
-        logger.info(f"📞 User ID: {update.effective_user.id}")
-        logger.info(f"📞 Время: {datetime.now().isoformat()}")
-        logger.info("📞" * 40)
-        
-        try:
-            with open("logs/bot.log", "a", encoding="utf-8") as f:
-                f.write(f"{datetime.now().isoformat()} - 📞 ЗВОНОК АДМИНУ: {phone}\n")
-                f.write(f"  User ID: {update.effective_user.id}, Username: {update.effective_user.username}\n")
-        except Exception as e:
-            logger.error(f"Ошибка записи в лог-файл: {e}")
-        
-        # ← ОСНОВНОЙ РАБОЧИЙ КОД (КАК БЫЛО)
-        # Форматируем для отображения (РАБОЧИЙ ФОРМАТ)
-        formatted_phone = f"8{phone[1:4]}-{phone[4:7]}-{phone[7:9]}-{phone[9:11]}" if len(phone) == 11 else phone
-        
-        # Ссылка КАК БЫЛО (РАБОТАЕТ!)
-        call_url = f"tel:{phone}"
-        user_phone = context.user_data.get("phone", "Неизвестно")
-        
-        # === ОТЛАДКА ЗАПИСИ В ТАБЛИЦУ (С ПРИНТАМИ В КОНСОЛЬ) ===
-        sys.stdout.write(f"\n{'='*60}\n")
-        sys.stdout.write(f"📋 ОТЛАДКА ЗАПИСИ В ТАБЛИЦУ:\n")
-        sys.stdout.write(f"   1. Телефон клиента: '{user_phone}'\n")
-        sys.stdout.write(f"   2. Телефон админа: '{phone}'\n")
-        sys.stdout.write(f"   3. User ID: {update.effective_user.id}\n")
-        sys.stdout.write(f"{'='*60}\n\n")
-        sys.stdout.flush()
-        
-        logger.info(f"📋 Отладка записи: клиент='{user_phone}', админ='{phone}'")
-              
-        try:
-            from utils.safe_google import safe_log_missed_call     
-            sys.stdout.write(f"   4. Вызываю safe_log_missed_call('{user_phone}', '{phone}')...\n")
-            sys.stdout.flush()  
-          
-            # === ДОБАВИТЬ ЭТОТ БЛОК ===
-            # Получаем имя из профиля Telegram
-            user_first_name = update.effective_user.first_name or ""
-            user_last_name = update.effective_user.last_name or ""
-            full_name = f"{user_first_name} {user_last_name}".strip()
-            if not full_name:
-                full_name = "Неизвестно"
-            # === КОНЕЦ ДОБАВЛЕНИЯ ===
-            
-            result = safe_log_missed_call(
-                phone_from=user_phone,
-                admin_phone=phone,
-                client_name=full_name,
-                is_message=False
-            )
-            
-            sys.stdout.write(f"   5. Результат: {result}\n")
-            sys.stdout.write(f"   6. Тип: {type(result)}\n")
-            
-            if result is True:
-                sys.stdout.write("   ✅ УСПЕХ: Запись в таблицу прошла!\n")
-            elif result is False:
-                sys.stdout.write("   ❌ НЕУДАЧА: Функция вернула False\n")
-            elif result is None:
-                sys.stdout.write("   ⚠️ ПРЕДУПРЕЖДЕНИЕ: Функция вернула None\n")
-            else:
-                sys.stdout.write(f"   🤔 НЕИЗВЕСТНО: {result}\n")
-            
-            sys.stdout.write(f"{'='*60}\n\n")
-            sys.stdout.flush()
-            
-            logger.info(f"📋 Результат safe_log_missed_call: {result}")
-                
-        except ImportError as e:
-            sys.stdout.write(f"   ❌ ОШИБКА ИМПОРТА: {e}\n")
-            import traceback
-            traceback.print_exc()
-        except Exception as e:
-            sys.stdout.write(f"   ❌ ДРУГАЯ ОШИБКА: {e}\n")
-            import traceback
-            traceback.print_exc()
-        
-        # === ПОКАЗЫВАЕМ СООБЩЕНИЕ ПОЛЬЗОВАТЕЛЮ ===
+    elif state in (CONFIRM_RESERVATION, AWAITING_REPEAT_CONFIRMATION):
         await query.edit_message_text(
-            f"📞 <b>Нажмите на ссылку для звонка:</b>\n\n"
-            f"<a href='{call_url}'>{formatted_phone}</a>\n\n"
-            f"<i>Если администратор не ответит, мы уведомим его о пропущенном звонке.</i>\n\n"
-            f"Или оставьте сообщение:",
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("💬 Написать сообщение", callback_data="contact_admin")],
-                [InlineKeyboardButton("🏠 В меню", callback_data="start")]
-            ])
+            "❌ Возврат невозможен. Подтвердите или отмените запись."
         )
         return
 
-    # --- ОБРАБОТКА КНОПОК НЕЗАВЕРШЕННОЙ ЗАПИСИ ---
-    if data == "continue_booking":
-        print(f"=== continue_booking: продолжаем запись ===")
-        
-        if context.user_data.get("name"):
-            context.user_data["state"] = ENTER_PHONE
-            await query.edit_message_text(
-                "📞 Введите ваш телефон для продолжения:",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Назад", callback_data="back")]
-                ])
-            )
-            return ENTER_PHONE
-        else:
-            context.user_data["state"] = ENTER_NAME
-            await query.edit_message_text(
-                "⏳ Продолжаем запись. Введите ваше имя:",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⬅️ Назад", callback_data="back")]
-                ])
-            )
-            return ENTER_NAME
-
-    if data == "start_new":
-        print(f"=== start_new: очищаем данные для новой записи ===")
-        
-        keys_to_remove = ["date", "time", "selected_specialist", "subservice", 
-                         "service_type", "name", "phone", "temp_booking", "state"]
-        
-        for key in keys_to_remove:
-            context.user_data.pop(key, None)
-        
+    elif state == AWAITING_ADMIN_SEARCH:
+        return await handle_record_command(update, context)
+    else:
         await start(update, context)
         return MENU
-    # --- /ОБРАБОТКА КНОПОК НЕЗАВЕРШЕННОЙ ЗАПИСИ ---    
 
-    if data == "start":
-        await start(update, context)
-        return MENU
 
-    if data == "back_to_records":
-        # Очищаем ВСЕ флаги подтверждения отмены
-        keys_to_remove = []
-        for key in context.user_data.keys():
-            if isinstance(key, str) and key.startswith("confirm_cancel_"):
-                keys_to_remove.append(key)
-    
-        for key in keys_to_remove:
-            context.user_data.pop(key, None)
-    
-        # Возвращаемся к списку записей
-        return await show_my_records_edit(update, context)
+async def handle_call_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, phone: str):
+    query = update.callback_query
 
-    if data == "book":
-        return await select_service_type(update, context)
+    # === СИГНАЛЬНЫЙ ПРИНТ В КОНСОЛЬ ===
+    import sys
+    sys.stdout.write(f"\n\n{'📞'*20}\n")
+    sys.stdout.write(f"📞 ОБРАБОТКА КНОПКИ 'ПОЗВОНИТЬ АДМИНУ'\n")
+    sys.stdout.write(f"📞 Номер админа: {phone}\n")
+    sys.stdout.write(f"📞 User ID: {update.effective_user.id}\n")
+    sys.stdout.write(f"{'📞'*20}\n\n")
+    sys.stdout.flush()
+
+    # === ЛОГИРОВАНИЕ В ФАЙЛ ===
+    logger.info("📞" * 40)
+    logger.info(f"📞 ОБРАБОТКА КНОПКИ 'ПОЗВОНИТЬ АДМИНУ'")
+    logger.info(f"📞 Номер админа: {phone}")
+    logger.info(f"📞 User ID: {update.effective_user.id}")
+    logger.info(f"📞 Время: {datetime.now().isoformat()}")
+    logger.info("📞" * 40)
 
-    if data == "modify":
-        # На случай, если у кого-то сохранена старая кнопка
-        return await show_my_records_edit(update, context)
+    try:
+        with open("logs/bot.log", "a", encoding="utf-8") as f:
+            f.write(f"{datetime.now().isoformat()} - 📞 ЗВОНОК АДМИНУ: {phone}\n")
+            f.write(f"  User ID: {update.effective_user.id}, Username: {update.effective_user.username}\n")
+    except Exception as e:
+        logger.error(f"Ошибка записи в лог-файл: {e}")
 
-    if data == "my_records_view":
-        return await show_my_records_view(update, context)
+    # ← ОСНОВНОЙ РАБОЧИЙ КОД (КАК БЫЛО)
+    # Форматируем для отображения (РАБОЧИЙ ФОРМАТ)
+    formatted_phone = f"8{phone[1:4]}-{phone[4:7]}-{phone[7:9]}-{phone[9:11]}" if len(phone) == 11 else phone
 
-    if data == "my_records_edit":
-        # Очищаем ВСЕ флаги подтверждения отмены
-        keys_to_remove = []
-        for key in context.user_data.keys():
-            if isinstance(key, str) and key.startswith("confirm_cancel_"):
-                keys_to_remove.append(key)
-        
-        for key in keys_to_remove:
-            context.user_data.pop(key, None)
-        
-        return await show_my_records_edit(update, context)
-    if data == "prices":
-        return await show_prices(update, context)
+    # Ссылка КАК БЫЛО (РАБОТАЕТ!)
+    call_url = f"tel:{phone}"
+    user_phone = context.user_data.get("phone", "Неизвестно")
 
-    if data == "contact_admin":
-        kb = [
-            [InlineKeyboardButton("💬 Написать сообщение", callback_data="write_message")],
-            [InlineKeyboardButton("📞 Заказать обратный звонок", callback_data="request_callback")],
-            [InlineKeyboardButton("⬅️ Назад", callback_data="start")],  # ← ДОБАВЛЕНО
-            [InlineKeyboardButton("🏠 В меню", callback_data="start")]
-        ]
-        await query.edit_message_text(
-            "📱 <b>Выберите способ связи:</b>\n\n"
-            "💬 <b>Написать сообщение</b>\n"
-            "   Администратор ответит в Telegram\n\n"
-            "📞 <b>Заказать обратный звонок</b>\n"
-            "   Админ перезвонит на ваш телефон",
-            parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup(kb)
+    # === ОТЛАДКА ЗАПИСИ В ТАБЛИЦУ (С ПРИНТАМИ В КОНСОЛЬ) ===
+    sys.stdout.write(f"\n{'='*60}\n")
+    sys.stdout.write(f"📋 ОТЛАДКА ЗАПИСИ В ТАБЛИЦУ:\n")
+    sys.stdout.write(f"   1. Телефон клиента: '{user_phone}'\n")
+    sys.stdout.write(f"   2. Телефон админа: '{phone}'\n")
+    sys.stdout.write(f"   3. User ID: {update.effective_user.id}\n")
+    sys.stdout.write(f"{'='*60}\n\n")
+    sys.stdout.flush()
+
+    logger.info(f"📋 Отладка записи: клиент='{user_phone}', админ='{phone}'")
+
+    try:
+        from utils.safe_google import safe_log_missed_call     
+        sys.stdout.write(f"   4. Вызываю safe_log_missed_call('{user_phone}', '{phone}')...\n")
+        sys.stdout.flush()  
+
+        # === ДОБАВИТЬ ЭТОТ БЛОК ===
+        # Получаем имя из профиля Telegram
+        user_first_name = update.effective_user.first_name or ""
+        user_last_name = update.effective_user.last_name or ""
+        full_name = f"{user_first_name} {user_last_name}".strip()
+        if not full_name:
+            full_name = "Неизвестно"
+        # === КОНЕЦ ДОБАВЛЕНИЯ ===
+
+        result = await sheets.log_missed_call(
+            phone_from=user_phone,
+            admin_phone=phone,
+            client_name=full_name,
+            is_message=False
         )
-        context.user_data["state"] = AWAITING_CONTACT_CHOICE
-        return
-    
-    if data == "write_message":
-        # Сохраняем, что выбрали "написать сообщение"
-        context.user_data["contact_method"] = "write_message"
+
+        sys.stdout.write(f"   5. Результат: {result}\n")
+        sys.stdout.write(f"   6. Тип: {type(result)}\n")
+
+        if result is True:
+            sys.stdout.write("   ✅ УСПЕХ: Запись в таблицу прошла!\n")
+        elif result is False:
+            sys.stdout.write("   ❌ НЕУДАЧА: Функция вернула False\n")
+        elif result is None:
+            sys.stdout.write("   ⚠️ ПРЕДУПРЕЖДЕНИЕ: Функция вернула None\n")
+        else:
+            sys.stdout.write(f"   🤔 НЕИЗВЕСТНО: {result}\n")
+
+        sys.stdout.write(f"{'='*60}\n\n")
+        sys.stdout.flush()
+
+        logger.info(f"📋 Результат safe_log_missed_call: {result}")
+
+    except ImportError as e:
+        sys.stdout.write(f"   ❌ ОШИБКА ИМПОРТА: {e}\n")
+        import traceback
+        traceback.print_exc()
+    except Exception as e:
+        sys.stdout.write(f"   ❌ ДРУГАЯ ОШИБКА: {e}\n")
+        import traceback
+        traceback.print_exc()
+
+    # === ПОКАЗЫВАЕМ СООБЩЕНИЕ ПОЛЬЗОВАТЕЛЮ ===
+    await query.edit_message_text(
+        f"📞 <b>Нажмите на ссылку для звонка:</b>\n\n"
+        f"<a href='{call_url}'>{formatted_phone}</a>\n\n"
+        f"<i>Если администратор не ответит, мы уведомим его о пропущенном звонке.</i>\n\n"
+        f"Или оставьте сообщение:",
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("💬 Написать сообщение", callback_data="contact_admin")],
+            [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+        ])
+    )
+    return
+
+
+async def handle_continue_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    print(f"=== continue_booking: продолжаем запись ===")
+
+    if context.user_data.get("name"):
+        context.user_data["state"] = ENTER_PHONE
         await query.edit_message_text(
-            "💬 <b>Напишите ваше сообщение:</b>\n\n"
-            "Администратор ответит в Telegram.\n\n"
-            "<i>Вы также можете прикрепить фото или документ.</i>",
-            parse_mode="HTML",
+            "📞 Введите ваш телефон для продолжения:",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Назад", callback_data="contact_admin")],  # ← ДОБАВЛЕНО
-                [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+                [InlineKeyboardButton("⬅️ Назад", callback_data="back")]
             ])
         )
-        context.user_data["state"] = AWAITING_ADMIN_MESSAGE
-        return
-        
-    if data == "request_callback":
+        return ENTER_PHONE
+    else:
+        context.user_data["state"] = ENTER_NAME
         await query.edit_message_text(
-            "📞 <b>Введите ваше имя:</b>\n\n"
-            "Пример: <i>Иван Иванов</i>\n\n"
-            "Имя нужно, чтобы администратор знал, к кому обращаться.",
-            parse_mode="HTML",
+            "⏳ Продолжаем запись. Введите ваше имя:",
             reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("⬅️ Назад", callback_data="contact_admin")],  # ← ДОБАВЛЕНО
-                [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+                [InlineKeyboardButton("⬅️ Назад", callback_data="back")]
             ])
         )
-        context.user_data["state"] = AWAITING_CALLBACK_NAME
+        return ENTER_NAME
+
+
+async def handle_start_new(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    print(f"=== start_new: очищаем данные для новой записи ===")
+
+    keys_to_remove = ["date", "time", "selected_specialist", "subservice", 
+                     "service_type", "name", "phone", "temp_booking", "state"]
+
+    for key in keys_to_remove:
+        context.user_data.pop(key, None)
+
+    await start(update, context)
+    return MENU
+
+
+async def handle_start_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await start(update, context)
+    return MENU
+
+
+async def handle_back_to_records(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Очищаем ВСЕ флаги подтверждения отмены
+    keys_to_remove = []
+    for key in context.user_data.keys():
+        if isinstance(key, str) and key.startswith("confirm_cancel_"):
+            keys_to_remove.append(key)
+
+    for key in keys_to_remove:
+        context.user_data.pop(key, None)
+
+    # Возвращаемся к списку записей
+    return await show_my_records_edit(update, context)
+
+
+async def handle_contact_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    kb = [
+        [InlineKeyboardButton("💬 Написать сообщение", callback_data="write_message")],
+        [InlineKeyboardButton("📞 Заказать обратный звонок", callback_data="request_callback")],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="start")],  # ← ДОБАВЛЕНО
+        [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+    ]
+    await query.edit_message_text(
+        "📱 <b>Выберите способ связи:</b>\n\n"
+        "💬 <b>Написать сообщение</b>\n"
+        "   Администратор ответит в Telegram\n\n"
+        "📞 <b>Заказать обратный звонок</b>\n"
+        "   Админ перезвонит на ваш телефон",
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup(kb)
+    )
+    context.user_data["state"] = AWAITING_CONTACT_CHOICE
+    return
+
+
+async def handle_write_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    # Сохраняем, что выбрали "написать сообщение"
+    context.user_data["contact_method"] = "write_message"
+    await query.edit_message_text(
+        "💬 <b>Напишите ваше сообщение:</b>\n\n"
+        "Администратор ответит в Telegram.\n\n"
+        "<i>Вы также можете прикрепить фото или документ.</i>",
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Назад", callback_data="contact_admin")],  # ← ДОБАВЛЕНО
+            [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+        ])
+    )
+    context.user_data["state"] = AWAITING_ADMIN_MESSAGE
+    return
+
+
+async def handle_request_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text(
+        "📞 <b>Введите ваше имя:</b>\n\n"
+        "Пример: <i>Иван Иванов</i>\n\n"
+        "Имя нужно, чтобы администратор знал, к кому обращаться.",
+        parse_mode="HTML",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("⬅️ Назад", callback_data="contact_admin")],  # ← ДОБАВЛЕНО
+            [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+        ])
+    )
+    context.user_data["state"] = AWAITING_CALLBACK_NAME
+    return
+
+
+async def handle_service_button(update: Update, context: ContextTypes.DEFAULT_TYPE, service_type: str):
+    context.user_data["service_type"] = service_type
+    return await select_subservice(update, context)
+
+
+async def handle_subservice_button(update: Update, context: ContextTypes.DEFAULT_TYPE, subservice: str):
+    context.user_data["subservice"] = subservice
+    return await show_price_info(update, context)
+
+
+async def handle_priority_button(update: Update, context: ContextTypes.DEFAULT_TYPE, priority_choice: str):
+    query = update.callback_query
+    context.user_data["priority"] = priority_choice
+    # Очищаем потенциально старые данные, чтобы не было конфликта между сценариями
+    if priority_choice == "date":
+        # Сценарий A: Сначала дата -> потом специалист
+        # Удаляем возможного специалиста, выбранного ранее (например, при возврате назад в сценарии B)
+        context.user_data.pop("selected_specialist", None)
+        return await select_date(update, context)
+    elif priority_choice == "specialist":
+        # Сценарий B: Сначала специалист -> потом дата
+        # Удаляем возможную дату, выбранную ранее (например, при возврате назад в сценарии A)
+        context.user_data.pop("date", None)
+        # Удаляем возможного специалиста, выбранного ранее (например, при возврате назад)
+        context.user_data.pop("selected_specialist", None)
+        return await select_specialist(update, context)
+    else:
+        # На всякий случай, если придёт неизвестный приоритет
+        logger.warning(f"⚠️ Неизвестный приоритет: {priority_choice}")
+        await query.edit_message_text("❌ Ошибка: неизвестный приоритет.")
         return
 
-    # АДМИНСКИЕ ФУНКЦИИ
-    admin_handlers = {
-        "admin_book_for_client": admin_book_for_client,
-        "admin_manage_record": admin_manage_record,
-        "admin_back": handle_record_command,
-    }
-    if data in admin_handlers:
-        return await admin_handlers[data](update, context)
-    if data.startswith("admin_cancel_"):
-        return await admin_cancel_record(
-            update, context, data.split("admin_cancel_", 1)[1]
-        )
-    if data.startswith("admin_reschedule_"):
-        return await admin_reschedule_record(
-            update, context, data.split("admin_reschedule_", 1)[1]
-        )
-    if data.startswith("admin_manage_"):
-        return await admin_show_record_details(
-            update, context, data.split("admin_manage_", 1)[1]
-        )
-    if data.startswith("admin_new_date_"):
-        return await admin_process_new_date(
-            update, context, data.split("admin_new_date_", 1)[1]
-        )
-    if data.startswith("admin_new_specialist_"):
-        return await admin_process_new_specialist(
-            update, context, data.split("admin_new_specialist_", 1)[1]
-        )
-    if data.startswith("admin_new_slot_"):
-        parts = data.split("admin_new_slot_", 1)[1].split("_", 1)
-        if len(parts) == 2:
-            return await admin_process_new_slot(update, context, parts[0], parts[1])
-    if data in [
-        "admin_change_date",
-        "admin_change_specialist",
-        "admin_change_time",
-        "admin_change_all",
-        "admin_skip_specialist",
-    ]:
-        handler_map = {
-            "admin_change_date": admin_change_date,
-            "admin_change_specialist": admin_change_specialist,
-            "admin_change_time": admin_change_time,
-            "admin_change_all": admin_change_all,
-            "admin_skip_specialist": admin_skip_specialist,
-        }
-        return await handler_map[data](update, context)
-    if data.startswith("admin_confirm_reschedule_"):
-        return await admin_confirm_reschedule(
-            update, context, data.split("admin_confirm_reschedule_", 1)[1]
-        )
-    if data.startswith("admin_force_reschedule_"):
-        return await admin_force_reschedule(
-            update, context, data.split("admin_force_reschedule_", 1)[1]
-        )
-    if data.startswith("service_"):
-        context.user_data["service_type"] = data.split("service_", 1)[1]
-        return await select_subservice(update, context)
-    if data.startswith("subservice_"):
-        context.user_data["subservice"] = data.split("subservice_", 1)[1]
-        return await show_price_info(update, context)
-        # --- ИЗМЕНЕНИЕ button_handler: Поддержка priority_date и priority_specialist ---
-    if data.startswith("priority_"):
-        priority_choice = data.split("priority_", 1)[1]
-        context.user_data["priority"] = priority_choice
-        # Очищаем потенциально старые данные, чтобы не было конфликта между сценариями
-        if priority_choice == "date":
-            # Сценарий A: Сначала дата -> потом специалист
-            # Удаляем возможного специалиста, выбранного ранее (например, при возврате назад в сценарии B)
-            context.user_data.pop("selected_specialist", None)
-            return await select_date(update, context)
-        elif priority_choice == "specialist":
-            # Сценарий B: Сначала специалист -> потом дата
-            # Удаляем возможную дату, выбранную ранее (например, при возврате назад в сценарии A)
-            context.user_data.pop("date", None)
-            # Удаляем возможного специалиста, выбранного ранее (например, при возврате назад)
-            context.user_data.pop("selected_specialist", None)
-            return await select_specialist(update, context)
-        else:
-            # На всякий случай, если придёт неизвестный приоритет
-            logger.warning(f"⚠️ Неизвестный приоритет: {priority_choice}")
-            await query.edit_message_text("❌ Ошибка: неизвестный приоритет.")
-            return
-    # --- /ИЗМЕНЕНИЕ button_handler ---
-    if data.startswith("date_"):
-        context.user_data["date"] = data.split("date_", 1)[1]
-        if context.user_data.get("priority") == "date":
-            # Сценарий A: сначала дата → потом специалист
-            return await select_specialist(update, context)
-        else:
-            # Сценарий B: сначала специалист, потом дата → теперь время
-            return await select_time(update, context)
 
-    print(f"🟢 КНОПКА НАЖАТА: {data}")
+async def handle_date_button(update: Update, context: ContextTypes.DEFAULT_TYPE, date_str: str):
+    context.user_data["date"] = date_str
+    if context.user_data.get("priority") == "date":
+        # Сценарий A: сначала дата → потом специалист
+        return await select_specialist(update, context)
+    else:
+        # Сценарий B: сначала специалист, потом дата → теперь время
+        return await select_time(update, context)
+
+
+async def handle_specialist_button(update: Update, context: ContextTypes.DEFAULT_TYPE, specialist: str):
+    context.user_data["selected_specialist"] = specialist
+    if context.user_data.get("priority") == "specialist":
+        return await select_date(update, context)  # Сценарий B
+    else:
+        return await select_time(update, context)  # Сценарий A
+
+
+async def handle_slot_any(update: Update, context: ContextTypes.DEFAULT_TYPE, time_str: str):
+    query = update.callback_query
+    # Обработка выбора специалиста для "Любой"
+    logger.info(f"🎯 Выбор специалиста для времени: {time_str}")
+
+    # Получаем список свободных специалистов для этого времени
+    date_str = context.user_data.get("date", "")
+    service_type = context.user_data.get("service_type", "")
+    subservice = context.user_data.get("subservice", "")
+
+    # Ищем снова слоты, чтобы получить список специалистов
+    await records_repo.ensure_fresh()
+    slots = await run_blocking(
+        find_available_slots, service_type, subservice, date_str, "любой", context.user_data.get("priority", "date"),
+        owner=update.effective_chat.id,
+    )
+
+    # Находим нужный слот
+    available_specialists = []
+    for slot in slots:
+        if slot.get("time") == time_str and slot.get("is_any_mode", False):
+            available_specialists = slot.get("available_specialists", [])
+            break
+
+    if not available_specialists:
+        await query.edit_message_text("❌ Ошибка: специалисты не найдены.")
+        return
+
+    # Рассчитываем диапазон времени для сообщения
+    time_display = time_str
+    if subservice:
+        try:
+            total_duration = calculate_service_step(subservice)
+            hour = int(time_str.split(':')[0])
+            minute = int(time_str.split(':')[1])
+            end_minutes = hour * 60 + minute + total_duration
+            end_hour = end_minutes // 60
+            end_minute = end_minutes % 60
+            end_time = f"{end_hour:02d}:{end_minute:02d}"
+            time_display = f"{time_str}-{end_time}"
+        except Exception as e:
+            logger.error(f"Ошибка расчета диапазона: {e}")
+
+    # Если только один специалист - показываем его как выбранный
+    if len(available_specialists) == 1:
+        # Показываем подтверждение выбора, а не сразу резервируем
+        kb = [
+            [InlineKeyboardButton(f"✅ Выбрать {available_specialists[0]}", 
+                                 callback_data=f"slot_{available_specialists[0]}_{time_str}")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data="refresh_time")]
+        ]
 
-    if data.startswith("specialist_"):
-        context.user_data["selected_specialist"] = data.split("specialist_", 1)[1]
-        if context.user_data.get("priority") == "specialist":
-            return await select_date(update, context)  # Сценарий B
-        else:
-            return await select_time(update, context)  # Сценарий A
-    
-    if data.startswith("slot_any_"):
-        # Обработка выбора специалиста для "Любой"
-        time_str = data.split("slot_any_", 1)[1]
-        logger.info(f"🎯 Выбор специалиста для времени: {time_str}")
-        
-        # Получаем список свободных специалистов для этого времени
-        date_str = context.user_data.get("date", "")
-        service_type = context.user_data.get("service_type", "")
-        subservice = context.user_data.get("subservice", "")
-        
-        # Ищем снова слоты, чтобы получить список специалистов
-        slots = find_available_slots(
-            service_type, subservice, date_str, "любой", context.user_data.get("priority", "date")
-        )
-        
-        # Находим нужный слот
-        available_specialists = []
-        for slot in slots:
-            if slot.get("time") == time_str and slot.get("is_any_mode", False):
-                available_specialists = slot.get("available_specialists", [])
-                break
-               
-        if not available_specialists:
-            await query.edit_message_text("❌ Ошибка: специалисты не найдены.")
-            return
-        
-        # Рассчитываем диапазон времени для сообщения
-        time_display = time_str
-        if subservice:
-            try:
-                total_duration = calculate_service_step(subservice)
-                hour = int(time_str.split(':')[0])
-                minute = int(time_str.split(':')[1])
-                end_minutes = hour * 60 + minute + total_duration
-                end_hour = end_minutes // 60
-                end_minute = end_minutes % 60
-                end_time = f"{end_hour:02d}:{end_minute:02d}"
-                time_display = f"{time_str}-{end_time}"
-            except Exception as e:
-                logger.error(f"Ошибка расчета диапазона: {e}")
-        
-        # Если только один специалист - показываем его как выбранный
-        if len(available_specialists) == 1:
-            # Показываем подтверждение выбора, а не сразу резервируем
-            kb = [
-                [InlineKeyboardButton(f"✅ Выбрать {available_specialists[0]}", 
-                                     callback_data=f"slot_{available_specialists[0]}_{time_str}")],
-                [InlineKeyboardButton("⬅️ Назад", callback_data="refresh_time")]
-            ]
-            
-            await query.edit_message_text(
-                f"⏰ Время: {time_display}\n\n"
-                f"👩‍💼 Доступен только один специалист:\n"
-                f"<b>{available_specialists[0]}</b>\n\n"
-                f"Нажмите кнопку для выбора:",
-                reply_markup=InlineKeyboardMarkup(kb),
-                parse_mode="HTML"
-            )
-            return
-        
-        # Показываем выбор между несколькими специалистами
-        kb = []
-        for spec in available_specialists:
-            kb.append([InlineKeyboardButton(f"👩‍💼 {spec}", callback_data=f"slot_{spec}_{time_str}")])
-        
-        kb.append([InlineKeyboardButton("⬅️ Назад", callback_data="refresh_time")])
-        
         await query.edit_message_text(
             f"⏰ Время: {time_display}\n\n"
-            f"Выберите специалиста:",
-            reply_markup=InlineKeyboardMarkup(kb)
+            f"👩‍💼 Доступен только один специалист:\n"
+            f"<b>{available_specialists[0]}</b>\n\n"
+            f"Нажмите кнопку для выбора:",
+            reply_markup=InlineKeyboardMarkup(kb),
+            parse_mode="HTML"
         )
         return
-    
-    if data.startswith("slot_"):
-        # Обычный слот (уже выбран специалист)
-        parts = data.split("_", 2)
-        if len(parts) == 3:
-            return await reserve_slot(update, context, parts[1], parts[2])
-        else:
-            await query.edit_message_text("❌ Неверный формат слота.")
-            return
-       
-    if data.startswith("confirm_reminder_"):
-        await handle_confirm_reminder(
-            data.split("confirm_reminder_", 1)[1], query, context
-        )
+
+    # Показываем выбор между несколькими специалистами
+    kb = []
+    for spec in available_specialists:
+        kb.append([InlineKeyboardButton(f"👩‍💼 {spec}", callback_data=f"slot_{spec}_{time_str}")])
+
+    kb.append([InlineKeyboardButton("⬅️ Назад", callback_data="refresh_time")])
+
+    await query.edit_message_text(
+        f"⏰ Время: {time_display}\n\n"
+        f"Выберите специалиста:",
+        reply_markup=InlineKeyboardMarkup(kb)
+    )
+    return
+
+
+async def handle_confirm_reminder_button(update: Update, context: ContextTypes.DEFAULT_TYPE, record_id: str):
+    await handle_confirm_reminder(record_id, update.callback_query, context)
+
+
+async def handle_cancel_reminder_button(update: Update, context: ContextTypes.DEFAULT_TYPE, record_id: str):
+    await handle_cancel_reminder(record_id, update.callback_query, context)
+
+
+async def handle_modify_record(update: Update, context: ContextTypes.DEFAULT_TYPE, record_id: str):
+    query = update.callback_query
+    await query.answer()
+
+    # Сохраняем ID записи для изменения
+    context.user_data["modify_record_id"] = record_id
+    context.user_data["modify_mode"] = True
+
+    # Показываем что изменение работает как новая запись
+    await query.edit_message_text(
+        f"✏️ <b>Изменение записи #{record_id}</b>\n\n"
+        f"Вы можете изменить дату, время или специалиста.\n\n"
+        f"<i>Внимание: старая запись будет отменена автоматически.</i>",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("✅ Начать изменение", callback_data="start_modification")],
+            [InlineKeyboardButton("⬅️ Назад", callback_data=f"record_details_{record_id}")]
+        ]),
+        parse_mode="HTML"
+    )
+    return
+
+
+async def handle_start_modification(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    # Получаем ID записи для изменения
+    record_id = context.user_data.get("modify_record_id")
+    if not record_id:
+        await query.answer("❌ Ошибка: не найдена запись для изменения")
         return
-    if data.startswith("cancel_reminder_"):
-        await handle_cancel_reminder(
-            data.split("cancel_reminder_", 1)[1], query, context
-        )
+
+    # === ОТМЕНЯЕМ ВСЕ ТАЙМЕРЫ ===
+    chat_id = update.effective_chat.id
+    job_names = [f"reservation_timeout_{chat_id}", f"reservation_warn_{chat_id}"]
+    for job_name in job_names:
+        current_jobs = context.job_queue.get_jobs_by_name(job_name)
+        for job in current_jobs:
+            job.schedule_removal()
+    logger.info(f"⏰ Отменены таймеры для изменения записи {record_id}")
+
+    # Находим запись (только со статусом "подтверждено" и самую последнюю по дате создания)
+    records = await records_repo.by_id(record_id)
+    target_record = None
+    latest_date = None
+
+    for r in records:
+        if (len(r) > 8 and 
+            str(r[0]).strip() == record_id and 
+            str(r[8]).strip() == "подтверждено"):
+
+            # Берем дату создания записи
+            record_date_str = str(r[9]).strip() if len(r) > 9 else ""
+
+            # Если это первая найденная или дата создания позже
+            if not target_record or (record_date_str > latest_date if latest_date else True):
+                target_record = r
+                latest_date = record_date_str
+
+    # Если не нашли "подтверждено", ищем любую с этим ID
+    if not target_record:
+        for r in records:
+            if len(r) > 8 and str(r[0]).strip() == record_id:
+                target_record = r
+                break
+
+    if not target_record:
+        await query.answer("❌ Запись не найдена")
         return
-    if data.startswith("cancel_record_"):
-        return await cancel_record_from_list(
-            update, context, data.split("cancel_record_", 1)[1]
-        )
 
-    # ← ДОБАВИТЬ ЭТОТ БЛОК ДЛЯ ДВУХУРОВНЕВОГО МЕНЮ
-    if data.startswith("record_details_"):
-        record_id = data.split("record_details_", 1)[1]
-        return await show_record_details(update, context, record_id)
+    # Сохраняем данные для авто-заполнения
+    context.user_data["name"] = str(target_record[1]).strip() if len(target_record) > 1 else ""
+    context.user_data["phone"] = str(target_record[2]).strip() if len(target_record) > 2 else ""
+    context.user_data["service_type"] = str(target_record[3]).strip() if len(target_record) > 3 else ""
+    context.user_data["subservice"] = str(target_record[4]).strip() if len(target_record) > 4 else ""
+    context.user_data["selected_specialist"] = str(target_record[5]).strip() if len(target_record) > 5 else ""
+
+    # ← ДОБАВЬТЕ ДЛЯ ОТЛАДКИ
+    print(f"=== DEBUG start_modification ===")
+    print(f"Сохранён специалист: '{context.user_data['selected_specialist']}'")
+    print(f"Из колонки: '{target_record[5]}'")
+    print(f"Тип: {type(target_record[5])}")
+    print(f"Длина записи: {len(target_record)}")
+    print(f"=== КОНЕЦ ОТЛАДКИ ===")
+
+    logger.info(f"🔍 DEBUG: Сохранён специалист: '{context.user_data['selected_specialist']}' из колонки {target_record[5]}")
+
+    # Помечаем старую запись как "изменяется"
+    context.user_data["old_record_id"] = record_id
+    context.user_data["modify_mode"] = True
+
+    # Сохраняем дату и время СТАРОЙ записи для правильного поиска
+    old_date = str(target_record[6]).strip() if len(target_record) > 6 else ""
+    old_time = str(target_record[7]).strip() if len(target_record) > 7 else ""
+    context.user_data["modify_old_date"] = old_date
+    context.user_data["modify_old_time"] = old_time
+
+    logger.info(f"📋 Сохранены данные старой записи: {old_date} {old_time}")
+
+    # Очищаем выбранные дату/время/специалиста для нового выбора
+    context.user_data.pop("date", None)
+    context.user_data.pop("time", None)
+    context.user_data.pop("actual_specialist", None)
+
+    logger.info(f"📋 Сохранены данные старой записи: {old_date} {old_time}")
+
+    # Очищаем выбранные дату/время/специалиста для нового выбора
+    context.user_data.pop("date", None)
+    context.user_data.pop("time", None)
+    context.user_data.pop("actual_specialist", None)
+
+    # Начинаем новую запись - сразу переходим к выбору даты
+    context.user_data["state"] = SELECT_DATE
+
+    # Сразу вызываем select_date для изменения
+    return await select_date(update, context)
+
 
-    # ← ДОБАВИТЬ ЭТОТ БЛОК ДЛЯ КНОПКИ "ИЗМЕНИТЬ"
-    if data.startswith("modify_record_"):
-        record_id = data.split("modify_record_", 1)[1]
-        await query.answer()
-        
-        # Сохраняем ID записи для изменения
-        context.user_data["modify_record_id"] = record_id
-        context.user_data["modify_mode"] = True
-        
-        # Показываем что изменение работает как новая запись
-        await query.edit_message_text(
-            f"✏️ <b>Изменение записи #{record_id}</b>\n\n"
-            f"Вы можете изменить дату, время или специалиста.\n\n"
-            f"<i>Внимание: старая запись будет отменена автоматически.</i>",
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("✅ Начать изменение", callback_data="start_modification")],
-                [InlineKeyboardButton("⬅️ Назад", callback_data=f"record_details_{record_id}")]
-            ]),
-            parse_mode="HTML"
-        )
-        return
+async def handle_modify_select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Это изменение записи - начинаем с выбора даты
+    # Данные уже сохранены в context.user_data
 
-    if data == "start_modification":
-        # Получаем ID записи для изменения
-        record_id = context.user_data.get("modify_record_id")
-        if not record_id:
-            await query.answer("❌ Ошибка: не найдена запись для изменения")
-            return
-        
-        # === ОТМЕНЯЕМ ВСЕ ТАЙМЕРЫ ===
-        chat_id = update.effective_chat.id
-        job_names = [f"reservation_timeout_{chat_id}", f"reservation_warn_{chat_id}"]
-        for job_name in job_names:
-            current_jobs = context.job_queue.get_jobs_by_name(job_name)
-            for job in current_jobs:
-                job.schedule_removal()
-        logger.info(f"⏰ Отменены таймеры для изменения записи {record_id}")
+    # Устанавливаем флаг изменения
+    context.user_data["modify_mode"] = True
+    context.user_data["state"] = SELECT_DATE
 
-        # Находим запись (только со статусом "подтверждено" и самую последнюю по дате создания)
-        records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-        target_record = None
-        latest_date = None
-        
-        for r in records:
-            if (len(r) > 8 and 
-                str(r[0]).strip() == record_id and 
-                str(r[8]).strip() == "подтверждено"):
-                
-                # Берем дату создания записи
-                record_date_str = str(r[9]).strip() if len(r) > 9 else ""
-                
-                # Если это первая найденная или дата создания позже
-                if not target_record or (record_date_str > latest_date if latest_date else True):
-                    target_record = r
-                    latest_date = record_date_str
-        
-        # Если не нашли "подтверждено", ищем любую с этим ID
-        if not target_record:
-            for r in records:
-                if len(r) > 8 and str(r[0]).strip() == record_id:
-                    target_record = r
-                    break
-        
-        if not target_record:
-            await query.answer("❌ Запись не найдена")
-            return
-        
-        # Сохраняем данные для авто-заполнения
-        context.user_data["name"] = str(target_record[1]).strip() if len(target_record) > 1 else ""
-        context.user_data["phone"] = str(target_record[2]).strip() if len(target_record) > 2 else ""
-        context.user_data["service_type"] = str(target_record[3]).strip() if len(target_record) > 3 else ""
-        context.user_data["subservice"] = str(target_record[4]).strip() if len(target_record) > 4 else ""
-        context.user_data["selected_specialist"] = str(target_record[5]).strip() if len(target_record) > 5 else ""
-
-        # ← ДОБАВЬТЕ ДЛЯ ОТЛАДКИ
-        print(f"=== DEBUG start_modification ===")
-        print(f"Сохранён специалист: '{context.user_data['selected_specialist']}'")
-        print(f"Из колонки: '{target_record[5]}'")
-        print(f"Тип: {type(target_record[5])}")
-        print(f"Длина записи: {len(target_record)}")
-        print(f"=== КОНЕЦ ОТЛАДКИ ===")
-         
-        logger.info(f"🔍 DEBUG: Сохранён специалист: '{context.user_data['selected_specialist']}' из колонки {target_record[5]}")
-
-        # Помечаем старую запись как "изменяется"
-        context.user_data["old_record_id"] = record_id
-        context.user_data["modify_mode"] = True
-        
-        # Сохраняем дату и время СТАРОЙ записи для правильного поиска
-        old_date = str(target_record[6]).strip() if len(target_record) > 6 else ""
-        old_time = str(target_record[7]).strip() if len(target_record) > 7 else ""
-        context.user_data["modify_old_date"] = old_date
-        context.user_data["modify_old_time"] = old_time
-        
-        logger.info(f"📋 Сохранены данные старой записи: {old_date} {old_time}")
-        
-        # Очищаем выбранные дату/время/специалиста для нового выбора
-        context.user_data.pop("date", None)
-        context.user_data.pop("time", None)
-        context.user_data.pop("actual_specialist", None)
-        
-        logger.info(f"📋 Сохранены данные старой записи: {old_date} {old_time}")
+    # Сразу переходим к выбору даты
+    return await select_date(update, context)
 
-        # Очищаем выбранные дату/время/специалиста для нового выбора
-        context.user_data.pop("date", None)
-        context.user_data.pop("time", None)
-        context.user_data.pop("actual_specialist", None)
-        
-        # Начинаем новую запись - сразу переходим к выбору даты
-        context.user_data["state"] = SELECT_DATE
-        
-        # Сразу вызываем select_date для изменения
-        return await select_date(update, context)
 
-    if data == "modify_select_date":
-        # Это изменение записи - начинаем с выбора даты
-        # Данные уже сохранены в context.user_data
-        
-        # Устанавливаем флаг изменения
-        context.user_data["modify_mode"] = True
-        context.user_data["state"] = SELECT_DATE
-        
-        # Сразу переходим к выбору даты
-        return await select_date(update, context)
+async def handle_back_to_date_select(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Возвращаемся именно к выбору даты, игнорируя back_map
+    print(f"=== back_to_date_select: принудительный возврат к выбору даты ===")
+    # Очищаем время чтобы не было конфликта
+    context.user_data.pop("time", None)
+    return await select_date(update, context)
 
-    # ← ДОБАВИТЬ ЭТОТ БЛОК (подтверждение отмены)
-    if data.startswith("cancel_confirm_"):
-        record_id = data.split("cancel_confirm_", 1)[1]
-        # Просто вызываем функцию отмены - флаг уже установлен в cancel_record_from_list
-        return await cancel_record_from_list(update, context, record_id)  
 
-    if data == "confirm_booking":
-        print(
-            f"=== DEBUG button_handler: confirm_booking вызван (первый обработчик) ==="
-        )
-        return await confirm_booking(update, context)
+async def handle_confirm_phone_yes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    await query.message.edit_reply_markup(reply_markup=None)
+    return await finalize_booking(update, context)
 
-    if data == "cancel_booking":
-        return await cancel_reservation(update, context)
-    if data == "confirm_repeat":
-        return await finalize_booking(update, context)
-    if data == "refresh_time":
-        return await select_time(update, context)
-    if data == "back_to_date_select":
-        # Возвращаемся именно к выбору даты, игнорируя back_map
-        print(f"=== back_to_date_select: принудительный возврат к выбору даты ===")
-        # Очищаем время чтобы не было конфликта
-        context.user_data.pop("time", None)
-        return await select_date(update, context)
-    if data == "confirm_phone_yes":
-        await query.answer()
-        await query.message.edit_reply_markup(reply_markup=None)
-        return await finalize_booking(update, context)
-    if data == "confirm_phone_no":
-        await query.edit_message_text("📞 Пожалуйста, введите другой номер телефона:")
-        context.user_data["state"] = ENTER_PHONE
-        return ENTER_PHONE
-    if data == "back_to_specialist":
-        # Возвращаемся к выбору специалиста
-        return await select_specialist(update, context)
-    
 
-    # --- УМНЫЙ ВХОД В ЛИСТ ОЖИДАНИЯ (Вариант 1) ---
-    if data == "waiting_list":
-        # ПРОВЕРКА: Есть ли телефон у пользователя?
-        if not context.user_data.get("phone"):
-            # Нет телефона - запрашиваем
-            kb = [
-                [InlineKeyboardButton("⬅️ Назад", callback_data="back")],
-                [InlineKeyboardButton("🏠 В меню", callback_data="start")]
-            ]
-            await query.edit_message_text(
-                "📞 <b>Для добавления в лист ожидания нужен ваш телефон.</b>\n\n"
-                "Пожалуйста, введите номер телефона (10-15 цифр):\n"
-                "Пример: <code>89161234567</code>",
-                parse_mode="HTML",
-                reply_markup=InlineKeyboardMarkup(kb)
-            )
-            context.user_data["state"] = AWAITING_PHONE_FOR_WAITING_LIST
-            return AWAITING_PHONE_FOR_WAITING_LIST
-    
-        # Телефон есть - показываем выбор специалиста
-        st = context.user_data.get("service_type", "не указана")
-        ss = context.user_data.get("subservice", "не указана")
-        spec = context.user_data.get("selected_specialist", "любой")
-        date = context.user_data.get("date", "не указана")
-        user_time = context.user_data.get("time", "не указано")
-
-        msg = (
-            "📋 Вы в листе ожидания.\n\n"
-            f"✅ Услуга: <b>{ss}</b> ({st})\n"
-            f"📅 Дата: <b>{date}</b>\n"
-            f"⏰ Время: <b>{user_time}</b> (проверим ±30 мин)\n"
-            f"👩‍🦰 Предпочтение: <b>{spec}</b>\n\n"
-            "👉 Выберите, кого ждать:"
-        )
+async def handle_confirm_phone_no(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.edit_message_text("📞 Пожалуйста, введите другой номер телефона:")
+    context.user_data["state"] = ENTER_PHONE
+    return ENTER_PHONE
+
+
+async def handle_waiting_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    # ПРОВЕРКА: Есть ли телефон у пользователя?
+    if not context.user_data.get("phone"):
+        # Нет телефона - запрашиваем
         kb = [
-            [
-                InlineKeyboardButton(
-                    f"🧑‍🦰 Только {spec}", callback_data="wl_prefer_specific"
-                )
-            ],
-            [InlineKeyboardButton("👥 Любой", callback_data="wl_prefer_any")],
-            # ← в select_time
             [InlineKeyboardButton("⬅️ Назад", callback_data="back")],
-            # ← в /start
+            [InlineKeyboardButton("🏠 В меню", callback_data="start")]
         ]
         await query.edit_message_text(
-            msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode="HTML"
+            "📞 <b>Для добавления в лист ожидания нужен ваш телефон.</b>\n\n"
+            "Пожалуйста, введите номер телефона (10-15 цифр):\n"
+            "Пример: <code>89161234567</code>",
+            parse_mode="HTML",
+            reply_markup=InlineKeyboardMarkup(kb)
         )
-        context.user_data["state"] = AWAITING_WL_PRIORITY_CHOICE
-        return AWAITING_WL_PRIORITY_CHOICE
-    # --- /УМНЫЙ ВХОД В ЛИСТ ОЖИДАНИЯ ---
-
-    # --- ОБРАБОТКА выбора в листе ожидания ---
-    if data == "wl_prefer_specific":
-        specialist = context.user_data.get("selected_specialist", "любой")
-    elif data == "wl_prefer_any":
-        specialist = "любой"
-    else:
-        return  # неизвестная команда
+        context.user_data["state"] = AWAITING_PHONE_FOR_WAITING_LIST
+        return AWAITING_PHONE_FOR_WAITING_LIST
+
+    # Телефон есть - показываем выбор специалиста
+    st = context.user_data.get("service_type", "не указана")
+    ss = context.user_data.get("subservice", "не указана")
+    spec = context.user_data.get("selected_specialist", "любой")
+    date = context.user_data.get("date", "не указана")
+    user_time = context.user_data.get("time", "не указано")
+
+    msg = (
+        "📋 Вы в листе ожидания.\n\n"
+        f"✅ Услуга: <b>{ss}</b> ({st})\n"
+        f"📅 Дата: <b>{date}</b>\n"
+        f"⏰ Время: <b>{user_time}</b> (проверим ±30 мин)\n"
+        f"👩‍🦰 Предпочтение: <b>{spec}</b>\n\n"
+        "👉 Выберите, кого ждать:"
+    )
+    kb = [
+        [
+            InlineKeyboardButton(
+                f"🧑‍🦰 Только {spec}", callback_data="wl_prefer_specific"
+            )
+        ],
+        [InlineKeyboardButton("👥 Любой", callback_data="wl_prefer_any")],
+        # ← в select_time
+        [InlineKeyboardButton("⬅️ Назад", callback_data="back")],
+        # ← в /start
+    ]
+    await query.edit_message_text(
+        msg, reply_markup=InlineKeyboardMarkup(kb), parse_mode="HTML"
+    )
+    context.user_data["state"] = AWAITING_WL_PRIORITY_CHOICE
+    return AWAITING_WL_PRIORITY_CHOICE
 
+
+async def handle_waiting_list_choice(update: Update, context: ContextTypes.DEFAULT_TYPE, specialist: str):
+    """Запись в лист ожидания с выбранным предпочтением по специалисту."""
+    query = update.callback_query
     # Сохраняем запись в лист ожидания
     entry = [
         f"WAIT-{int(time.time())}",
@@ -2058,7 +1772,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         str(update.effective_chat.id),
     ]
 
-    success = safe_append_to_sheet(SHEET_ID, "Лист ожидания!A3:L", [entry])
+    success = await sheets.append("Лист ожидания!A3:L", [entry])
     if not success:
         logger.error("❌ safe_append_to_sheet вернул False")
         await query.edit_message_text("❌ Ошибка. Попробуйте позже.")
@@ -2083,13 +1797,87 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["state"] = AWAITING_WAITING_LIST_DETAILS
     return AWAITING_WAITING_LIST_DETAILS
 
-    if data == "cancel_booking":
-        await query.edit_message_text("❌ Запись отменена.")
-        context.user_data.clear()
-        return MENU
 
-    await query.edit_message_text("❌ Неизвестная команда.")
-    return MENU
+def setup_callback_routes():
+    """
+    Таблица маршрутов button_handler. Точные кнопки ищутся в словаре, префиксные —
+    по дереву префиксов (длинный префикс важнее: slot_any_ раньше slot_).
+    """
+    r = callback_router
+
+    # Меню и навигация
+    r.add_exact("start", handle_start_button)
+    r.add_exact("back", handle_back_button)
+    r.add_exact("continue_booking", handle_continue_booking)
+    r.add_exact("start_new", handle_start_new)
+    r.add_exact("book", select_service_type)
+    r.add_exact("prices", show_prices)
+    r.add_exact("modify", show_my_records_edit)  # На случай, если у кого-то сохранена старая кнопка
+    r.add_exact("my_records_view", show_my_records_view)
+    r.add_exact("my_records_edit", handle_back_to_records)
+    r.add_exact("back_to_records", handle_back_to_records)
+
+    # Связь с администратором
+    r.add_prefix("call_admin_", handle_call_admin, params=("phone",))
+    r.add_exact("contact_admin", handle_contact_admin)
+    r.add_exact("write_message", handle_write_message)
+    r.add_exact("request_callback", handle_request_callback)
+
+    # Админские функции
+    r.add_exact("admin_book_for_client", admin_book_for_client)
+    r.add_exact("admin_manage_record", admin_manage_record)
+    r.add_exact("admin_back", handle_record_command)
+    r.add_exact("admin_change_date", admin_change_date)
+    r.add_exact("admin_change_specialist", admin_change_specialist)
+    r.add_exact("admin_change_time", admin_change_time)
+    r.add_exact("admin_change_all", admin_change_all)
+    r.add_exact("admin_skip_specialist", admin_skip_specialist)
+    r.add_prefix("admin_cancel_", admin_cancel_record, params=("record_id",))
+    r.add_prefix("admin_reschedule_", admin_reschedule_record, params=("record_id",))
+    r.add_prefix("admin_manage_", admin_show_record_details, params=("record_id",))
+    r.add_prefix("admin_new_date_", admin_process_new_date, params=("date",))
+    r.add_prefix("admin_new_specialist_", admin_process_new_specialist, params=("specialist",))
+    r.add_prefix("admin_new_slot_", admin_process_new_slot, params=("specialist", "time"))
+    r.add_prefix("admin_confirm_reschedule_", admin_confirm_reschedule, params=("record_id",))
+    r.add_prefix("admin_force_reschedule_", admin_force_reschedule, params=("record_id",))
+
+    # Запись: услуга → приоритет → дата/специалист → время
+    r.add_prefix("service_", handle_service_button, params=("service_type",))
+    r.add_prefix("subservice_", handle_subservice_button, params=("subservice",))
+    r.add_prefix("priority_", handle_priority_button, params=("priority",))
+    r.add_prefix("date_", handle_date_button, params=("date",))
+    r.add_prefix("specialist_", handle_specialist_button, params=("specialist",))
+    r.add_prefix("slot_any_", handle_slot_any, params=("time",))
+    r.add_prefix("slot_", reserve_slot, params=("specialist", "time"), invalid_text="❌ Неверный формат слота.")
+    r.add_exact("refresh_time", select_time)
+    r.add_exact("back_to_date_select", handle_back_to_date_select)
+    r.add_exact("back_to_specialist", select_specialist)
+
+    # Подтверждение и отмена брони
+    r.add_exact("confirm_booking", confirm_booking)
+    r.add_exact("cancel_booking", cancel_reservation)
+    r.add_exact("confirm_repeat", finalize_booking)
+    r.add_exact("confirm_phone_yes", handle_confirm_phone_yes)
+    r.add_exact("confirm_phone_no", handle_confirm_phone_no)
+
+    # Напоминания и мои записи
+    r.add_prefix("confirm_reminder_", handle_confirm_reminder_button, params=("record_id",))
+    r.add_prefix("cancel_reminder_", handle_cancel_reminder_button, params=("record_id",))
+    r.add_prefix("cancel_record_", cancel_record_from_list, params=("record_id",))
+    r.add_prefix("cancel_confirm_", cancel_record_from_list, params=("record_id",))
+    r.add_prefix("record_details_", show_record_details, params=("record_id",))
+    r.add_prefix("modify_record_", handle_modify_record, params=("record_id",))
+    r.add_exact("start_modification", handle_start_modification)
+    r.add_exact("modify_select_date", handle_modify_select_date)
+
+    # Лист ожидания
+    r.add_exact("waiting_list", handle_waiting_list)
+    r.add_exact(
+        "wl_prefer_specific",
+        lambda u, c: handle_waiting_list_choice(u, c, c.user_data.get("selected_specialist", "любой")),
+    )
+    r.add_exact("wl_prefer_any", lambda u, c: handle_waiting_list_choice(u, c, "любой"))
+
 
 
 # --- PRICES ---
@@ -2097,30 +1885,25 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_prices(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    services = safe_get_sheet_data(SHEET_ID, "Услуги!A3:G") or []
+    catalog = await load_service_catalog()
     text = "💅 УСЛУГИ И ЦЕНЫ\n\n"
     current_cat = None
-    for row in services:
+    for service in catalog.entries:
         # Проверяем что есть хотя бы 6 основных колонок
-        if len(row) < 6:
+        if len(service.row) < 6:
             continue
 
-        cat = row[0]
-        name = row[1]
-        dur_str = row[2]
-        buf_str = row[3]
-        # step = row[4]  # ← Шаг (не используем)
-        price = row[5]
-        desc = row[6] if len(row) > 6 else ""  # Описание может отсутствовать
+        cat = service.category
+        name = service.name
+        price = service.price
+        desc = service.description  # Описание может отсутствовать
 
-        try:
-            dur = int(dur_str)
-            buf = int(buf_str)
-        except Exception:
+        if not service.valid:
             logger.warning(
-                f"⚠️ Неверный формат длительности/буфера в услуге {name}: {dur_str}, {buf_str}"
+                f"⚠️ Неверный формат длительности/буфера в услуге {name}: {service.row[2]}, {service.row[3]}"
             )
             continue
+        dur, buf = service.duration, service.buffer
         if cat != current_cat:
             if current_cat is not None:
                 text += "\n"
@@ -2129,7 +1912,7 @@ async def show_prices(update: Update, context: ContextTypes.DEFAULT_TYPE):
         fmt_dur = format_duration(dur + buf)
         price_str = safe_parse_price(price)
         text += f"• <b>{name}</b> — {price_str} (длит.: {fmt_dur})\n"
-        if desc and desc.strip():  # Если есть описание и оно не пустое
+        if desc:  # Если есть описание и оно не пустое
             text += f" <i>{desc}</i>\n"
     await query.edit_message_text(text or "❌ Услуги не найдены.", parse_mode="HTML")
     try:
@@ -2146,8 +1929,7 @@ async def show_prices(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def select_service_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    services = safe_get_sheet_data(SHEET_ID, "Услуги!A3:A") or []
-    types = list({row[0] for row in services if row and len(row) > 0})
+    types = (await load_service_catalog()).categories()
     kb = [[InlineKeyboardButton(t, callback_data=f"service_{t}")] for t in types]
     kb.append([InlineKeyboardButton("⬅️ Назад", callback_data="back")])
     await update.callback_query.edit_message_text(
@@ -2166,8 +1948,7 @@ async def select_subservice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not st:
         await query.edit_message_text("❌ Ошибка: тип услуги не выбран.")
         return
-    all_services = safe_get_sheet_data(SHEET_ID, "Услуги!A3:G") or []
-    subs = [row[1] for row in all_services if len(row) > 1 and row[0] == st]
+    subs = [service.name for service in (await load_service_catalog()).in_category(st)]
     kb = [[InlineKeyboardButton(s, callback_data=f"subservice_{s}")] for s in subs]
     kb.append([InlineKeyboardButton("⬅️ Назад", callback_data="back")])
     await query.edit_message_text(
@@ -2188,34 +1969,21 @@ async def show_price_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     # --- НОВАЯ ЛОГИКА ПОКАЗА ОПИСАНИЯ И ФОРМИРОВАНИЯ ТЕКСТА ---
     # --- НАЧАЛО ИСПРАВЛЕННОГО БЛОКА show_price_info ---
-    all_services = safe_get_sheet_data(SHEET_ID, "Услуги!A3:G") or []
     dur, buf, price = 60, 0, "не указана"
     description = ""  # Инициализируем описание как пустую строку
 
-    # Проходим по таблице "Услуги", чтобы найти данные для выбранной подуслуги (ss)
-    for row in all_services:
-        # Проверяем, совпадает ли название услуги в текущей строке (row[1]) с выбранной (ss)
-        if len(row) > 1 and row[1] == ss:
-            # Нашли строку с нужной услугой, пробуем извлечь длительность и буфер
-            try:
-                dur = int(row[2])  # row[2] - колонка "Длительность"
-                buf = int(row[3])  # row[3] - колонка "Буфер"
-            except (ValueError, TypeError):
-                # Если не получилось преобразовать в число, логируем и используем значения по умолчанию
-                logger.warning(
-                    f"⚠️ Неверный формат длительности/буфера в услуге {ss}: {row[2]}, {row[3]}"
-                )
-                # Значения dur и buf остаются как есть (по умолчанию 60, 0)
-            # Получаем цену из колонки "Цена" (row[5]), если колонка существует
-            price = row[5] if len(row) > 5 else "не указана"
-            # --- ПОЛУЧАЕМ ОПИСАНИЕ ИЗ НАЙДЕННОЙ СТРОКИ row ---
-            # Проверяем, есть ли колонка "Описание" (row[6]) в строке
-            if len(row) > 6:  # Если индекс 6 существует (колонка G - Описание)
-                # Берём значение и убираем лишние пробелы
-                description = row[6].strip()
-            # --- /ПОЛУЧАЕМ ОПИСАНИЕ ---
-            # Выходим из цикла, так как нужная строка найдена
-            break
+    # Данные выбранной подуслуги (ss) — из каталога услуг
+    service = (await load_service_catalog()).get(ss)
+    if service:
+        if service.valid:
+            dur, buf = service.duration, service.buffer
+        else:
+            # Значения dur и buf остаются как есть (по умолчанию 60, 0)
+            logger.warning(
+                f"⚠️ Неверный формат длительности/буфера в услуге {ss}: {service.row[2:4]}"
+            )
+        price = service.price or "не указана"
+        description = service.description
 
     # --- ФОРМИРУЕМ ТЕКСТ СООБЩЕНИЯ ПОСЛЕ ТОГО, КАК ВСЁ НАШЛИ ---
     # Вычисляем общую длительность (с буфером)
@@ -2291,30 +2059,21 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Загружаем график специалистов и услуги
-    schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
-    all_services = safe_get_sheet_data(SHEET_ID, "Услуги!A3:G") or []
+    # График и услуги — из индексов (без чтения листов на каждый экран)
+    schedule = await load_schedule_index()
+    service = (await load_service_catalog()).get(subservice)
 
-    # Находим длительность и буфер услуги
-    service_row = None
-    for row in all_services:
-        if len(row) > 1 and row[1] == subservice:
-            service_row = row
-            break
-
-    if not service_row:
+    if not service:
         await query.edit_message_text("❌ Услуга не найдена в таблице.")
         return
 
-    try:
-        service_duration = int(service_row[2])
-        service_buffer = int(service_row[3])
-    except (ValueError, IndexError):
+    if not service.valid:
         logger.error(
-            f"❌ Неверные данные длительности/буфера для услуги {subservice}: {service_row[2:4]}"
+            f"❌ Неверные данные длительности/буфера для услуги {subservice}: {service.row[2:4]}"
         )
         await query.edit_message_text("❌ Ошибка в данных длительности услуги.")
         return
+    service_duration, service_buffer = service.duration, service.buffer
 
     tz = pytz.timezone(get_setting("Часовой пояс", "Europe/Moscow"))
     now = datetime.now(tz)
@@ -2326,47 +2085,11 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     today_date_str = today_date.strftime("%d.%m.%Y")
     
     # Получаем время окончания работы для сегодняшнего дня
+    # (по первому специалисту, который работает сегодня)
     work_end_time = None
-    try:
-        # Ищем в графике специалистов время окончания работы на сегодня
-        # НЕ переопределяем schedule_data - используем уже загруженные данные
-        for row in schedule_data:
-            if len(row) > 0:
-                # Берем название заведения или любого специалиста для проверки графика
-                spec_name = row[0].strip()
-                # Получаем день недели для сегодня
-                day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][today_date.weekday()]
-                day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(day_name) + 2
-                
-                if day_index < len(row):
-                    work_schedule = row[day_index].strip()
-                    if work_schedule and work_schedule.lower() != "выходной":
-                        # ← ИСПРАВЛЕНИЕ: берем ПОСЛЕДНЕЕ время окончания из всех интервалов
-                        # Пример: "10:00-14:00,15:00-20:00" → берем 20:00
-                        intervals = [i.strip() for i in work_schedule.split(",") if i.strip()]
-                        last_end_time = None
-                        
-                        for interval in intervals:
-                            if "-" in interval:
-                                start_str, end_str = interval.split("-", 1)
-                                try:
-                                    end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                                    # Берем самое позднее время окончания
-
-                                    if not last_end_time or end_time > last_end_time:
-                                        last_end_time = end_time
-                                except Exception:
-                                    pass
-                        
-                        if last_end_time:
-                            work_end_time = last_end_time  # Будет 20:00 для примера
-                        elif "-" in work_schedule:
-                            # Старая логика на случай одного интервала
-                            _, end_str = work_schedule.split("-", 1)
-                            work_end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                        break  # Нашли первый рабочий график
-    except Exception as e:
-        logger.error(f"❌ Ошибка при проверке графика работы на сегодня: {e}")
+    working_today = schedule.working(today_date.weekday())
+    if working_today:
+        work_end_time = working_today[0].day_end_time(today_date.weekday())
     # ← КОНЕЦ БЛОКА ↑↑↑
 
     # --- СЦЕНАРИЙ B: "Сначала специалист", потом дата (selected_specialist есть) ---
@@ -2386,34 +2109,11 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     # Получаем время окончания работы на сегодня
                     work_end_time = None
                     org_name = get_setting("Название заведения", "").strip()
-                    schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
                     
-                    for row in schedule_data:
-                        if len(row) > 0 and row[0].strip() == org_name:
-                            day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(target_day_name) + 2
-                            if day_index < len(row):
-                                work_schedule = row[day_index].strip()
-                                if work_schedule and work_schedule.lower() != "выходной":
-                                    # ← ИСПРАВЛЕНИЕ: берем ПОСЛЕДНЕЕ время окончания из всех интервалов
-                                    intervals = [i.strip() for i in work_schedule.split(",") if i.strip()]
-                                    last_end_time = None
-                                    
-                                    for interval in intervals:
-                                        if "-" in interval:
-                                            start_str, end_str = interval.split("-", 1)
-                                            try:
-                                                end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                                                if not last_end_time or end_time > last_end_time:
-                                                    last_end_time = end_time
-                                            except Exception:
-                                                pass
-                                    
-                                    if last_end_time:
-                                        work_end_time = last_end_time
-                                    elif "-" in work_schedule:
-                                        _, end_str = work_schedule.split("-", 1)
-                                        work_end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                                    break
+                    org_schedule = schedule.get(org_name)
+                    if org_schedule and org_schedule.works_on(target_date.weekday()):
+                        # Берем ПОСЛЕДНЕЕ время окончания из всех интервалов ("10:00-14:00,15:00-20:00" → 20:00)
+                        work_end_time = org_schedule.day_end_time(target_date.weekday())
                     
                     # ← ДОБАВЛЕННАЯ ОТЛАДКА
                     logger.info(f"🔍 Проверка сегодняшней даты {target_date_str}:")
@@ -2429,35 +2129,25 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         continue
                 except Exception as e:
                     logger.error(f"Ошибка проверки графика работы: {e}")
-                    logger.error(f"🔍 ОШИБКА ДЕТАЛИ: org_name='{org_name}', target_day_name='{target_day_name}', schedule_data_len={len(schedule_data)}")
+                    logger.error(f"🔍 ОШИБКА ДЕТАЛИ: org_name='{org_name}', target_day_name='{target_day_name}', schedule_len={len(schedule)}")
 
-            # Найдём строку расписания для конкретного специалиста
-            spec_schedule_row = None
-            for row in schedule_data:
-                if len(row) > 0 and row[0].strip() == selected_specialist:
-                    spec_schedule_row = row
-                    break
+            # Найдём расписание конкретного специалиста
+            spec_schedule = schedule.get(selected_specialist)
 
-            if not spec_schedule_row:
+            if not spec_schedule:
                 logger.warning(
                     f"⚠️ График для специалиста '{selected_specialist}' не найден."
                 )
                 continue  # Переходим к следующей дате
 
             # Проверяем, работает ли специалист в этот день
-            day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(
-                target_day_name
-            ) + 2  # Индекс столбца (C=2, D=3, ...)
-            if day_index < len(spec_schedule_row):
-                work_schedule = spec_schedule_row[day_index].strip()
-
-                logger.info(f"🔍 Проверка специалиста {selected_specialist} на {target_date_str}:")
-                logger.info(f"🔍   work_schedule = '{work_schedule}'")
-                logger.info(f"🔍   days_offset = {days_offset} (сегодня? {days_offset == 0})") 
+            logger.info(f"🔍 Проверка специалиста {selected_specialist} на {target_date_str}:")
+            logger.info(f"🔍   work_schedule = '{spec_schedule.cells[target_date.weekday()]}'")
+            logger.info(f"🔍   days_offset = {days_offset} (сегодня? {days_offset == 0})") 
 
-                if work_schedule.lower() != "выходной" and work_schedule:
-                    available_dates_for_specialist.add(target_date_str)  # add для set    
-                    logger.info(f"🔍 Добавили дату: {target_date_str}")
+            if spec_schedule.works_on(target_date.weekday()):
+                available_dates_for_specialist.add(target_date_str)  # add для set    
+                logger.info(f"🔍 Добавили дату: {target_date_str}")
 
         # Правильная сортировка дат
         date_pairs = []
@@ -2504,34 +2194,11 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     # Получаем время окончания работы на сегодня
                     work_end_time = None
                     org_name = get_setting("Название заведения", "").strip()
-                    schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
             
-                    for row in schedule_data:
-                        if len(row) > 0 and row[0].strip() == org_name:
-                            day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(target_day_name) + 2
-                            if day_index < len(row):
-                                work_schedule = row[day_index].strip()
-                                if work_schedule and work_schedule.lower() != "выходной":
-                                    # ← ИСПРАВЛЕНИЕ: берем ПОСЛЕДНЕЕ время окончания из всех интервалов
-                                    intervals = [i.strip() for i in work_schedule.split(",") if i.strip()]
-                                    last_end_time = None
-                                    
-                                    for interval in intervals:
-                                        if "-" in interval:
-                                            start_str, end_str = interval.split("-", 1)
-                                            try:
-                                                end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                                                if not last_end_time or end_time > last_end_time:
-                                                    last_end_time = end_time
-                                            except Exception:
-                                                pass
-                                    
-                                    if last_end_time:
-                                        work_end_time = last_end_time
-                                    elif "-" in work_schedule:
-                                        _, end_str = work_schedule.split("-", 1)
-                                        work_end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                                    break
+                    org_schedule = schedule.get(org_name)
+                    if org_schedule and org_schedule.works_on(target_date.weekday()):
+                        # Берем ПОСЛЕДНЕЕ время окончания из всех интервалов ("10:00-14:00,15:00-20:00" → 20:00)
+                        work_end_time = org_schedule.day_end_time(target_date.weekday())
             
                     if work_end_time and now.time() > work_end_time:
                         # Рабочий день закончился - пропускаем сегодня
@@ -2541,25 +2208,8 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     logger.error(f"Ошибка проверки графика работы: {e}")
 
             # Проверяем, есть ли хотя бы один специалист нужной категории, который работает
-            for row in schedule_data:
-                if len(row) > 0:
-                    spec_name = row[0].strip()
-                    spec_categories_str = row[1].strip().lower()
-                    spec_categories = [
-                        cat.strip() for cat in spec_categories_str.split(",")
-                    ]
-
-                    # Проверяем, подходит ли специалист по категории
-                    if service_type.lower() in spec_categories:
-                        # Проверяем, работает ли он в этот день
-                        day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(
-                            target_day_name
-                        ) + 2
-                        if day_index < len(row):
-                            work_schedule = row[day_index].strip()
-                            if work_schedule.lower() != "выходной" and work_schedule:
-                                available_dates.add(target_date_str)
-                                break
+            if schedule.working(target_date.weekday(), service_type):
+                available_dates.add(target_date_str)
 
         # Правильная сортировка дат
         date_pairs = []
@@ -2624,9 +2274,9 @@ async def select_specialist(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Загружаем график специалистов
-    schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
-    if not schedule_data:
+    # График специалистов (из индекса)
+    schedule = await load_schedule_index()
+    if not len(schedule):
         await query.edit_message_text("❌ Не удалось загрузить график специалистов.")
         return
 
@@ -2639,25 +2289,9 @@ async def select_specialist(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("❌ Неверный формат даты.")
             return
 
-        target_day = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][selected_date.weekday()]
-
-        available_specialists = []
-        for row in schedule_data:
-            if len(row) > 0:
-                specialist_name = row[0].strip()
-                specialist_categories_str = row[1].strip().lower()
-                specialist_categories = [
-                    cat.strip() for cat in specialist_categories_str.split(",")
-                ]
-
-                if service_type.lower() in specialist_categories:
-                    day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(
-                        target_day
-                    ) + 2
-                    if day_index < len(row):
-                        work_schedule = row[day_index].strip()
-                        if work_schedule.lower() != "выходной" and work_schedule:
-                            available_specialists.append(specialist_name)
+        available_specialists = [
+            spec.name for spec in schedule.working(selected_date.weekday(), service_type)
+        ]
 
         # date_str есть, нужно показать специалистов для выбора
         if not available_specialists:
@@ -2723,33 +2357,16 @@ async def select_specialist(update: Update, context: ContextTypes.DEFAULT_TYPE):
         current_date_check = now.date()
         end_date_check = end_date.date()
 
-        while current_date_check <= end_date_check:
-            target_day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][
-                current_date_check.weekday()
-            ]
-
-            for row in schedule_data:
-                if len(row) > 0:
-                    specialist_name = row[0].strip()
-                    category = row[1].strip() if len(row) > 1 else ""
-
-                    if category.lower() == service_type.lower():
-                        day_schedule_index = [
-                            "Пн",
-                            "Вт",
-                            "Ср",
-                            "Чт",
-                            "Пт",
-                            "Сб",
-                            "Вс",
-                        ].index(target_day_name) + 2
-                        if day_schedule_index < len(row):
-                            day_schedule = str(row[day_schedule_index]).strip()
-                            if day_schedule.lower() != "выходной" and day_schedule:
-                                available_specialists.add(specialist_name)
-
+        # За весь период достаточно проверить каждый день недели один раз
+        weekdays = set()
+        while current_date_check <= end_date_check and len(weekdays) < 7:
+            weekdays.add(current_date_check.weekday())
             current_date_check += timedelta(days=1)
 
+        for weekday in weekdays:
+            for spec in schedule.working(weekday, service_type):
+                available_specialists.add(spec.name)
+
         # Показываем кнопки с найденными специалистами
         if not available_specialists:
             await query.edit_message_text(
@@ -2905,8 +2522,10 @@ date_str, st, ss]):
         logger.info(f"✅ Специалист выбран: {specialist}")
     # === КОНЕЦ ВСТАВКИ ===
 
-    slots = find_available_slots(
-        st, ss, date_str, specialist, context.user_data.get("priority", "date")
+    await records_repo.ensure_fresh()  # Поиск слотов берёт записи из памяти
+    slots = await run_blocking(
+        find_available_slots, st, ss, date_str, specialist, context.user_data.get("priority", "date"),
+        owner=update.effective_chat.id,
     )
 
     print(f"=== DEBUG AFTER find_available_slots ===")
@@ -3073,13 +2692,14 @@ async def reserve_slot(
     old_temp_booking = context.user_data.get("temp_booking")
     if old_temp_booking and old_temp_booking.get("event_id"):
         try:
-            safe_delete_calendar_event(CALENDAR_ID, old_temp_booking["event_id"])
+            await calendar.delete_event(old_temp_booking["event_id"])
             logger.info(f"🗑️ Удалён старый желтый резерв: {old_temp_booking['event_id']}")
         except Exception as e:
             logger.error(f"❌ Ошибка удаления старого резерва: {e}")
     
     # Очищаем старый temp_booking
     context.user_data.pop("temp_booking", None)
+    reservations.release(chat_id)
     # === /УДАЛЕНИЕ ПРЕДЫДУЩЕГО РЕЗЕРВА ===
 
     # === ЕДИНАЯ ЛОГИКА ДЛЯ "ЛЮБОЙ" ===
@@ -3107,12 +2727,15 @@ async def reserve_slot(
         subservice = context.user_data.get("subservice")
         
         # Получаем слоты для определения количества доступных специалистов
-        slots = find_available_slots(
+        await records_repo.ensure_fresh()
+        slots = await run_blocking(
+            find_available_slots,
             service_type,
             subservice,
             date_str,
             original_specialist,
-            context.user_data.get("priority", "date")
+            context.user_data.get("priority", "date"),
+            owner=chat_id,
         )
         
         # Находим слот с нужным временем
@@ -3206,13 +2829,32 @@ async def reserve_slot(
     start_dt = TIMEZONE.localize(dt)
     end_dt = start_dt + timedelta(minutes=step)
 
+    # === ХОЛД СЛОТА В ПАМЯТИ: проверка и постановка без await между ними ===
+    await records_repo.ensure_fresh()
+    slot_start = start_dt.hour * 60 + start_dt.minute
+    ignore_record_id = context.user_data.get("old_record_id") if context.user_data.get("modify_mode") else None
+    conflict = reservations.conflict(
+        specialist, date_str, slot_start, slot_start + step,
+        owner=chat_id, ignore_record_id=ignore_record_id,
+    )
+    if conflict:
+        logger.info(f"⛔ Слот {date_str} {time_str} к {specialist} уже занят ({conflict})")
+        await query.edit_message_text(
+            "❌ Это время только что заняли. Выберите другое время.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🕐 Выбрать другое время", callback_data="refresh_time")],
+                [InlineKeyboardButton("📅 Выбрать другую дату", callback_data="back_to_date_select")]
+            ])
+        )
+        return
+    reservations.hold(chat_id, specialist, date_str, slot_start, slot_start + step)
+
     print(f"=== DEBUG: Создаю событие в календаре ===")
     print(f"Календарь ID: {CALENDAR_ID}")
     print(f"Начало: {start_dt.isoformat()}")
     print(f"Конец: {end_dt.isoformat()}")
 
-    event_id = safe_create_calendar_event(
-        CALENDAR_ID,
+    event_id = await calendar.create_event(
         "⏳ Бронь (в процессе)",
         start_dt.isoformat(),
         end_dt.isoformat(),
@@ -3245,6 +2887,8 @@ async def reserve_slot(
         print(f"2. Нет прав у сервисного аккаунта")
         print(f"3. Ошибка Google API")
         event_id = "ERROR_NO_EVENT_CREATED"
+    else:
+        reservations.attach_event(chat_id, event_id)
 
     # === ДОБАВЛЯЕМ ТАЙМЕРЫ ДЛЯ АВТОМАТИЧЕСКОГО ОСВОБОЖДЕНИЯ ===
     chat_id = update.effective_chat.id
@@ -3287,6 +2931,7 @@ async def reserve_slot(
         "end_dt": end_dt,
         "subservice": ss,
         "created_at": datetime.now(TIMEZONE).isoformat(),
+        "booking_key": uuid.uuid4().hex,  # Ключ идемпотентности брони (см. finalize_booking)
     }
     logger.info(f"🎯 temp_booking сохранен с event_id={event_id}")
     logger.info(f"🎯 Все ключи user_data: {list(context.user_data.keys())}")
@@ -3364,9 +3009,11 @@ async def warn_reservation(context: ContextTypes.DEFAULT_TYPE):
             
         logger.info(f"⏰ Отправляем предупреждение chat_id={chat_id}")
         
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="⏳ Не забудьте подтвердить запись — осталось немного времени!"
+        await dispatcher.send(
+            context.bot,
+            chat_id,
+            "⏳ Не забудьте подтвердить запись — осталось немного времени!",
+            priority=PRIORITY_BOOKING,
         )
         logger.info(f"✅ Напоминание отправлено chat_id={chat_id}")
             
@@ -3397,6 +3044,7 @@ async def release_reservation(context: ContextTypes.DEFAULT_TYPE):
     
     user_data = context.application.user_data.get(uid, {})
     temp = user_data.get("temp_booking") if isinstance(user_data, dict) else None
+    reservations.release(chat_id)
     
     # 1. Освобождаем слот в календаре
     if temp and temp.get("event_id"):
@@ -3408,7 +3056,7 @@ async def release_reservation(context: ContextTypes.DEFAULT_TYPE):
             logger.info(f"🗑️ УДАЛЕНИЕ КАЛЕНДАРЯ: event_id={event_id}, дата={date_str} {time_str}")
             logger.info(f"🗑️ CALENDAR_ID={CALENDAR_ID}")
             
-            result = safe_delete_calendar_event(CALENDAR_ID, event_id)
+            result = await calendar.delete_event(event_id)
             logger.info(f"🗑️ Результат safe_delete_calendar_event: {result}")
             
             logger.info(f"Резерв слота {temp['date']} {temp['time']} освобождён по таймауту.")
@@ -3447,9 +3095,11 @@ async def release_reservation(context: ContextTypes.DEFAULT_TYPE):
         keyboard = [[InlineKeyboardButton("🏠 В меню", callback_data="start")]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text="❌ Время на оформление записи истекло. Слот освобождён.\n\nНажмите кнопку чтобы начать заново:",
+        await dispatcher.send(
+            context.bot,
+            chat_id,
+            "❌ Время на оформление записи истекло. Слот освобождён.\n\nНажмите кнопку чтобы начать заново:",
+            priority=PRIORITY_BOOKING,
             reply_markup=reply_markup
         )
         logger.info(f"✅ Пользователю {chat_id} отправлено уведомление об истечении времени")
@@ -3518,28 +3168,30 @@ async def enter_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for job in current_jobs:
             job.schedule_removal()
     
-    # Создаем таймер напоминания через 1 минуту
+    # Создаем таймер напоминания через WARNING_TIMEOUT
     from datetime import datetime, timedelta
-    run_time = datetime.now() + timedelta(seconds=60)
+    run_time = datetime.now() + timedelta(seconds=WARNING_TIMEOUT)
     logger.info(f"⏰ Создаю таймер warn_reservation на {run_time.strftime('%H:%M:%S')}")
     
     warn_job = context.job_queue.run_once(
         warn_reservation,
-        when=60,  # 1 минута = 60 секунд
+        when=WARNING_TIMEOUT,
         data={"user_id": user_id, "chat_id": chat_id},
         name=f"reservation_warn_{chat_id}",
     )
     
-    # Создаем таймер освобождения через 2 минуты
-    run_time = datetime.now() + timedelta(seconds=120)
+    # Создаем таймер освобождения через RESERVATION_TIMEOUT
+    run_time = datetime.now() + timedelta(seconds=RESERVATION_TIMEOUT)
     logger.info(f"⏰ Создаю таймер release_reservation на {run_time.strftime('%H:%M:%S')}")
     
     timeout_job = context.job_queue.run_once(
         release_reservation,
-        when=120,  # 2 минуты = 120 секунд
+        when=RESERVATION_TIMEOUT,
         data={"user_id": user_id, "chat_id": chat_id},
         name=f"reservation_timeout_{chat_id}",
     )
+    # Холд живёт вместе с жёлтой «⏳ Бронь»: продлеваем его на новый срок резерва
+    reservations.extend(chat_id, HOLD_TTL)
     
     logger.info(f"⏰ Таймеры созданы: warn_job={warn_job is not None}, timeout_job={timeout_job is not None}")
     logger.info(f"⏰ Имена таймеров: reservation_warn_{chat_id}, reservation_timeout_{chat_id}")
@@ -3752,28 +3404,30 @@ async def enter_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for job in current_jobs:
             job.schedule_removal()
     
-    # Создаем таймер напоминания через 1 минуту
+    # Создаем таймер напоминания через WARNING_TIMEOUT
     from datetime import datetime, timedelta
-    run_time = datetime.now() + timedelta(seconds=60)
+    run_time = datetime.now() + timedelta(seconds=WARNING_TIMEOUT)
     logger.info(f"⏰ Создаю таймер warn_reservation на {run_time.strftime('%H:%M:%S')}")
     
     warn_job = context.job_queue.run_once(
         warn_reservation,
-        when=60,  # 1 минута = 60 секунд
+        when=WARNING_TIMEOUT,
         data={"user_id": user_id, "chat_id": chat_id},
         name=f"reservation_warn_{chat_id}",
     )
     
-    # Создаем таймер освобождения через 2 минуты
-    run_time = datetime.now() + timedelta(seconds=120)
+    # Создаем таймер освобождения через RESERVATION_TIMEOUT
+    run_time = datetime.now() + timedelta(seconds=RESERVATION_TIMEOUT)
     logger.info(f"⏰ Создаю таймер release_reservation на {run_time.strftime('%H:%M:%S')}")
     
     timeout_job = context.job_queue.run_once(
         release_reservation,
-        when=120,  # 2 минуты = 120 секунд
+        when=RESERVATION_TIMEOUT,
         data={"user_id": user_id, "chat_id": chat_id},
         name=f"reservation_timeout_{chat_id}",
     )
+    # Холд живёт вместе с жёлтой «⏳ Бронь»: продлеваем его на новый срок резерва
+    reservations.extend(chat_id, HOLD_TTL)
     
     logger.info(f"⏰ Таймеры созданы: warn_job={warn_job is not None}, timeout_job={timeout_job is not None}")
     logger.info(f"⏰ Имена таймеров: reservation_warn_{chat_id}, reservation_timeout_{chat_id}")
@@ -3904,12 +3558,22 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "end_dt": end_dt,
                 "subservice": ss,
                 "created_at": datetime.now(TIMEZONE).isoformat(),
+                "booking_key": uuid.uuid4().hex,
             }
             logger.info(f"🔄 Создан temp_booking для изменения записи: {specialist}, {date_str} {time_str}")
     
     # === 1.5. ПРОВЕРКА TEMP_BOOKING ===
     temp_booking = context.user_data.get("temp_booking", {})
 
+    # Повторное нажатие «Подтвердить» после завершённой записи: сообщение уже
+    # показывает подтверждение — не затираем его ошибкой
+    last_booking = context.user_data.get("last_booking")
+    if not temp_booking and last_booking:
+        logger.info(
+            f"♻️ Повторное подтверждение от {chat_id}: запись #{last_booking.get('record_id')} уже оформлена"
+        )
+        return MENU
+
     # === 1.5. ПРОВЕРКА TEMP_BOOKING ===
     temp_booking = context.user_data.get("temp_booking", {})
     if not temp_booking:
@@ -3939,6 +3603,29 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.clear()
         return MENU
 
+    # === ИДЕМПОТЕНТНОСТЬ: БРОНЬ УЖЕ ОФОРМЛЕНА? ===
+    # Ключ брони выдаётся в reserve_slot, добавление строки ставится в outbox с ним.
+    # Повтор (двойное нажатие, сбой или перезапуск после постановки) находит
+    # уже поставленную запись и не добавляет вторую. Проверка — до всех проверок
+    # брони (_validate_booking_checks, слот): наша же запись уже в records_repo и
+    # выглядела бы как конфликт, а ветка отказа удалила бы событие календаря.
+    booking_key = temp_booking.setdefault("booking_key", uuid.uuid4().hex)
+    committed = outbox.find(f"booking:{booking_key}")
+    if committed:
+        record_id = committed.get("record_id", "")
+        logger.info(f"♻️ Бронь {booking_key} уже оформлена записью #{record_id}, повтор пропущен")
+        reservations.release(chat_id)
+        await query.edit_message_text(
+            f"✅ Запись уже оформлена.\n\n<i>ID записи: {record_id}</i>",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+            ]),
+            parse_mode="HTML",
+        )
+        context.user_data.clear()
+        context.user_data["last_booking"] = {"booking_key": booking_key, "record_id": record_id}
+        return MENU
+
     st = context.user_data.get("service_type", "Неизвестно")
     ss = context.user_data.get("subservice", "Неизвестно")
     # Исправление: берём реального специалиста, а не "Любой"
@@ -4011,8 +3698,9 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if check_result is False:
         # Освобождаем временный слот
+        reservations.release(chat_id)
         if event_id:
-            safe_delete_calendar_event(CALENDAR_ID, event_id)
+            await calendar.delete_event(event_id)
         
         # Отменяем таймеры (если еще не отменены)
         job_names = [f"reservation_timeout_{chat_id}", f"reservation_warn_{chat_id}"]
@@ -4077,20 +3765,36 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # === 4. ЗАПИСЫВАЕМ В ТАБЛИЦУ "ЗАПИСИ" ===
-        all_records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-        
-        # === ИСПРАВЛЕНИЕ: Находим МАКСИМАЛЬНЫЙ ID, а не количество записей ===
-        max_id = 0
-        for r in all_records:
-            if len(r) > 0:
-                try:
-                    current_id = int(r[0])  # Пробуем преобразовать ID в число
-                    if current_id > max_id:
-                        max_id = current_id
-                except (ValueError, TypeError):
-                    continue  # Если не число, пропускаем
+        await records_repo.ensure_fresh()
+
+        # === ОКОНЧАТЕЛЬНАЯ ПРОВЕРКА СЛОТА В ПАМЯТИ ===
+        # Записи и чужие холды; до apply_append ниже нет await — проверка и фиксация атомарны
+        slot_start = time_to_minutes(time_str)
+        if slot_start is not None:
+            conflict = reservations.conflict(
+                specialist, date_str, slot_start, slot_start + calculate_service_step(ss),
+                owner=chat_id,
+                ignore_record_id=context.user_data.get("old_record_id") if context.user_data.get("modify_mode") else None,
+            )
+            if conflict:
+                logger.warning(f"⛔ Двойная запись предотвращена: {specialist} {date_str} {time_str} ({conflict})")
+                reservations.release(chat_id)
+                if event_id:
+                    await calendar.delete_event(event_id)
+                await query.edit_message_text(
+                    f"❌ Невозможно завершить запись:\n"
+                    f"❌ Специалист {specialist} уже занят в это время.\n"
+                    f"Выберите другое время или специалиста.",
+                    reply_markup=InlineKeyboardMarkup([
+                        [InlineKeyboardButton("🕐 Выбрать другое время", callback_data="refresh_time")],
+                        [InlineKeyboardButton("🏠 В меню", callback_data="start")]
+                    ])
+                )
+                context.user_data.clear()
+                return MENU
         
-        record_id = str(max_id + 1)  # Следующий ID после максимального
+        # === ID из последовательности (SQLite): уникален даже для одновременных записей ===
+        record_id = str(id_allocator.allocate())
     
         # Дата создания - в формате DD.MM.YYYY HH:MM (текст)
         created_at = datetime.now(TIMEZONE).strftime("%d.%m.%Y %H:%M")
@@ -4189,27 +3893,31 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # ОТЛАДКА: выводим, что собираемся записать
         print(f"DEBUG: Пытаюсь записать в таблицу: {full_record}")
 
-        # Добавляем в таблицу
-        success = safe_append_to_sheet(SHEET_ID, "Записи!A3:O", [full_record])
-        print(f"DEBUG: Результат safe_append_to_sheet: {success}")
-        if success is None:
-            print("ERROR: safe_append_to_sheet вернул None (возможно ошибка API)")
-            success = False
-        if not success:
-            raise Exception("safe_append_to_sheet вернул False или None")
+        # Ставим запись в outbox: в таблицу она уйдёт фоновым сбросом,
+        # а в памяти (проверки слотов, напоминания) появляется сразу.
+        # Операции одной брони (batch) независимы и выполняются одновременно;
+        # если строка так и не попадёт в лист, событие календаря удаляется (compensate)
+        booking_batch = f"record:{record_id}"
+        append_payload = {
+            "range": "Записи!A3:O", "rows": [full_record], "record_id": record_id, "booking_key": booking_key,
+        }
+        if event_id and event_id != "ERROR_NO_EVENT_CREATED":
+            append_payload["compensate"] = [{"kind": "calendar_delete", "payload": {"event_id": event_id}}]
+        outbox.enqueue(
+            "sheets_append", append_payload,
+            key=f"booking:{booking_key}", batch=booking_batch,
+        )
+        records_repo.apply_append(full_record)
+        reservations.release(chat_id)  # Холд стал подтверждённой записью
 
-        logger.info(f"✅ Запись сохранена в таблицу: {record_id}")
+        logger.info(f"✅ Запись поставлена в очередь на сохранение: {record_id}")
 
         # === 3. ОБНОВЛЯЕМ СОБЫТИЕ В КАЛЕНДАРЕ ===
         if event_id:
             try:
                 # Получаем цену услуги для описания
-                services = get_cached_services()
-                price_info = "цена не указана"
-                for row in services:
-                    if len(row) > 1 and row[1] == ss:
-                        price_info = safe_parse_price(row[5] if len(row) > 5 else "")
-                        break
+                service = (await load_service_catalog()).get(ss)
+                price_info = safe_parse_price(service.price if service else "")
 
                 new_summary = f"{name} - {ss}"
                 new_description = (
@@ -4222,36 +3930,23 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 start_dt = temp_booking.get("start_dt")
                 end_dt = temp_booking.get("end_dt")
                 if start_dt and end_dt:
-                    logger.info(f"🟢 ОБНОВЛЕНИЕ КАЛЕНДАРЯ: event_id={event_id}")
-                    logger.info(f"🟢 Данные: name={name}, услуга={ss}, время={start_dt}-{end_dt}")
-                    
-                    logger.info(f"🎯 ВЫЗЫВАЮ safe_update_calendar_event для {event_id}")
-                    
-                    logger.info(f"🔍 ДЕТАЛИ ПЕРЕДАВАЕМЫХ ДАННЫХ:")
-                    logger.info(f"🔍 start_dt: {start_dt}")
-                    logger.info(f"🔍 start_dt.isoformat(): {start_dt.isoformat()}")
-                    logger.info(f"🔍 end_dt: {end_dt}")
-                    logger.info(f"🔍 end_dt.isoformat(): {end_dt.isoformat()}")
-                    logger.info(f"🔍 Разница времени: {(end_dt - start_dt).total_seconds()} секунд")
-
-                    result = safe_update_calendar_event(
-                        CALENDAR_ID,
-                        event_id,
-                        summary=new_summary,
-                        start_time=start_dt.isoformat(),
-                        end_time=end_dt.isoformat(),
-                        description=new_description,
-                        color_id="10",  # Зелёный цвет для подтверждённых
+                    logger.info(f"🟢 ОБНОВЛЕНИЕ КАЛЕНДАРЯ: event_id={event_id}, время={start_dt}-{end_dt}")
+                    calendar_update = {
+                        "event_id": event_id,
+                        "summary": new_summary,
+                        "start_time": start_dt.isoformat(),
+                        "end_time": end_dt.isoformat(),
+                        "description": new_description,
+                        "color_id": "10",  # Зелёный цвет для подтверждённых
+                    }
+                    outbox.enqueue(
+                        "calendar_update", calendar_update,
+                        key=f"record:{record_id}:calendar", batch=booking_batch,
+                    )
+                    calendar_mirror.apply_updated(
+                        event_id, new_summary, calendar_update["start_time"],
+                        calendar_update["end_time"], "10", new_description,
                     )
-                    
-                    logger.info(f"🟢 Результат safe_update_calendar_event: {result}")
-                    logger.info(f"✅ Календарь обновлён: {event_id}")
-
-                    if result:
-                        logger.info(f"✅✅✅ УСПЕХ! Календарь обновлён: {result}")
-                    else:
-                        logger.error(f"❌❌❌ ОШИБКА! safe_update_calendar_event вернула None для {event_id}")
-                        logger.error(f"❌ Проверь логи выше для деталей ошибки")
                 else:
                     logger.error(
                         f"❌ Не найдены start_dt или end_dt in temp_booking: {temp_booking}"
@@ -4274,16 +3969,16 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     old_record_id = context.user_data.get("old_record_id", "")
     if old_record_id and context.user_data.get("modify_mode"):
         # Получаем ВСЕ записи для поиска
-        all_records_for_update = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+        all_records_for_update = await records_repo.by_id(old_record_id)
         
         # Ищем ВСЕ записи с этим ID
         found_old_records = []  # Список для хранения всех найденных записей
         
-        for idx, r in enumerate(all_records_for_update, start=2):
+        for r in all_records_for_update:
             if len(r) > 8 and str(r[0]).strip() == old_record_id:
-                # Сохраняем индекс и запись
+                # Сохраняем номер строки и запись
                 found_old_records.append({
-                    "idx": idx,
+                    "idx": r.row_number,
                     "record": r,
                     "old_date": str(r[6]).strip() if len(r) > 6 else "",
                     "old_time": str(r[7]).strip() if len(r) > 7 else "",
@@ -4296,8 +3991,13 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Обновляем ВСЕ найденные записи
             updated_count = 0
             event_ids_to_delete = set()  # Множество для уникальных event_id
+            # Старая запись меняется только после того, как новая попала в лист:
+            # отдельная пачка с зависимостью от добавления (outbox after=...).
+            # Если добавление отброшено, старая запись и её событие остаются.
+            replace_batch = f"record:{record_id}:replace"
+            append_key = f"booking:{booking_key}"
             
-            for found in found_old_records:
+            for n, found in enumerate(found_old_records):
                 idx = found["idx"]
                 r = found["record"]
                 status = found["status"]
@@ -4327,25 +4027,36 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         except Exception as e:
                             logger.error(f"Ошибка преобразования даты при изменении: {e}")
     
-                    # Обновляем запись в таблице
-                    success = safe_update_sheet_row_by_id(SHEET_ID, "Записи", old_record_id, updated_old)
-                    if success:
-                        updated_count += 1
-                        logger.info(f"✅ Обновлена старая запись {old_record_id} в строке {idx}")
-                    else:
-                        logger.error(f"❌ Не удалось обновить запись {old_record_id} в строке {idx}")
+                    # Обновляем запись в таблице (через outbox, после добавления новой)
+                    outbox.enqueue(
+                        "sheets_update_row_by_id",
+                        {"sheet": "Записи", "record_id": old_record_id, "values": updated_old},
+                        key=f"record:{record_id}:replace:{old_record_id}:{n}",
+                        batch=replace_batch, after=append_key,
+                    )
+                    records_repo.apply_update(old_record_id, updated_old)
+                    updated_count += 1
+                    logger.info(f"✅ Обновлена старая запись {old_record_id} в строке {idx}")
                 else:
                     logger.info(f"⚠️ Пропускаем запись {old_record_id} в строке {idx}: статус '{status}'")
             
             # Удаляем события календаря для ВСЕХ старых записей
             for event_id in event_ids_to_delete:
-                safe_delete_calendar_event(CALENDAR_ID, event_id)
-                logger.info(f"🗑️ Удалено событие календаря: {event_id}")
+                outbox.enqueue(
+                    "calendar_delete", {"event_id": event_id},
+                    key=f"record:{record_id}:delete_event:{event_id}",
+                    batch=replace_batch, after=append_key,
+                )
+                calendar_mirror.apply_deleted(event_id)
+                logger.info(f"🗑️ Удаление события календаря поставлено в очередь: {event_id}")
             
             logger.info(f"✅ Обновлено {updated_count} старых записей {old_record_id} (новая запись: #{record_id})")
         else:
             logger.error(f"❌ Не удалось найти старые записи {old_record_id} для обновления")
 
+    # Записи в Google идут в фоне, пока отправляются сообщения ниже
+    outbox.kick()
+
     # === 5. УВЕДОМЛЯЕМ АДМИНИСТРАТОРОВ ===
     # Рассчитываем время окончания для уведомления
     time_range = time_str
@@ -4380,13 +4091,8 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"🆔 ID записи: {record_id}"
     )
 
-    try:
-        await notify_admins(context, admin_message)
-        logger.info(f"✅ Админы уведомлены о записи {record_id}")
-    except Exception as e:
-        logger.error(f"⚠️ Не удалось уведомить админов: {e}")
-
     # === 6. ОТПРАВЛЯЕМ ПОЛЬЗОВАТЕЛЮ ФИНАЛЬНОЕ СООБЩЕНИЕ ===
+    # (одновременно с уведомлением админов — см. asyncio.gather ниже)
     
     # Рассчитываем диапазон времени
     try:
@@ -4419,9 +4125,22 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [[InlineKeyboardButton("🏠 В меню", callback_data="start")]]
     )
 
-    await query.edit_message_text(
-        user_message, reply_markup=menu_keyboard, parse_mode="HTML"
+    # Сообщение клиенту и уведомление админов независимы — отправляем одновременно,
+    # каждое со своим таймаутом
+    user_result, admin_result = await asyncio.gather(
+        asyncio.wait_for(
+            query.edit_message_text(user_message, reply_markup=menu_keyboard, parse_mode="HTML"),
+            timeout=SIDE_EFFECT_TIMEOUT,
+        ),
+        asyncio.wait_for(notify_admins(context, admin_message), timeout=SIDE_EFFECT_TIMEOUT),
+        return_exceptions=True,
     )
+    if isinstance(user_result, BaseException):
+        logger.error(f"❌ Не удалось показать подтверждение записи {record_id}: {user_result!r}")
+    if isinstance(admin_result, BaseException):
+        logger.error(f"⚠️ Не удалось уведомить админов: {admin_result!r}")
+    else:
+        logger.info(f"✅ Админы уведомлены о записи {record_id}")
 
     # === 7. ОЧИЩАЕМ ВРЕМЕННЫЕ ДАННЫЕ ===
     # Очищаем данные изменения записи (если они есть)
@@ -4432,6 +4151,7 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Полная очистка остальных данных
     context.user_data.clear()
+    context.user_data["last_booking"] = {"booking_key": booking_key, "record_id": record_id}
     logger.info(f"✅ Запись {record_id} полностью завершена для пользователя {chat_id}")
 
     # === ДИАГНОСТИКА: ДОСТИГАЕТ ЛИ КОД ЭТОГО МЕСТА? ===
@@ -4453,14 +4173,14 @@ async def finalize_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.info("🔍 Проверка: достигнут блок перед сортировкой")
 
     # === 8. АВТОСОРТИРОВКА ТАБЛИЦЫ ===
+    # Последней операцией outbox: сортировка выполнится после всех записей этой брони
     try:
-        from utils.safe_google import safe_sort_sheet_records
-        if safe_sort_sheet_records(SHEET_ID):
-            logger.info("✅ Таблица 'Записи' отсортирована")
-        else:
-            logger.warning("⚠️ Сортировка не выполнена")
+        outbox.enqueue("sheets_sort_records", {}, key=f"record:{record_id}:sort")
+        outbox.kick()
+        logger.info("✅ Сортировка таблицы 'Записи' поставлена в очередь")
     except Exception:
-        logger.exception("⚠️ Ошибка при сортировке таблицы")
+        logger.exception("⚠️ Ошибка при постановке сортировки таблицы")
+        outbox.kick()
 
         # === 9. ЗАВЕРШЕНИЕ - НЕ ОСТАНАВЛИВАЕМ БОТ! ===
         print(f"\n{'='*80}")
@@ -4498,9 +4218,10 @@ async def cancel_reservation(update: Update, context: ContextTypes.DEFAULT_TYPE)
             job.schedule_removal()
 
     temp = context.user_data.get("temp_booking")
+    reservations.release(chat_id)
     if temp and temp.get("event_id"):
         try:
-            safe_delete_calendar_event(CALENDAR_ID, temp["event_id"])
+            await calendar.delete_event(temp["event_id"])
             logger.info(f"Резерв слота {temp['date']} {temp['time']} отменён вручную.")
             await check_waiting_list(
                 temp["date"], temp["time"], temp["specialist"], context
@@ -4524,7 +4245,7 @@ async def show_my_records_edit(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id = update.effective_user.id
     name = context.user_data.get("name")
     phone = context.user_data.get("phone")
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.for_client(user_id, phone)
     found = []
     for r in records:
         if (
@@ -4625,7 +4346,7 @@ async def show_my_records_view(update: Update, context: ContextTypes.DEFAULT_TYP
     phone = context.user_data.get("phone")
     
     # 1. Сначала получаем записи
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.for_client(user_id, phone)
     
     # 2. Теперь можно делать отладку (если нужно)
     print(f"🔍 DEBUG: Ищу записи для user_id={user_id}")
@@ -4824,7 +4545,7 @@ async def cancel_record_from_list(
         context.user_data[f"confirm_cancel_{record_id}"] = True
         
         # Ищем запись ДЛЯ ОТМЕНЫ (только активную, будущую)
-        records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+        records = await records_repo.by_id(record_id)
         target_record = None
         now = datetime.now(TIMEZONE)
         
@@ -4896,9 +4617,9 @@ async def cancel_record_from_list(
     
     # Если это второй шаг (подтвержденная отмена)
     chat_id = str(update.effective_chat.id)
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.by_id(record_id)
     
-    for idx, r in enumerate(records, start=2):
+    for r in records:
         if len(r) > 0 and r[0] == record_id:
             if len(r) > 13 and str(r[13]).strip() != chat_id:
                 await query.edit_message_text("❌ Вы не можете отменить эту запись.")
@@ -4911,7 +4632,7 @@ async def cancel_record_from_list(
             
             event_id = r[14] if len(r) > 14 else None
             if event_id:
-                safe_delete_calendar_event(CALENDAR_ID, event_id)
+                await calendar.delete_event(event_id)
             
             updated = list(r)
             updated[8] = "отменено клиентом"
@@ -4934,8 +4655,10 @@ async def cancel_record_from_list(
                 except Exception as e:
                     logger.error(f"Ошибка преобразования даты при отмене: {e}")
             # Используем поиск по ID вместо индекса строки
-            success = safe_update_sheet_row_by_id(SHEET_ID, "Записи", record_id, updated)
-            if not success:
+            success = await sheets.update_row_by_id("Записи", record_id, updated)
+            if success:
+                records_repo.apply_update(record_id, updated)
+            else:
                 logger.error(f"❌ Не удалось обновить запись {record_id}")
             
             await query.edit_message_text(
@@ -4988,7 +4711,7 @@ async def handle_my_records_input(update: Update, context: ContextTypes.DEFAULT_
             )
             return AWAITING_MY_RECORDS_PHONE
         name = context.user_data.get("temp_my_records_name")
-        records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+        records = await records_repo.by_phone(phone)
         found = []
         for r in records:
             if (
@@ -5053,7 +4776,7 @@ async def handle_waiting_list_input(update: Update, context: ContextTypes.DEFAUL
                 str(update.effective_chat.id),
             ]
             try:
-                safe_append_to_sheet(SHEET_ID, "Лист ожидания!A3:L", [entry])
+                await sheets.append("Лист ожидания!A3:L", [entry])
                 confirmation = (
                     "📋 Спасибо! Ваши данные сохранены в листе ожидания.\n\n"
                     f"<b>Основные данные:</b>\n• Услуга: {subservice} ({service_type})\n• Специалист: {specialist}\n"
@@ -5139,7 +4862,7 @@ async def handle_waiting_list_input(update: Update, context: ContextTypes.DEFAUL
             str(update.effective_chat.id),
         ]
         try:
-            safe_append_to_sheet(SHEET_ID, "Лист ожидания!A3:L", [sheet_data])
+            await sheets.append("Лист ожидания!A3:L", [sheet_data])
             await msg.reply_text(
                 f"✅ Вы добавлены в лист ожидания!\nКатегория: {context.user_data['wl_category']}\n"
                 f"Специалист: {context.user_data['wl_specialist']}\nДата: {context.user_data['wl_date']}\n"
@@ -5175,7 +4898,7 @@ async def handle_waiting_list_input(update: Update, context: ContextTypes.DEFAUL
 
 async def handle_record_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = str(update.effective_user.id)
-    admins = load_admins() or []
+    admins = await get_admin_ids()
     if not any(str(a) == user_id for a in admins):
         msg = "❌ У вас нет прав администратора."
         if update.message:
@@ -5282,7 +5005,7 @@ async def handle_admin_search_phone(update: Update, context: ContextTypes.DEFAUL
     # Получаем сохраненное имя
     name = context.user_data.get("admin_search_name", "")
     
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.all()
     found = []
     for r in records:
         if len(r) >= 3:
@@ -5338,7 +5061,7 @@ async def admin_show_record_details(
     update: Update, context: ContextTypes.DEFAULT_TYPE, record_id: str
 ):
     query = update.callback_query
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.by_id(record_id)
     for r in records:
         if len(r) > 0 and r[0] == record_id:
             info = (
@@ -5380,24 +5103,30 @@ async def admin_cancel_record(
     update: Update, context: ContextTypes.DEFAULT_TYPE, record_id: str
 ):
     query = update.callback_query
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-    for idx, r in enumerate(records, start=2):
+    records = await records_repo.by_id(record_id)
+    for r in records:
         if len(r) > 0 and r[0] == record_id:
+            if r.row_number is None:
+                await query.edit_message_text(RECORD_NOT_SAVED_YET.format(record_id))
+                return
             event_id = r[14] if len(r) > 14 else None
             if event_id:
-                safe_delete_calendar_event(CALENDAR_ID, event_id)
+                await calendar.delete_event(event_id)
             updated = list(r)
             updated[8] = "отменено админом"
-            safe_update_sheet_row(SHEET_ID, "Записи", idx, updated)
+            if await sheets.update_row("Записи", r.row_number, updated):
+                records_repo.apply_update_row(r.row_number, updated)
             await query.edit_message_text(
                 f"✅ Запись {record_id} отменена администратором."
             )
             chat_id = r[13] if len(r) > 13 else None
             if chat_id:
                 try:
-                    await context.bot.send_message(
+                    await dispatcher.send(
+                        context.bot,
                         chat_id,
                         f"❌ Ваша запись {record_id} была отменена администратором.",
+                        priority=PRIORITY_BOOKING,
                     )
                 except Exception:
                     pass
@@ -5419,7 +5148,7 @@ async def admin_reschedule_record(
     await query.answer()
     context.user_data["admin_reschedule_record_id"] = record_id
     context.user_data["admin_mode"] = True
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.by_id(record_id)
     current = None
     for r in records:
         if len(r) > 0 and r[0] == record_id:
@@ -5494,12 +5223,11 @@ async def admin_change_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def admin_change_specialist(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
-    specialists_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
+    org_name = get_setting("Название заведения", "Название организации")
     specialists = [
-        row[0]
-        for row in specialists_data
-        if len(row) > 0
-        and row[0] != get_setting("Название заведения", "Название организации")
+        spec.name
+        for spec in (await load_schedule_index()).specialists
+        if spec.name != org_name
     ]
     kb = [
         [InlineKeyboardButton(m, callback_data=f"admin_new_specialist_{m}")]
@@ -5649,7 +5377,7 @@ async def admin_process_new_slot(
         "current_date"
     )
     new_specialist = specialist or context.user_data.get("current_specialist")
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
+    records = await records_repo.by_id(record_id)
     orig = None
     for r in records:
         if len(r) > 0 and r[0] == record_id:
@@ -5738,9 +5466,12 @@ async def _admin_save_reschedule(
     if not all([new_date, new_time, new_specialist]):
         await query.edit_message_text("❌ Не все данные для переноса заполнены.")
         return
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-    for idx, r in enumerate(records, start=2):
+    records = await records_repo.by_id(record_id)
+    for r in records:
         if len(r) > 0 and r[0] == record_id:
+            if r.row_number is None:
+                await query.edit_message_text(RECORD_NOT_SAVED_YET.format(record_id))
+                return
             old_date = str(r[6]).strip() if len(r) > 6 else ""
             old_time = str(r[7]).strip() if len(r) > 7 else ""
             old_specialist = str(r[5]).strip() if len(r) > 5 else ""
@@ -5782,7 +5513,8 @@ async def _admin_save_reschedule(
             if force:
                 note += " (принудительно, несмотря на повтор)"
             updated[10] = note
-            safe_update_sheet_row(SHEET_ID, "Записи", idx, updated)
+            if await sheets.update_row("Записи", r.row_number, updated):
+                records_repo.apply_update_row(r.row_number, updated)
             event_id = r[14] if len(r) > 14 else None
             if event_id:
                 ss = r[4] if len(r) > 4 else ""
@@ -5801,8 +5533,7 @@ async def _admin_save_reschedule(
                 print(f"Formatted start: {start_time_str}")
                 print(f"Original end_dt: {end_dt}")
                 print(f"Formatted end: {end_time_str}")
-                safe_update_calendar_event(
-                    CALENDAR_ID,
+                await calendar.update_event(
                     event_id,
                     f"{name} - {ss}",
                     start_dt.isoformat(),
@@ -5818,8 +5549,10 @@ async def _admin_save_reschedule(
             client_chat_id = r[13] if len(r) > 13 else None
             if client_chat_id and client_chat_id.isdigit():
                 try:
-                    await context.bot.send_message(
-                        chat_id=int(client_chat_id),
+                    await dispatcher.send(
+                        context.bot,
+                        int(client_chat_id),
+                        priority=PRIORITY_BOOKING,
                         text=f"🔄 Ваша запись {record_id} была перенесена администратором.\n\nНовые данные:\n• Дата: {new_date}\n• Время: {new_time}\n• Специалист: {new_specialist}\n\nЕсли новое время не подходит, свяжитесь с нами.",
                     )
                 except Exception as e:
@@ -5860,42 +5593,22 @@ async def _get_available_slots_for_admin(
     service_type: str, subservice: str, date_str: str, specialist: str
 ):
     try:
-        day_headers = safe_get_sheet_data(SHEET_ID, "График специалистов!C2:I2") or []
-        if not day_headers or len(day_headers[0]) < 7:
-            return None, "❌ Не удалось загрузить расписание дней недели из таблицы."
-        day_titles = [str(h).strip().lower() for h in day_headers[0]]
+        schedule = await load_schedule_index()
         target_date = datetime.strptime(date_str, "%d.%m.%Y")
         day_number = target_date.weekday()
-        if day_number >= len(day_titles):
-            return None, f"❌ Не удалось определить график для {date_str}."
-        specialist_rows = safe_get_sheet_data(SHEET_ID, "График специалистов!A:A") or []
-        specialist_row_idx = -1
-        for i, row in enumerate(specialist_rows):
-            if len(row) > 0 and str(row[0]).strip() == specialist:
-                specialist_row_idx = i + 2
-                break
-        if specialist_row_idx == -1:
+        spec_schedule = schedule.get(specialist)
+        if spec_schedule is None:
             return None, f"❌ Специалист {specialist} не найден в графике."
-        day_col_letter = chr(67 + day_number)
-        schedule_cell = f"{day_col_letter}{specialist_row_idx}"
-        schedule_data = (
-            safe_get_sheet_data(
-                SHEET_ID, f"График специалистов!{schedule_cell}:{schedule_cell}"
-            )
-            or []
-        )
-        if not schedule_data or not schedule_data[0]:
+        if not spec_schedule.cells[day_number]:
             return None, f"❌ Нет графика для {specialist} на {date_str}."
-        schedule_range = schedule_data[0][0]
-        if schedule_range.lower() == "выходной":
+        if spec_schedule.is_day_off(day_number):
             return None, f"❌ {specialist} не работает {date_str}."
-        start_time_str, end_time_str = schedule_range.split("-")
-        start_time = datetime.strptime(start_time_str.strip(), "%H:%M").time()
-        end_time = datetime.strptime(end_time_str.strip(), "%H:%M").time()
+        work_intervals = spec_schedule.day_intervals(day_number)
+        if not work_intervals:
+            return None, f"❌ Нет графика для {specialist} на {date_str}."
         step_minutes = calculate_service_step(subservice)
-        all_records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
         booked = []
-        for r in all_records:
+        for r in await records_repo.by_specialist_date(specialist, date_str):
             if (
                 len(r) > 7
                 and str(r[5]).strip() == specialist
@@ -5904,13 +5617,15 @@ async def _get_available_slots_for_admin(
             ):
                 booked.append(str(r[7]).strip())
         available = []
-        current = datetime.combine(target_date.date(), start_time)
-        end_dt = datetime.combine(target_date.date(), end_time)
-        while current + timedelta(minutes=step_minutes) <= end_dt:
-            slot_time = current.strftime("%H:%M")
-            if slot_time not in booked:
-                available.append(slot_time)
-            current += timedelta(minutes=step_minutes)
+        day_start = datetime.combine(target_date.date(), datetime.min.time())
+        for interval_start, interval_end in work_intervals:
+            current = day_start + timedelta(minutes=interval_start)
+            end_dt = day_start + timedelta(minutes=interval_end)
+            while current + timedelta(minutes=step_minutes) <= end_dt:
+                slot_time = current.strftime("%H:%M")
+                if slot_time not in booked:
+                    available.append(slot_time)
+                current += timedelta(minutes=step_minutes)
         return available, None
     except Exception as e:
         logger.error(f"Ошибка при поиске доступных слотов: {e}")
@@ -5987,50 +5702,34 @@ async def notify_admins_of_new_calls_job(context: ContextTypes.DEFAULT_TYPE):
         now = datetime.now(TIMEZONE)
 
         # === ШАГ 1: Найти ВРЕМЯ ОКОНЧАНИЯ ПОСЛЕДНЕГО РАБОЧЕГО ДНЯ ===
-        schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
+        (calls,) = await load_screen_data("new_calls")
         org_name = get_setting("Название заведения", "").strip()
         if not org_name:
             logger.error("❌ Не задано 'Название заведения' в настройках.")
             return
 
-        org_row = None
-        for row in schedule_data:
-            if len(row) > 0 and str(row[0]).strip() == org_name:
-                org_row = row
-                break
-        if not org_row or len(org_row) < 8:
+        org_schedule = (await load_schedule_index()).get(org_name)
+        if not org_schedule:
             logger.error(
                 f"❌ Не найдена строка '{org_name}' в 'График специалистов' или недостаточно данных."
             )
             return
 
-        day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
         last_work_end = None
         days_back = 0
         max_days_back = 30
 
         while days_back <= max_days_back:
             check_date = now.date() - timedelta(days=days_back)
-            day_idx = check_date.weekday()
-            col_idx = day_idx + 1  # B=1 (Пн), ..., H=7 (Вс)
-
-            if col_idx < len(org_row):
-                cell = str(org_row[col_idx]).strip()
-                if cell.lower() != "выходной" and "-" in cell:
-                    try:
-                        _, end_str = cell.split("-", 1)
-                        end_time = datetime.strptime(end_str.strip(), "%H:%M").time()
-                        last_work_end = TIMEZONE.localize(
-                            datetime.combine(check_date, end_time)
-                        )
-                        logger.info(
-                            f"✅ Последний рабочий день: {check_date} (окончание в {end_time})"
-                        )
-                        break
-                    except Exception as e:
-                        logger.warning(
-                            f"⚠️ Ошибка парсинга времени в ячейке {cell}: {e}"
-                        )
+            end_time = org_schedule.day_end_time(check_date.weekday())
+            if end_time:
+                last_work_end = TIMEZONE.localize(
+                    datetime.combine(check_date, end_time)
+                )
+                logger.info(
+                    f"✅ Последний рабочий день: {check_date} (окончание в {end_time})"
+                )
+                break
             days_back += 1
 
         if not last_work_end:
@@ -6045,11 +5744,10 @@ async def notify_admins_of_new_calls_job(context: ContextTypes.DEFAULT_TYPE):
             )
 
         # === ШАГ 2: Найти новые заявки ПОСЛЕ last_work_end ===
-        calls = safe_get_sheet_data(SHEET_ID, "Обратные звонки!A3:J") or []
         new_calls = []
         calls_to_update = []
 
-        for idx, call in enumerate(calls, start=2):
+        for idx, call in enumerate(calls, start=3):  # данные с 3-й строки
             if len(call) < 10:
                 call += [""] * (10 - len(call))
             try:
@@ -6088,17 +5786,12 @@ async def notify_admins_of_new_calls_job(context: ContextTypes.DEFAULT_TYPE):
 
             current_time_str = datetime.now(TIMEZONE).strftime("%d.%m.%Y %H:%M")
             for idx in calls_to_update:
-                try:
-                    full_row = safe_get_sheet_data(
-                        SHEET_ID, f"Обратные звонки!A{idx}:J{idx}"
-                    )[0]
-                    while len(full_row) < 10:
-                        full_row.append("")
-                    full_row[6] = current_time_str  # G — Время уведомления
-                    full_row[7] = "уведомлен"  # H — Статус
-                    safe_update_sheet_row(SHEET_ID, "Обратные звонки", idx, full_row)
-                except Exception as e:
-                    logger.error(f"❌ Не удалось обновить строку {idx}: {e}")
+                # G — Время уведомления, H — Статус
+                write_buffer.queue(
+                    f"Обратные звонки!G{idx}:H{idx}", [[current_time_str, "уведомлен"]]
+                )
+            if not await write_buffer.flush():
+                logger.error(f"❌ Не удалось обновить строки {calls_to_update}, повтор в фоне")
         else:
             logger.info(
                 f"📭 Новых заявок после {last_work_end.strftime('%d.%m.%Y %H:%M')} нет."
@@ -6221,7 +5914,7 @@ async def handle_callback_question(update: Update, context: ContextTypes.DEFAULT
         print(f"🔧 DEBUG: Вызываю safe_log_missed_call(phone_from='{phone}', admin_phone='{clean_phone}', note='...')")
                 
         # Модифицируем функцию для записи вопроса
-        result = safe_log_missed_call(
+        result = await sheets.log_missed_call(
             phone_from=phone,
             admin_phone=clean_phone,
             note=f"Вопрос: {question}",
@@ -6308,7 +6001,7 @@ async def handle_admin_message(update: Update, context: ContextTypes.DEFAULT_TYP
             if not full_name:
                 full_name = "Неизвестно"
 
-            result = safe_log_missed_call(
+            result = await sheets.log_missed_call(
                 phone_from=f"TG:{user_id}",
                 admin_phone=clean_phone,
                 note=f"Сообщение: {user_message}",
@@ -6476,8 +6169,7 @@ async def handle_phone_for_callback(update: Update, context: ContextTypes.DEFAUL
     user = update.effective_user
     msg = context.user_data.get("reverse_call_msg", "Не указано")
 
-    safe_append_to_sheet(
-        SHEET_ID,
+    await sheets.append(
         "Обратные звонки",
         [
             f"CALL-{int(time.time())}",
@@ -6503,7 +6195,20 @@ async def handle_phone_for_callback(update: Update, context: ContextTypes.DEFAUL
 # --- REGISTER HANDLERS ---
 
 
+async def set_update_priority(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Приоритет квоты Google для обработки апдейта: клиенты впереди админов и фоновых задач."""
+    user = update.effective_user
+    is_admin = user is not None and any(str(a) == str(user.id) for a in ADMIN_CHAT_IDS)
+    if is_admin or (context.user_data or {}).get("admin_mode"):
+        set_google_priority(PRIORITY_ADMIN)
+    else:
+        set_google_priority(PRIORITY_INTERACTIVE)
+
+
 def register_handlers(application: Application):
+    # Приоритет запросов к Google для всего апдейта (до остальных групп)
+    application.add_handler(TypeHandler(Update, set_update_priority), group=-1000)
+
     # 0. ОТЛАДОЧНЫЙ обработчик ВСЕХ сообщений (регистрируем ПЕРВЫМ!)
     application.add_handler(
         MessageHandler(filters.ALL & ~filters.COMMAND, debug_all_messages),
@@ -6519,6 +6224,7 @@ def register_handlers(application: Application):
     # - "❌ Отменить/изменить запись" → my_records_edit
     
     # 2. Обработчик callback-кнопок
+    setup_callback_routes()
     application.add_handler(CallbackQueryHandler(button_handler))
     
     # 3. Основной обработчик сообщений
@@ -6530,14 +6236,6 @@ def register_handlers(application: Application):
 
 
 def main():
-    persistence_file = "bot_data.pickle"
-    try:
-        if os.path.exists(persistence_file):
-            os.remove(persistence_file)
-            logger.info("🧹 Старый файл persistence удалён при старте.")
-    except Exception:
-        logger.exception("Не удалось удалить старый persistence файл при старте.")
-
     if not create_lock_file():
         return
 
@@ -6549,7 +6247,9 @@ def main():
         return
 
     try:
-        load_settings_from_table()
+        # Прогрев всех регионов кэша: дальше клики не ждут чтения справочных листов
+        if not cache.warm_up():
+            logger.warning("⚠️ Часть справочных данных не загружена, повторим при следующем обращении")
         logger.info("✅ Настройки загружены и закэшированы при старте")
         tw = get_setting("Триггерные слова", "админ, связаться, помощь")
         global TRIGGER_WORDS
@@ -6569,13 +6269,16 @@ def main():
         return
 
     log_business_event("bot_started")
-    persistence = PicklePersistence(filepath=persistence_file)
+    # Сессии (temp_booking, state) переживают перезапуск: SQLite, запись по одному пользователю
+    persistence = SQLitePersistence()
 
     try:
         application = (
             ApplicationBuilder()
             .token(TELEGRAM_BOT_TOKEN)
             .persistence(persistence)
+            # Апдейты разных чатов — параллельно, одного чата — по очереди
+            .concurrent_updates(PerChatUpdateProcessor())
             .build()
         )
     except Exception as e:
@@ -6584,6 +6287,15 @@ def main():
         return
 
     application.add_error_handler(global_error_handler)
+
+    async def _outbox_failed(kind, payload, error):
+        await notify_admins(
+            application,
+            f"🚨 Не удалось записать в Google ({kind}) после нескольких попыток: {error}\n"
+            f"Данные: {str(payload)[:500]}",
+        )
+
+    outbox.on_failed = _outbox_failed
     application.add_handler(
         MessageHandler(filters.ALL & ~filters.COMMAND, global_activity_updater),
         group=-1,
@@ -6594,31 +6306,64 @@ def main():
     logger.info("✅ Обработчики зарегистрированы.")
 
     # Раскомментируем и настроим jobs
+    # Фоновые задачи тратят квоту Google в последнюю очередь (utils/quota.py)
+    background = google_priority(PRIORITY_BACKGROUND)
     try:
         # Очистка старых сессий в 3:00
         application.job_queue.run_daily(
-            cleanup_old_sessions_job,
+            background(cleanup_old_sessions_job),
             time=datetime.strptime("03:00", "%H:%M").time(),
             days=(0, 1, 2, 3, 4, 5, 6),
         )
 
-        # Напоминания каждые 60 секунд
-        application.job_queue.run_repeating(send_reminders, interval=60, first=10)
+        # Напоминания за 24ч и 1ч: точные run_once по куче сроков вместо опроса раз в минуту
+        reminder_scheduler.start(application.job_queue)
+
+        # Подтягиваем записи, изменённые вне бота (пересчитывает сроки напоминаний)
+        application.job_queue.run_repeating(
+            background(refresh_records_job), interval=FULL_RELOAD_TTL, first=FULL_RELOAD_TTL
+        )
 
         # Уведомления о новых заявках в 09:00
         notify_time = datetime.strptime(
             get_setting("Время утреннего уведомления о заявках", "09:00"), "%H:%M"
         ).time()
         application.job_queue.run_daily(
-            notify_admins_of_new_calls_job, time=notify_time, days=(0, 1, 2, 3, 4, 5, 6)
+            background(notify_admins_of_new_calls_job), time=notify_time, days=(0, 1, 2, 3, 4, 5, 6)
         )
 
         # Health check каждые 5 минут
-        application.job_queue.run_repeating(health_check_job, interval=300, first=10)
+        application.job_queue.run_repeating(background(health_check_job), interval=300, first=10)
+
+        # Инкрементальная синхронизация зеркала календаря
+        application.job_queue.run_repeating(
+            background(sync_calendar_mirror_job), interval=SYNC_INTERVAL, first=5
+        )
+
+        # Статистика попаданий в кэш справочных данных
+        application.job_queue.run_repeating(
+            background(log_cache_stats_job), interval=STATS_INTERVAL, first=STATS_INTERVAL
+        )
+
+        # Фоновый сброс outbox (операции, не выполненные сразу или до перезапуска).
+        # Это хвосты уже подтверждённых клиентам записей — квоту им не урезаем.
+        application.job_queue.run_repeating(
+            google_priority(PRIORITY_INTERACTIVE)(flush_outbox_job), interval=OUTBOX_FLUSH_INTERVAL, first=5
+        )
+
+        # Сброс отложенных записей в таблицу
+        application.job_queue.run_repeating(
+            background(flush_write_buffer_job), interval=FLUSH_INTERVAL, first=FLUSH_INTERVAL
+        )
+
+        # Фоновое обновление Google токена каждые 10 минут
+        application.job_queue.run_repeating(
+            background(refresh_google_token_job), interval=600, first=1
+        )
 
         # Очистка зависших бронирований каждые 15 минут
         application.job_queue.run_repeating(
-            cleanup_stuck_reservations_job, interval=900, first=60
+            background(cleanup_stuck_reservations_job), interval=900, first=60
         )
 
         logger.info("✅ Фоновые задачи зарегистрированы.")
@@ -6642,6 +6387,8 @@ def main():
     except Exception as e:
         logger.critical(f"❌ Критическая ошибка при работе бота: {e}", exc_info=True)
     finally:
+        write_buffer.flush_sync()
+        shutdown_executor(wait=False)
         remove_lock_file()
         logger.info("🔒 Бот остановлен и lock-файл удалён.")
 
@@ -3,37 +3,37 @@ import logging
 from typing import List
 from config import SHEET_ID
 from .safe_google import safe_get_sheet_data
+from .cache import cache
+from .dispatcher import dispatcher, PRIORITY_NORMAL
 
 logger = logging.getLogger(__name__)
 
-# Глобальный список chat_id администраторов
+ADMINS_TTL = 600  # Список админов меняется редко
+
+# Глобальный список chat_id администраторов (обновляется на месте при каждой загрузке региона «admins»)
 ADMIN_CHAT_IDS: List[int] = []
 
-def load_admins():
+def _read_admins():
     """
-    Загружает список администраторов из Google Таблицы "Администраторы".
+    Читает список администраторов из Google Таблицы "Администраторы".
     Ожидается лист "Администраторы" с колонками A: chat_id, B: Имя админа, C: Доступ (Да/Нет).
+    None — если лист прочитать не удалось (в кэше останется прежний список).
     """
-    global ADMIN_CHAT_IDS
-    
     print(f"\n{'='*60}")
     print(f"🔧 НАЧИНАЮ ЗАГРУЗКУ АДМИНИСТРАТОРОВ")
     print(f"{'='*60}")
     
-    # Если уже загружены - возвращаем
-    if ADMIN_CHAT_IDS:
-        print(f"✅ Админы уже загружены: {ADMIN_CHAT_IDS}")
-        return ADMIN_CHAT_IDS
-    
     try:
         # Читаем с A3, предполагая, что A1 - название листа, а A2 - заголовки
         print(f"🔧 Читаю таблицу 'Администраторы!A3:C'...")
         admins = safe_get_sheet_data(SHEET_ID, "Администраторы!A3:C")
         
+        if admins is None:
+            print(f"❌ ТАБЛИЦА 'Администраторы' НЕ НАЙДЕНА!")
+            return None
         if not admins:
-            print(f"❌ ТАБЛИЦА 'Администраторы' ПУСТАЯ ИЛИ НЕ НАЙДЕНА!")
-            ADMIN_CHAT_IDS = []
-            return ADMIN_CHAT_IDS
+            print(f"❌ ТАБЛИЦА 'Администраторы' ПУСТАЯ!")
+            return []
             
         print(f"✅ Получено строк из таблицы: {len(admins)}")
         for i, row in enumerate(admins, start=1):
@@ -43,8 +43,7 @@ def load_admins():
         print(f"❌ ОШИБКА получения данных: {e}")
         import traceback
         traceback.print_exc()
-        ADMIN_CHAT_IDS = []
-        return ADMIN_CHAT_IDS
+        return None
 
     ids = []
     for i, row in enumerate(admins, start=1):
@@ -96,38 +95,61 @@ def load_admins():
             import traceback
             traceback.print_exc()
 
-    ADMIN_CHAT_IDS = ids
-    
     print(f"\n{'='*60}")
     print(f"📊 ИТОГИ ЗАГРУЗКИ:")
-    print(f"   Найдено админов: {len(ADMIN_CHAT_IDS)}")
-    print(f"   Список ID: {ADMIN_CHAT_IDS}")
+    print(f"   Найдено админов: {len(ids)}")
+    print(f"   Список ID: {ids}")
     
     # Проверяем, есть ли мой ID
     my_id = 1163253697
-    if my_id in ADMIN_CHAT_IDS:
+    if my_id in ids:
         print(f"   ✅ МОЙ ID {my_id} НАЙДЕН В СПИСКЕ!")
     else:
         print(f"   ❌ МОЙ ID {my_id} НЕ НАЙДЕН!")
         
         # ВРЕМЕННО добавляем для теста
-        ADMIN_CHAT_IDS.append(my_id)
+        ids.append(my_id)
         print(f"   ⚠️ ВРЕМЕННО ДОБАВЛЯЮ {my_id} ВРУЧНУЮ")
     
     print(f"{'='*60}\n")
     
+    return ids
+
+_admins_region = cache.register("admins", _read_admins, ttl=ADMINS_TTL, empty=[])
+
+@_admins_region.subscribe
+def _sync_admin_chat_ids(ids):
+    # Меняем список на месте: модули, импортировавшие ADMIN_CHAT_IDS, видят актуальные ID
+    ADMIN_CHAT_IDS[:] = ids
+
+def load_admins():
+    """
+    Возвращает список chat_id администраторов из кэша.
+    Устаревший список отдаётся сразу и перечитывается в фоне.
+    """
+    cache.get("admins")
     return ADMIN_CHAT_IDS  # ← ВАЖНО: возвращаем список!
 
+async def get_admin_ids():
+    """То же, что load_admins, но холодный кэш загружается в пуле google-io, не блокируя event loop."""
+    await cache.aget("admins")
+    return ADMIN_CHAT_IDS
+
 async def notify_admins(context, message: str):
     """Асинхронно отправляет сообщение всем загруженным администраторам."""
+    await get_admin_ids()
     if not ADMIN_CHAT_IDS:
         logger.debug("⚠️ ADMIN_CHAT_IDS пуст — нет кому слать уведомления")
         return
-    for chat_id in ADMIN_CHAT_IDS:
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=message)
+    admin_ids = list(ADMIN_CHAT_IDS)
+    # Всем админам параллельно: медленный чат не задерживает остальных
+    results = await dispatcher.send_many(
+        context.bot, [(chat_id, message, {}) for chat_id in admin_ids], priority=PRIORITY_NORMAL
+    )
+    for chat_id, result in zip(admin_ids, results):
+        if isinstance(result, Exception):
+            logger.warning(f"⚠️ Не удалось отправить админу {chat_id}: {result}")
+        else:
             logger.info(f"📤 Уведомление админу {chat_id}: {message[:50]}...")
-        except Exception as e:
-            logger.warning(f"⚠️ Не удалось отправить админу {chat_id}: {e}")
 
 print("✅ Модуль admin.py загружен.")
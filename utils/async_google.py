@@ -0,0 +1,243 @@
+# utils/async_google.py
+"""
+Асинхронный фасад над utils/safe_google.py.
+
+Синхронные вызовы Google API выполняются в ограниченном пуле потоков, поэтому
+медленный ответ Sheets/Calendar больше не замораживает event loop PTB для всех
+пользователей. Каждый вызов ограничен таймаутом; при таймауте возвращается то же
+значение, что и при ошибке в safe_* (None/False).
+
+Исключение — неидемпотентные записи (добавление строки, создание события, журнал
+звонков): запрос уже ушёл в Google, и default означал бы «не записано», хотя
+строка может появиться секундой позже — повтор дал бы дубль. Такие вызовы после
+таймаута (и при отмене корутины) дожидаются потока, так что результат всегда известен.
+
+Пример:
+    from utils.async_google import sheets, calendar
+    records = await sheets.get("Записи!A3:O") or []  # одновременные чтения объединяются
+    event_id = await calendar.create_event(summary, start, end, color_id="5")
+"""
+import asyncio
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from config import SHEET_ID, CALENDAR_ID
+from . import safe_google
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_IO_WORKERS = 8  # Максимум одновременных запросов к Google из бота
+READ_TIMEOUT = 20  # Секунды на чтение
+WRITE_TIMEOUT = 30  # Секунды на запись (неидемпотентную — дальше ждём до ответа Google)
+READ_FRESH_FOR = 1.0  # Секунды, в течение которых одинаковые чтения получают один ответ
+
+_executor = ThreadPoolExecutor(
+    max_workers=GOOGLE_IO_WORKERS, thread_name_prefix="google-io"
+)
+
+
+async def run_blocking(func, *args, timeout=READ_TIMEOUT, default=None, idempotent=None, **kwargs):
+    """
+    Выполняет синхронную функцию в пуле google-io и ждёт результат не дольше timeout.
+    При таймауте возвращает default (сама функция в потоке доработает, результат отбрасывается).
+
+    idempotent=False (по умолчанию берётся из @retry_google_api) — повтор вызова может
+    создать дубль, поэтому после таймаута ждём завершения потока и возвращаем его
+    настоящий результат; при отмене корутины тоже сначала дожидаемся потока (HTTP-запрос
+    ограничен HTTP_TIMEOUT в safe_google), чтобы вызывающий мог проверить результат до повтора.
+
+    Для функций с @retry_google_api повторы выполняются здесь: между попытками
+    ждём через asyncio.sleep, не занимая поток пула паузой.
+    """
+    loop = asyncio.get_running_loop()
+    retries = getattr(func, "max_retries", None)
+    target = func.__wrapped__ if retries else func
+    max_retries = retries or 1  # Без @retry_google_api — одна попытка
+    name = getattr(func, "__name__", func)
+    if idempotent is None:
+        idempotent = getattr(func, "idempotent", True)
+    for attempt in range(max_retries):
+        # Копия контекста: в потоке виден приоритет квоты (utils/quota.py) вызывающей задачи
+        future = loop.run_in_executor(
+            _executor, contextvars.copy_context().run, partial(target, *args, **kwargs)
+        )
+        try:
+            try:
+                # shield: таймаут не отменяет future, неидемпотентную запись дождёмся ниже
+                return await asyncio.wait_for(asyncio.shield(future), timeout=timeout)
+            except asyncio.TimeoutError:
+                if idempotent:
+                    raise
+                logger.warning(f"⏱️ {name} не ответил за {timeout} сек., ждём завершения записи")
+                return await future
+        except asyncio.TimeoutError:
+            future.cancel()
+            logger.error(f"⏱️ Таймаут {timeout} сек. в {name}")
+            return default
+        except asyncio.CancelledError:
+            if not idempotent and not future.done():
+                logger.warning(f"⏳ {name} отменён во время записи, ждём её завершения")
+                await asyncio.wait([future])
+            else:
+                future.cancel()
+            raise
+        except safe_google.CircuitOpenError as e:
+            logger.warning(f"🔌 {name}: {e}")
+            return default
+        except safe_google.QuotaShedError as e:
+            logger.warning(f"🚦 {name}: {e}")
+            return default
+        except safe_google.TransientGoogleError as e:
+            if attempt == max_retries - 1 or not safe_google.should_retry(e, idempotent):
+                logger.error(f"❌ Ошибка Google API после {attempt + 1} попыток в {name}: {e}")
+                return default
+            delay = safe_google.backoff_delay(attempt)
+            logger.warning(f"⚠️ Попытка {attempt + 1} не удалась в {name}: {e}. Повтор через {delay:.1f} сек...")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            logger.error(f"❌ Ошибка в {name}: {e}")
+            return default
+    return default
+
+
+def submit_background(func, *args, **kwargs):
+    """Запускает синхронную функцию в пуле google-io, не дожидаясь результата."""
+    return _executor.submit(partial(func, *args, **kwargs))
+
+
+def shutdown_executor(wait=True):
+    """Останавливает пул google-io (вызывается при завершении бота)."""
+    _executor.shutdown(wait=wait)
+    logger.info("🛑 Пул google-io остановлен")
+
+
+class AsyncSheets:
+    """Асинхронные обёртки над операциями Google Sheets."""
+
+    def __init__(self, spreadsheet_id=SHEET_ID):
+        self.spreadsheet_id = spreadsheet_id
+        # Одновременные чтения одного диапазона объединяются в один запрос
+        self.reads = SingleFlight("sheets", fresh_for=READ_FRESH_FOR)
+
+    async def get(self, range_name, timeout=READ_TIMEOUT):
+        return await self.reads.do(
+            (self.spreadsheet_id, range_name), run_blocking,
+            safe_google.safe_get_sheet_data, self.spreadsheet_id, range_name,
+            timeout=timeout, default=None,
+        )
+
+    async def batch_get(self, ranges, timeout=READ_TIMEOUT):
+        """Несколько диапазонов за один запрос: {диапазон: строки} или None."""
+        ranges = list(ranges)
+        return await self.reads.do(
+            (self.spreadsheet_id, tuple(ranges)), run_blocking,
+            safe_google.safe_batch_get, self.spreadsheet_id, ranges,
+            timeout=timeout, default=None,
+        )
+
+    async def _write(self, func, *args, timeout=WRITE_TIMEOUT, **kwargs):
+        """Запись в таблицу: прежние результаты чтений больше не раздаём."""
+        self.reads.forget()
+        try:
+            return await run_blocking(func, *args, timeout=timeout, default=False, **kwargs)
+        finally:
+            self.reads.forget()
+
+    async def append(self, sheet_name, values, timeout=WRITE_TIMEOUT):
+        return await self._write(
+            safe_google.safe_append_to_sheet, self.spreadsheet_id, sheet_name, values,
+            timeout=timeout,
+        )
+
+    async def update_row(self, sheet_name, row_index, values, timeout=WRITE_TIMEOUT):
+        return await self._write(
+            safe_google.safe_update_sheet_row, self.spreadsheet_id, sheet_name, row_index, values,
+            timeout=timeout,
+        )
+
+    async def update_row_by_id(self, sheet_name, record_id, values, timeout=WRITE_TIMEOUT):
+        return await self._write(
+            safe_google.safe_update_sheet_row_by_id, self.spreadsheet_id, sheet_name, record_id, values,
+            timeout=timeout,
+        )
+
+    async def sort_records(self, timeout=WRITE_TIMEOUT):
+        return await self._write(
+            safe_google.safe_sort_sheet_records, self.spreadsheet_id,
+            timeout=timeout,
+        )
+
+    async def log_missed_call(self, *args, timeout=WRITE_TIMEOUT, **kwargs):
+        return await self._write(
+            safe_google.safe_log_missed_call, *args,
+            timeout=timeout, idempotent=False, **kwargs,
+        )
+
+
+class AsyncCalendar:
+    """Асинхронные обёртки над операциями Google Calendar."""
+
+    def __init__(self, calendar_id=CALENDAR_ID):
+        self.calendar_id = calendar_id
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """
+        listener получает apply_created / apply_updated / apply_deleted после каждой
+        успешной записи (так зеркало календаря не ждёт следующей синхронизации).
+        """
+        self._listeners.append(listener)
+        return listener
+
+    def _notify(self, method, *args):
+        for listener in self._listeners:
+            try:
+                getattr(listener, method)(*args)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика {method} календаря: {e}")
+
+    async def list_events(self, time_min, time_max, timeout=READ_TIMEOUT):
+        return await run_blocking(
+            safe_google.safe_get_calendar_events, self.calendar_id, time_min, time_max,
+            timeout=timeout, default=None,
+        )
+
+    async def create_event(self, summary, start_time, end_time, color_id=None,
+                           description=None, timeout=WRITE_TIMEOUT):
+        event_id = await run_blocking(
+            safe_google.safe_create_calendar_event, self.calendar_id, summary,
+            start_time, end_time, color_id, description,
+            timeout=timeout, default=None,
+        )
+        if event_id:
+            self._notify("apply_created", event_id, summary, start_time, end_time, color_id, description)
+        return event_id
+
+    async def update_event(self, event_id, summary=None, start_time=None, end_time=None,
+                           color_id=None, description=None, timeout=WRITE_TIMEOUT):
+        result = await run_blocking(
+            safe_google.safe_update_calendar_event, self.calendar_id, event_id,
+            summary, start_time, end_time, color_id, description,
+            timeout=timeout, default=None,
+        )
+        if result:
+            self._notify("apply_updated", event_id, summary, start_time, end_time, color_id, description)
+        return result
+
+    async def delete_event(self, event_id, timeout=WRITE_TIMEOUT):
+        deleted = await run_blocking(
+            safe_google.safe_delete_calendar_event, self.calendar_id, event_id,
+            timeout=timeout,
+        )
+        if deleted:
+            self._notify("apply_deleted", event_id)
+        return deleted
+
+
+sheets = AsyncSheets()
+calendar = AsyncCalendar()
+
+print("✅ Модуль async_google.py загружен.")
@@ -0,0 +1,89 @@
+# utils/availability.py
+"""
+Движок свободного времени на битовых масках.
+
+День специалиста представляется целым числом Python, где бит N — минута N от
+начала суток. Вместо перебора каждого 15-минутного шага со вложенной проверкой
+всех занятых интервалов свободные начала слотов считаются несколькими битовыми
+операциями:
+
+    кандидаты  = начала interval_start + 15·k, для которых слот помещается в интервал
+    запрещено  = ∪ по занятым (bs, be): начала s с s < be и s + D > bs
+    свободно   = кандидаты & ~запрещено & ~прошедшее_время
+
+Результат совпадает с прежней проверкой «not (slot_end <= busy_start or
+slot_start >= busy_end)», включая порядок слотов и интервалы, переходящие
+через полночь.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+SLOT_STEP = 15  # Шаг начала слотов, минуты
+DEFAULT_SERVICE_DURATION = 60  # Длительность, если услуга не найдена в листе «Услуги»
+
+
+def interval_mask(start: int, end: int) -> int:
+    """Маска минут [start, end)."""
+    start = max(start, 0)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def step_mask(start: int, end: int, duration: int, step: int = SLOT_STEP) -> int:
+    """Маска начал start, start+step, ..., у которых слот длиной duration заканчивается не позже end."""
+    if start < 0 or start + duration > end:
+        return 0
+    count = (end - duration - start) // step + 1
+    # 0b…0000000000000010000000000000001: бит через каждые step позиций, count штук
+    pattern = ((1 << (step * count)) - 1) // ((1 << step) - 1)
+    return pattern << start
+
+
+def blocked_starts_mask(busy_intervals, duration: int) -> int:
+    """Начала слотов длиной duration, которые пересекаются хотя бы с одним занятым интервалом."""
+    mask = 0
+    for busy_start, busy_end in busy_intervals:
+        mask |= interval_mask(busy_start - duration + 1, busy_end)
+    return mask
+
+
+def iter_bits(mask: int):
+    """Номера установленных битов по возрастанию."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def first_future_minute(date_value, now) -> int:
+    """
+    Первая минута суток date_value, начало слота в которую ещё не прошло
+    (слот в HH:MM:00 считается прошедшим, если он строго раньше now).
+    """
+    if date_value > now.date():
+        return 0
+    if date_value < now.date():
+        return 24 * 60 * 2  # Весь день (и «хвосты» после полуночи) в прошлом
+    minute = now.hour * 60 + now.minute
+    return minute + 1 if (now.second or now.microsecond) else minute
+
+
+def free_starts(work_intervals, busy_intervals, duration: int, not_before: int = 0):
+    """
+    Свободные начала слотов в минутах: по каждому рабочему интервалу
+    по возрастанию — в том же порядке, что и прежний пошаговый перебор.
+    """
+    blocked = blocked_starts_mask(busy_intervals, duration) | interval_mask(0, not_before)
+    result = []
+    for interval_start, interval_end in work_intervals:
+        result.extend(iter_bits(step_mask(interval_start, interval_end, duration) & ~blocked))
+    return result
+
+
+def format_minutes(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+print("✅ Модуль availability.py загружен.")
@@ -0,0 +1,218 @@
+# utils/cache.py
+"""
+Единый кэш справочных данных из таблицы (настройки, услуги, график, администраторы).
+
+Каждый вид данных — именованный регион со своим загрузчиком и TTL:
+
+    region = cache.register("settings", _load_settings, ttl=300, empty={})
+    settings = cache.get("settings")          # из синхронного кода
+    settings = await cache.aget("settings")   # из обработчиков
+
+Поведение чтения:
+- свежее значение отдаётся сразу (hit);
+- устаревшее значение тоже отдаётся сразу (stale hit), а перечитывание листа
+  уходит в фон в пул google-io — клик пользователя не ждёт Sheets;
+- ждать загрузки приходится только «холодному» региону (miss), поэтому все
+  регионы прогреваются при старте бота (warm_up).
+
+Если загрузчик вернул None или упал, остаётся прежнее значение, а следующая
+попытка будет не раньше чем через RETRY_AFTER_FAILURE секунд.
+После каждой успешной загрузки вызываются подписчики региона (subscribe).
+"""
+import logging
+import threading
+import time
+
+from .async_google import run_blocking, submit_background
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER_FAILURE = 10  # Пауза перед повторной загрузкой после ошибки
+STATS_INTERVAL = 3600  # Как часто писать статистику кэша в лог
+
+
+class CacheRegion:
+    def __init__(self, name, loader, ttl, empty=None):
+        self.name = name
+        self.loader = loader
+        self.ttl = ttl
+        self.empty = empty
+        self.value = empty
+        self.loaded_at = 0.0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+        self._loaded = False
+        self._fresh_until = 0.0
+        self._refreshing = False
+        self._load_lock = threading.Lock()  # Одновременно идёт не больше одной загрузки
+        self._flag_lock = threading.Lock()
+        self._subscribers = []
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def subscribe(self, callback):
+        """callback(value) вызывается после каждой успешной загрузки региона."""
+        self._subscribers.append(callback)
+        return callback
+
+    # --- чтение ---
+
+    def get(self):
+        """Синхронное чтение (для кода, который и так выполняется в потоке)."""
+        if time.time() < self._fresh_until:
+            self.hits += 1
+            return self.value
+        if self._loaded:
+            self.stale_hits += 1
+            self.refresh_in_background()
+            return self.value
+        self.misses += 1
+        return self.refresh()
+
+    async def aget(self):
+        """Асинхронное чтение: сетевой запрос только для холодного региона и только в пуле google-io."""
+        if time.time() < self._fresh_until:
+            self.hits += 1
+            return self.value
+        if self._loaded:
+            self.stale_hits += 1
+            self.refresh_in_background()
+            return self.value
+        self.misses += 1
+        return await run_blocking(self.refresh, default=self.value)
+
+    # --- загрузка ---
+
+    def refresh(self, force: bool = False):
+        """Синхронно перечитывает регион; при ошибке возвращает прежнее значение."""
+        with self._load_lock:
+            # Пока ждали блокировку, регион мог загрузить другой поток
+            if not force and time.time() < self._fresh_until:
+                return self.value
+            try:
+                value = self.loader()
+            except Exception as e:
+                logger.error(f"❌ Ошибка загрузки региона кэша '{self.name}': {e}")
+                value = None
+            if value is None:
+                self.failures += 1
+                self._fresh_until = time.time() + min(RETRY_AFTER_FAILURE, self.ttl)
+                logger.warning(f"⚠️ Регион кэша '{self.name}' не обновлён, используем прежние данные")
+                return self.value
+            self.value = value
+            self.loaded_at = time.time()
+            self._fresh_until = self.loaded_at + self.ttl
+            self._loaded = True
+            self.refreshes += 1
+        for callback in list(self._subscribers):
+            try:
+                callback(value)
+            except Exception as e:
+                logger.error(f"❌ Ошибка подписчика региона кэша '{self.name}': {e}")
+        return value
+
+    def refresh_in_background(self):
+        """Ставит перечитывание в пул google-io, если оно ещё не идёт."""
+        with self._flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def task():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        try:
+            submit_background(task)
+        except RuntimeError:
+            # Пул уже остановлен (бот завершается)
+            self._refreshing = False
+
+    def invalidate(self, drop: bool = False):
+        """
+        Помечает регион устаревшим: следующее чтение запустит фоновое обновление.
+        drop=True дополнительно выбрасывает значение — следующее чтение будет ждать загрузку.
+        """
+        self._fresh_until = 0.0
+        if drop:
+            self._loaded = False
+            self.value = self.empty
+        logger.info(f"🧹 Регион кэша '{self.name}' сброшен")
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "age": round(time.time() - self.loaded_at) if self._loaded else None,
+        }
+
+
+class CacheManager:
+    def __init__(self):
+        self._regions = {}
+
+    def register(self, name, loader, ttl, empty=None) -> CacheRegion:
+        region = CacheRegion(name, loader, ttl, empty)
+        self._regions[name] = region
+        return region
+
+    def region(self, name) -> CacheRegion:
+        return self._regions[name]
+
+    def get(self, name):
+        return self._regions[name].get()
+
+    async def aget(self, name):
+        return await self._regions[name].aget()
+
+    def refresh(self, name, force: bool = True):
+        return self._regions[name].refresh(force=force)
+
+    def invalidate(self, name=None, drop: bool = False):
+        """Сбрасывает один регион или все сразу (name=None)."""
+        regions = [self._regions[name]] if name else list(self._regions.values())
+        for region in regions:
+            region.invalidate(drop=drop)
+
+    def warm_up(self) -> bool:
+        """Синхронно загружает все регионы (при старте бота). False, если хоть один не загрузился."""
+        ok = True
+        for region in self._regions.values():
+            region.refresh(force=True)
+            if not region.loaded:
+                logger.error(f"❌ Регион кэша '{region.name}' не удалось прогреть")
+                ok = False
+        return ok
+
+    def stats(self):
+        return [region.stats() for region in self._regions.values()]
+
+    def log_stats(self):
+        for s in self.stats():
+            logger.info(
+                f"📊 Кэш '{s['name']}': hit={s['hits']} stale={s['stale_hits']} "
+                f"miss={s['misses']} обновлений={s['refreshes']} ошибок={s['failures']} "
+                f"возраст={s['age']} сек."
+            )
+
+
+cache = CacheManager()
+
+
+async def log_cache_stats_job(context):
+    """Периодическая задача: статистика попаданий в кэш."""
+    cache.log_stats()
+
+
+print("✅ Модуль cache.py загружен.")
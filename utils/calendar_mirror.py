@@ -0,0 +1,242 @@
+# utils/calendar_mirror.py
+"""
+Зеркало Google Календаря в памяти.
+
+Вместо того чтобы на каждый вызов перечитывать окно в 10–30 дней через
+events.list, зеркало один раз выгружает календарь (начиная с PAST_DAYS дней
+назад), а дальше запрашивает только изменения по syncToken. События
+индексируются по дню начала и по (день, специалист).
+
+Собственные создания/изменения/удаления бота применяются сразу: AsyncCalendar
+уведомляет зеркало после успешной записи (apply_created / apply_updated /
+apply_deleted), а синхронный код (генерация слотов) вызывает их напрямую.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import CALENDAR_ID, TIMEZONE
+from .safe_google import safe_sync_calendar_events
+from .async_google import run_blocking, calendar
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = 60  # Секунды между инкрементальными синхронизациями
+PAST_DAYS = 1  # Сколько дней прошлого хранить в зеркале
+
+
+def parse_event_time(value):
+    """'2026-10-17T10:00:00+03:00' / '...Z' → datetime в TIMEZONE; None, если не разобрать."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        return TIMEZONE.localize(dt)
+    return dt.astimezone(TIMEZONE)
+
+
+def event_specialist(event) -> str:
+    """
+    Специалист из названия/описания события («... к Анна», «Бронь: услуга к Анна. ...»);
+    'unknown', если не указан.
+    """
+    summary = event.get("summary") or ""
+    description = event.get("description") or ""
+    specialist = summary.split(" к ")[-1] if " к " in summary else "unknown"
+    if " к " in description:
+        specialist = description.split(" к ")[-1].split(" ")[0]
+    return re.sub(r"[.,;:!]+$", "", specialist.strip()) or "unknown"
+
+
+class CalendarEvent:
+    """Событие календаря с разобранным временем и специалистом."""
+
+    __slots__ = ("id", "raw", "start", "end", "day", "specialist")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.id = raw.get("id")
+        self.start = parse_event_time((raw.get("start") or {}).get("dateTime"))
+        self.end = parse_event_time((raw.get("end") or {}).get("dateTime")) or self.start
+        self.day = self.start.date() if self.start else None
+        self.specialist = event_specialist(raw)
+
+
+class CalendarMirror:
+    def __init__(self, calendar_id=CALENDAR_ID):
+        self.calendar_id = calendar_id
+        self._events = {}  # event_id -> CalendarEvent
+        self._by_day = {}  # date -> {event_id: CalendarEvent}
+        self._by_day_spec = {}  # (date, специалист) -> {event_id: CalendarEvent}
+        self._sync_token = None
+        self._synced_at = 0.0
+        self._last_ok = False
+        self._local = None  # Локальные изменения, пришедшие во время синхронизации
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._refresh_lock = None  # asyncio.Lock создаётся в event loop
+
+    # --- индексы ---
+
+    def _put(self, raw):
+        self._drop(raw.get("id"))
+        event = CalendarEvent(raw)
+        if not event.id or not event.day:
+            return  # События на весь день и без времени слоты не занимают
+        self._events[event.id] = event
+        self._by_day.setdefault(event.day, {})[event.id] = event
+        self._by_day_spec.setdefault((event.day, event.specialist), {})[event.id] = event
+
+    def _drop(self, event_id):
+        event = self._events.pop(event_id, None)
+        if not event:
+            return
+        for index, key in ((self._by_day, event.day), (self._by_day_spec, (event.day, event.specialist))):
+            bucket = index.get(key)
+            if bucket:
+                bucket.pop(event_id, None)
+                if not bucket:
+                    del index[key]
+
+    def _prune(self, horizon):
+        for event_id in [e.id for e in self._events.values() if e.end < horizon]:
+            self._drop(event_id)
+
+    # --- синхронизация ---
+
+    @property
+    def healthy(self) -> bool:
+        """Последняя синхронизация прошла успешно."""
+        return self._last_ok
+
+    def sync(self) -> bool:
+        """Синхронизация (выполняется в пуле google-io): полная в первый раз, дальше по syncToken."""
+        with self._sync_lock:
+            horizon = datetime.now(TIMEZONE) - timedelta(days=PAST_DAYS)
+            with self._lock:
+                self._local = []
+            result = safe_sync_calendar_events(self.calendar_id, self._sync_token, horizon.isoformat())
+            with self._lock:
+                local, self._local = self._local, None
+                self._synced_at = time.time()
+                if result is None:
+                    self._last_ok = False
+                    return False
+                items, next_token, full = result
+                if full:
+                    self._events, self._by_day, self._by_day_spec = {}, {}, {}
+                for raw in items:
+                    if raw.get("status") == "cancelled":
+                        self._drop(raw.get("id"))
+                    else:
+                        self._put(raw)
+                # Записи бота, сделанные во время запроса, новее ответа
+                for method, args in local:
+                    getattr(self, method)(*args)
+                self._prune(horizon)
+                self._sync_token = next_token
+                self._last_ok = True
+            if full:
+                logger.info(f"📆 Зеркало календаря загружено: {len(self._events)} событий")
+            elif items:
+                logger.info(f"📆 Зеркало календаря: получено {len(items)} изменений")
+            return True
+
+    def ensure_fresh_blocking(self):
+        """Синхронный вариант ensure_fresh для кода, работающего в потоке."""
+        if time.time() - self._synced_at >= SYNC_INTERVAL:
+            self.sync()
+        return self._last_ok
+
+    async def ensure_fresh(self) -> bool:
+        if time.time() - self._synced_at < SYNC_INTERVAL:
+            return self._last_ok
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if time.time() - self._synced_at >= SYNC_INTERVAL:
+                await run_blocking(self.sync, default=False)
+        return self._last_ok
+
+    def invalidate(self):
+        """Следующее обращение синхронизирует зеркало."""
+        self._synced_at = 0.0
+
+    # --- чтение ---
+
+    def events_on(self, day):
+        """События, начинающиеся в этот день, по времени начала."""
+        with self._lock:
+            return sorted(self._by_day.get(day, {}).values(), key=lambda e: e.start)
+
+    def events_for(self, day, specialist):
+        with self._lock:
+            bucket = self._by_day_spec.get((day, str(specialist or "").strip()), {})
+            return sorted(bucket.values(), key=lambda e: e.start)
+
+    def events_between(self, start, end):
+        """События, пересекающие [start, end), по времени начала."""
+        found = []
+        day = start.date() - timedelta(days=1)  # Событие могло начаться накануне
+        with self._lock:
+            while day <= end.date():
+                found.extend(e for e in self._by_day.get(day, {}).values() if e.start < end and e.end > start)
+                day += timedelta(days=1)
+        return sorted(found, key=lambda e: e.start)
+
+    # --- локальное применение записей бота ---
+
+    def _remember(self, method, *args):
+        if self._local is not None:
+            self._local.append((method, args))
+
+    def apply_created(self, event_id, summary, start_time, end_time, color_id=None, description=None):
+        raw = {
+            "id": event_id,
+            "summary": summary,
+            "description": description,
+            "colorId": color_id,
+            "start": {"dateTime": start_time if isinstance(start_time, str) else start_time.isoformat()},
+            "end": {"dateTime": end_time if isinstance(end_time, str) else end_time.isoformat()},
+        }
+        with self._lock:
+            self._put(raw)
+            self._remember("apply_created", event_id, summary, start_time, end_time, color_id, description)
+
+    def apply_updated(self, event_id, summary=None, start_time=None, end_time=None,
+                      color_id=None, description=None):
+        with self._lock:
+            current = self._events.get(event_id)
+            raw = dict(current.raw) if current else {"id": event_id}
+            for key, value in (("summary", summary), ("description", description), ("colorId", color_id)):
+                if value:
+                    raw[key] = value
+            if start_time:
+                raw["start"] = {"dateTime": start_time if isinstance(start_time, str) else start_time.isoformat()}
+            if end_time:
+                raw["end"] = {"dateTime": end_time if isinstance(end_time, str) else end_time.isoformat()}
+            if "start" in raw:
+                self._put(raw)
+            self._remember("apply_updated", event_id, summary, start_time, end_time, color_id, description)
+
+    def apply_deleted(self, event_id):
+        with self._lock:
+            self._drop(event_id)
+            self._remember("apply_deleted", event_id)
+
+
+calendar_mirror = calendar.subscribe(CalendarMirror())
+
+
+async def sync_calendar_mirror_job(context):
+    """Периодическая задача: подтягивает изменения календаря по syncToken."""
+    await calendar_mirror.ensure_fresh()
+
+
+print("✅ Модуль calendar_mirror.py загружен.")
@@ -0,0 +1,151 @@
+# utils/callback_router.py
+"""
+Маршрутизация нажатий inline-кнопок по callback_data.
+
+button_handler раньше проверял data длинной цепочкой `data == ...` и
+`data.startswith(...)`: каждое нажатие проходило все проверки до своей, а
+параметры вроде slot_{специалист}_{время} разбирались вручную в каждой ветке.
+
+Теперь маршруты объявляются таблицей:
+- точные (data == "book") — поиск в словаре;
+- префиксные (data начинается с "slot_") — посимвольное дерево префиксов, выбирается
+  самый длинный подходящий префикс ("slot_any_" раньше "slot_"). Поиск стоит
+  O(длина префикса) и не зависит от числа маршрутов.
+Точное совпадение важнее префиксного ("admin_manage_record" и "admin_manage_").
+
+Остаток после префикса делится по "_" на params (последний параметр забирает
+всё оставшееся) и приводится к типу, если параметр задан как (имя, тип).
+Обработчик вызывается как handler(update, context, *значения).
+
+Для каждого маршрута считаются вызовы, ошибки и время (stats(), health check).
+
+Пример:
+    router = CallbackRouter()
+    router.add_exact("book", select_service_type)
+    router.add_prefix("slot_", reserve_slot, params=("specialist", "time"))
+    result = await router.dispatch(update, context, query.data)
+"""
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = object()  # dispatch: для data нет маршрута
+
+
+class Route:
+    __slots__ = ("pattern", "handler", "params", "invalid_text", "calls", "errors", "total_time", "max_time")
+
+    def __init__(self, pattern, handler, params=(), invalid_text=None):
+        self.pattern = pattern
+        self.handler = handler
+        # ("time", ("record_id", int)) -> [("time", None), ("record_id", int)]
+        self.params = [p if isinstance(p, tuple) else (p, None) for p in params]
+        self.invalid_text = invalid_text
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def parse(self, rest):
+        """Значения параметров из остатка callback_data или None, если формат не тот."""
+        if not self.params:
+            return []
+        parts = rest.split("_", len(self.params) - 1)
+        if len(parts) != len(self.params):
+            return None
+        values = []
+        for (name, convert), raw in zip(self.params, parts):
+            try:
+                values.append(convert(raw) if convert else raw)
+            except (TypeError, ValueError):
+                return None
+        return values
+
+
+class CallbackRouter:
+    def __init__(self):
+        self._exact = {}  # callback_data -> Route
+        self._trie = [{}, None]  # узел: [символ -> узел, Route с этим префиксом]
+        self.unmatched = 0
+
+    def add_exact(self, data, handler):
+        self._exact[data] = Route(data, handler)
+
+    def add_prefix(self, prefix, handler, params=("value",), invalid_text=None):
+        node = self._trie
+        for char in prefix:
+            node = node[0].setdefault(char, [{}, None])
+        node[1] = Route(prefix + "*", handler, params, invalid_text)
+
+    def match(self, data):
+        """(Route, остаток после префикса) или (None, None)."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ""
+        best, best_len = None, 0
+        node = self._trie
+        for i, char in enumerate(data):
+            node = node[0].get(char)
+            if node is None:
+                break
+            if node[1] is not None:
+                best, best_len = node[1], i + 1
+        if best is None:
+            return None, None
+        return best, data[best_len:]
+
+    async def dispatch(self, update, context, data):
+        """Вызывает обработчик маршрута и возвращает его результат; NOT_FOUND — маршрута нет."""
+        route, rest = self.match(data or "")
+        if route is None:
+            self.unmatched += 1
+            logger.warning(f"⚠️ Нет обработчика для кнопки '{data}'")
+            return NOT_FOUND
+        values = route.parse(rest)
+        if values is None:
+            route.errors += 1
+            logger.warning(f"⚠️ Неверный формат кнопки '{data}' (маршрут {route.pattern})")
+            if route.invalid_text:
+                await update.callback_query.edit_message_text(route.invalid_text)
+            return None
+
+        route.calls += 1
+        started = time.monotonic()
+        try:
+            return await route.handler(update, context, *values)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            route.total_time += elapsed
+            route.max_time = max(route.max_time, elapsed)
+
+    def _routes(self):
+        yield from self._exact.values()
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            if node[1] is not None:
+                yield node[1]
+            stack.extend(node[0].values())
+
+    def stats(self) -> dict:
+        """{маршрут: вызовы, ошибки, среднее и максимальное время в мс} для вызывавшихся маршрутов."""
+        result = {
+            route.pattern: {
+                "calls": route.calls,
+                "errors": route.errors,
+                "avg_ms": round(route.total_time / route.calls * 1000, 1) if route.calls else 0.0,
+                "max_ms": round(route.max_time * 1000, 1),
+            }
+            for route in self._routes()
+            if route.calls or route.errors
+        }
+        if self.unmatched:
+            result["<нет маршрута>"] = {"calls": self.unmatched}
+        return result
+
+
+print("✅ Модуль callback_router.py загружен.")
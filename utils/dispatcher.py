@@ -0,0 +1,139 @@
+# utils/dispatcher.py
+"""
+Исходящие сообщения с ограничением скорости.
+
+Массовые рассылки (напоминания, лист ожидания, уведомления админам) больше не
+ждут каждого получателя по очереди: сообщения ставятся в приоритетную очередь,
+которую разбирают WORKERS параллельных обработчиков. При этом соблюдаются
+ограничения Telegram:
+- не чаще GLOBAL_RATE сообщений в секунду на бота;
+- не чаще одного сообщения в PER_CHAT_INTERVAL секунд в один чат;
+- RetryAfter (flood control) приостанавливает всю отправку на указанное время,
+  после чего сообщение отправляется повторно.
+
+Сообщения о записи (PRIORITY_BOOKING) обгоняют в очереди массовые рассылки.
+
+Пример:
+    from utils.dispatcher import dispatcher, PRIORITY_BULK
+    await dispatcher.send(context.bot, chat_id, "Текст", priority=PRIORITY_BULK)
+send возвращает Message или пробрасывает ошибку Telegram, как bot.send_message.
+"""
+import asyncio
+import itertools
+import logging
+from datetime import timedelta
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_BOOKING = 0  # Подтверждения, отмены и переносы записей клиенту
+PRIORITY_NORMAL = 1  # Уведомления админам, служебные сообщения
+PRIORITY_BULK = 2  # Напоминания и рассылки по листу ожидания
+
+WORKERS = 8  # Одновременных запросов sendMessage
+GLOBAL_RATE = 25  # Сообщений в секунду (лимит Telegram — около 30)
+PER_CHAT_INTERVAL = 1.0  # Секунд между сообщениями в один чат
+MAX_ATTEMPTS = 3
+
+
+def _retry_after_seconds(error) -> float:
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+
+class MessageDispatcher:
+    def __init__(self, workers=WORKERS, global_rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL):
+        self.workers = workers
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self._queue = None  # asyncio.PriorityQueue создаётся в event loop
+        self._tasks = []
+        self._seq = itertools.count()  # Порядок FIFO внутри одного приоритета
+        self._next_global = 0.0
+        self._chat_next = {}  # chat_id -> когда можно писать в чат снова (loop.time())
+        self._paused_until = 0.0
+
+    def _ensure_started(self):
+        if self._queue is not None and all(not t.done() for t in self._tasks):
+            return
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def send(self, bot, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        """Ставит сообщение в очередь и ждёт отправки."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._seq), bot, chat_id, text, kwargs, future))
+        return await future
+
+    async def send_many(self, bot, messages, priority=PRIORITY_BULK):
+        """
+        Рассылка [(chat_id, text, kwargs), ...] параллельно.
+        Возвращает результаты в том же порядке (Message или исключение).
+        """
+        return await asyncio.gather(
+            *(self.send(bot, chat_id, text, priority=priority, **kwargs) for chat_id, text, kwargs in messages),
+            return_exceptions=True,
+        )
+
+    async def _worker(self):
+        while True:
+            priority, _, bot, chat_id, text, kwargs, future = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                message = await self._deliver(bot, chat_id, text, kwargs)
+                if not future.done():
+                    future.set_result(message)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _wait_turn(self, chat_id):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            wait = max(self._paused_until, self._next_global, self._chat_next.get(chat_id, 0.0)) - now
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        # Между проверкой и записью нет await — другие обработчики увидят занятый слот
+        self._next_global = now + self.global_interval
+        self._chat_next[chat_id] = now + self.per_chat_interval
+        if len(self._chat_next) > 10000:
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+    async def _deliver(self, bot, chat_id, text, kwargs):
+        loop = asyncio.get_running_loop()
+        for attempt in range(MAX_ATTEMPTS):
+            await self._wait_turn(chat_id)
+            try:
+                return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                self._paused_until = max(self._paused_until, loop.time() + delay)
+                logger.warning(f"⏳ Flood control Telegram: пауза {delay} сек. (чат {chat_id})")
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+            except BadRequest:
+                raise  # Ошибка в самом сообщении/чате — повтор не поможет
+            except (TimedOut, NetworkError) as e:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"⚠️ Сбой сети при отправке в чат {chat_id}: {e}. Повтор через {2 ** attempt} сек...")
+                await asyncio.sleep(2 ** attempt)
+
+
+dispatcher = MessageDispatcher()
+
+print("✅ Модуль dispatcher.py загружен.")
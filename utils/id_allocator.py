@@ -0,0 +1,115 @@
+# utils/id_allocator.py
+"""
+Выдача ID записей без поиска максимума по листу.
+
+Раньше finalize_booking на каждую запись искал максимальный ID среди всех строк
+листа «Записи», а две одновременные записи могли получить один и тот же ID.
+Теперь последовательность хранится в SQLite (IDS_DB) и увеличивается в одной
+транзакции BEGIN IMMEDIATE: ID уникальны между корутинами, потоками и даже
+несколькими процессами бота на одной машине, а после перезапуска
+последовательность продолжается.
+
+Последовательность засевается один раз (seed) и сдвигается вперёд, если в листе
+появились ID больше выданных (строки, добавленные вручную): allocator
+подписан на records_repo и видит каждую загруженную или изменённую строку.
+
+Пример:
+    record_id = str(id_allocator.allocate("records"))
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+from .records import records_repo
+from .outbox import outbox
+
+logger = logging.getLogger(__name__)
+
+IDS_PATH = os.getenv("IDS_DB", "ids.db")
+RECORDS_SEQUENCE = "records"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class IdAllocator:
+    def __init__(self, path=IDS_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()  # Одно соединение на процесс — вызовы из разных потоков по очереди
+        self._seeds = {}  # Последовательность -> функция, возвращающая текущий максимальный ID
+        self._known = {}  # Последовательность -> значение, которое точно уже не выдать повторно
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def seed_with(self, name, func):
+        """func() → максимальный уже занятый ID; вызывается, если последовательности ещё нет."""
+        self._seeds[name] = func
+
+    def _bump(self, name, floor, step):
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")  # Блокирует запись и для других процессов
+            try:
+                row = conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()
+                if row is None and floor is None and name in self._seeds:
+                    floor = self._seeds[name]()
+                    logger.info(f"🔢 Последовательность {name} засеяна значением {floor}")
+                current = max(row[0] if row else 0, floor or 0)
+                value = current + step
+                conn.execute(
+                    "INSERT INTO sequences (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                    (name, value),
+                )
+                conn.execute("COMMIT")
+                self._known[name] = value
+                return value
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def allocate(self, name=RECORDS_SEQUENCE) -> int:
+        """Следующий свободный ID последовательности."""
+        return self._bump(name, None, 1)
+
+    def observe(self, name, value):
+        """ID value уже занят (например, строка добавлена вручную) — следующие будут больше."""
+        try:
+            value = int(value)
+            if value <= self._known.get(name, -1):
+                return  # Уже учтено — без транзакции
+            self._bump(name, value, 0)
+        except (TypeError, ValueError):
+            pass
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось сдвинуть последовательность {name}: {e}")
+
+    # --- подписка на records_repo ---
+
+    def on_records_reset(self, records):
+        self.observe(RECORDS_SEQUENCE, max((int(r.id) for r in records if r.id.isdigit()), default=0))
+
+    def on_record_changed(self, rec):
+        if rec.id.isdigit():
+            self.observe(RECORDS_SEQUENCE, rec.id)
+
+
+id_allocator = records_repo.subscribe(IdAllocator())
+# Первый запуск: продолжаем после максимального ID в листе и в ещё не отправленных записях
+id_allocator.seed_with(
+    RECORDS_SEQUENCE, lambda: max(records_repo.max_numeric_id(), outbox.max_pending_record_id())
+)
+
+print("✅ Модуль id_allocator.py загружен.")
@@ -0,0 +1,378 @@
+# utils/outbox.py
+"""
+Надёжная очередь записей в Google (outbox) на SQLite.
+
+Обработчик не ждёт Sheets и Calendar: он кладёт операции в локальную базу
+(несколько миллисекунд), сразу применяет их к кэшам в памяти (records_repo,
+calendar_mirror) и отвечает пользователю. Фоновый сброс выполняет операции
+строго в порядке постановки.
+
+- У каждой операции есть ключ идемпотентности: повторная постановка с тем же
+  ключом игнорируется.
+- Перед выполнением операция помечается начатой (attempts + 1). Если бот упал
+  после записи в Google, но до отметки «done» (или ответ append потерялся по
+  таймауту), при повторе добавление строки сначала ищет запись с таким ID в
+  индексе строк (row_index) и только если её там нет — в колонке A листа.
+- Добавление записи ставится с ключом брони (booking:<booking_key>, см.
+  finalize_booking): find() по этому ключу отвечает, оформлена ли уже бронь,
+  поэтому повторное «Подтвердить» не добавляет вторую строку.
+- После перезапуска незавершённые операции остаются в базе и выполняются при
+  первом сбросе.
+- Операция, не прошедшая MAX_ATTEMPTS раз, помечается failed и больше не
+  задерживает очередь; админы получают уведомление. Если в payload есть
+  "compensate" — список {"kind", "payload"}, — эти операции ставятся в очередь
+  (например, удаление события календаря, если запись так и не попала в лист).
+- Операции одной пачки (batch, например все записи одной брони) независимы и
+  выполняются одновременно через asyncio.gather, каждая не дольше STEP_TIMEOUT.
+  Сортировка (BARRIER_KINDS) выполняется отдельно, после всего, что стоит перед ней.
+- Операция с after=<ключ> выполняется, только если операция с этим ключом
+  выполнена; если та отброшена (failed), зависимая тоже отбрасывается без
+  выполнения (например, отмена старой записи при переносе, если новая не записалась).
+
+Пример:
+    outbox.enqueue("sheets_append", {"range": "Записи!A3:O", "rows": [row], "record_id": "42"},
+                   key="42:append", batch="record:42")
+    outbox.kick()
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import SHEET_ID
+from .async_google import sheets, calendar
+from .records import records_repo
+from .row_index import row_index
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = os.getenv("OUTBOX_DB", "outbox.db")
+FLUSH_INTERVAL = 10  # Секунды между периодическими сбросами (страховка к kick)
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 5  # Базовая пауза перед повтором неудачной операции, секунды
+STEP_TIMEOUT = 60  # Секунды на одну операцию (включая повторы внутри async_google)
+# Неидемпотентная запись (sheets_append) при таймауте сначала дожидается ответа Google
+# (run_blocking), поэтому повтор _sheets_append проверяет уже завершившуюся попытку
+BARRIER_KINDS = {"sheets_sort_records"}  # Не выполняются одновременно с другими операциями
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    next_try_at REAL NOT NULL DEFAULT 0,
+    done_at REAL,
+    batch TEXT,
+    after_key TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, id);
+"""
+
+
+# --- Операции ---
+
+async def _sheets_append(payload, retried):
+    record_id = payload.get("record_id")
+    if retried and record_id:
+        # Прошлая попытка могла успеть записать строку — сначала индекс строк (без запроса)
+        sheet = payload["range"].split("!")[0]
+        if row_index.lookup(SHEET_ID, sheet, record_id):
+            logger.info(f"♻️ Запись {record_id} уже есть в таблице (индекс строк), повтор не нужен")
+            return True
+        generation = row_index.generation(SHEET_ID, sheet)
+        ids = await sheets.get(f"{sheet}!A3:A")
+        if ids is None:
+            return False
+        row_index.load_column(SHEET_ID, sheet, ids, generation)  # Пригодится update_row_by_id
+        if any(row and str(row[0]).strip() == record_id for row in ids):
+            logger.info(f"♻️ Запись {record_id} уже есть в таблице, повтор не нужен")
+            return True
+    return await sheets.append(payload["range"], payload["rows"])
+
+
+async def _sheets_update_row_by_id(payload, retried):
+    return await sheets.update_row_by_id(payload["sheet"], payload["record_id"], payload["values"])
+
+
+async def _sheets_sort_records(payload, retried):
+    if await sheets.sort_records():
+        records_repo.invalidate()  # Порядок строк изменился — номера строк устарели
+        return True
+    return False
+
+
+async def _calendar_update(payload, retried):
+    return await calendar.update_event(
+        payload["event_id"],
+        summary=payload.get("summary"),
+        start_time=payload.get("start_time"),
+        end_time=payload.get("end_time"),
+        color_id=payload.get("color_id"),
+        description=payload.get("description"),
+    )
+
+
+async def _calendar_delete(payload, retried):
+    return await calendar.delete_event(payload["event_id"])
+
+
+HANDLERS = {
+    "sheets_append": _sheets_append,
+    "sheets_update_row_by_id": _sheets_update_row_by_id,
+    "sheets_sort_records": _sheets_sort_records,
+    "calendar_update": _calendar_update,
+    "calendar_delete": _calendar_delete,
+}
+
+
+class Outbox:
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+        self._conn = None
+        self._flush_lock = None  # asyncio.Lock создаётся в event loop
+        self._task = None
+        self.on_failed = None  # async callback(kind, payload, error) — операция отброшена
+        self._readers = threading.local()  # Соединения для чтения из пула google-io (WAL)
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+            if "batch" not in columns:  # База, созданная до появления пачек
+                with self._conn:
+                    self._conn.execute("ALTER TABLE outbox ADD COLUMN batch TEXT")
+            if "after_key" not in columns:  # ... и до появления зависимостей
+                with self._conn:
+                    self._conn.execute("ALTER TABLE outbox ADD COLUMN after_key TEXT")
+            pending = self.pending_count()
+            if pending:
+                logger.warning(f"📮 В outbox осталось {pending} незавершённых операций — будут выполнены")
+        return self._conn
+
+    def enqueue(self, kind, payload, key, batch=None, after=None) -> bool:
+        """
+        Ставит операцию в очередь. False — операция с таким ключом уже поставлена или выполнена.
+        Ключ операции со статусом failed освобождается: повтор после компенсации разрешён.
+        Подряд идущие операции с одним batch выполняются одновременно.
+        after — ключ операции, которая должна успешно выполниться раньше этой.
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f"Неизвестная операция outbox: {kind}")
+        with self.conn:
+            # Неудачная строка остаётся для разбора, но под другим ключом
+            self.conn.execute(
+                "UPDATE outbox SET key = key || ':failed:' || id WHERE key = ? AND status = 'failed'", (key,)
+            )
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO outbox (key, kind, payload, created_at, batch, after_key) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload, ensure_ascii=False), time.time(), batch, after),
+            )
+        if cursor.rowcount == 0:
+            logger.info(f"♻️ Операция outbox {key} уже поставлена, пропускаем")
+            return False
+        return True
+
+    def find(self, key):
+        """payload поставленной или выполненной операции с ключом key; None — ключ свободен или операция не удалась."""
+        row = self.conn.execute(
+            "SELECT payload FROM outbox WHERE key = ? AND status != 'failed'", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pending_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+    def pending_payloads(self, kind):
+        rows = self.conn.execute(
+            "SELECT payload FROM outbox WHERE status = 'pending' AND kind = ? ORDER BY id", (kind,)
+        ).fetchall()
+        return [json.loads(p) for (p,) in rows]
+
+    def pending_ops(self, kinds):
+        """
+        [(id, kind, payload)] незавершённых операций данных видов по порядку.
+        Можно вызывать из любого потока: у каждого потока своё соединение для чтения.
+        """
+        if threading.current_thread() is threading.main_thread():
+            conn = self.conn
+        else:
+            conn = getattr(self._readers, "conn", None)
+            if conn is None:
+                # Основное соединение (self.conn) здесь не трогаем: sqlite3 привязывает его к
+                # создавшему потоку, и event loop потом не смог бы им пользоваться.
+                # Таблица создаётся и своим соединением: выбираемые колонки есть во всех версиях схемы
+                conn = sqlite3.connect(self.path)
+                conn.executescript(_SCHEMA)
+                self._readers.conn = conn
+        marks = ", ".join("?" * len(kinds))
+        rows = conn.execute(
+            f"SELECT id, kind, payload FROM outbox WHERE status = 'pending' AND kind IN ({marks}) ORDER BY id",
+            tuple(kinds),
+        ).fetchall()
+        return [(op_id, kind, json.loads(payload)) for op_id, kind, payload in rows]
+
+    def max_pending_record_id(self) -> int:
+        """Максимальный числовой ID среди ещё не записанных в таблицу строк."""
+        ids = [p.get("record_id", "") for p in self.pending_payloads("sheets_append")]
+        return max((int(i) for i in ids if str(i).isdigit()), default=0)
+
+    def kick(self):
+        """Запускает сброс в фоне, не дожидаясь его."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.flush())
+
+    def _next_group(self):
+        """
+        Головная операция и идущие за ней операции той же пачки, готовые к выполнению.
+        None — очередь пуста или голова ждёт повтора (порядок важнее скорости).
+        """
+        rows = self.conn.execute(
+            "SELECT id, key, kind, payload, attempts, next_try_at, batch, after_key FROM outbox "
+            "WHERE status = 'pending' ORDER BY id LIMIT 50"
+        ).fetchall()
+        if not rows or rows[0][5] > time.time():
+            return None
+        head = rows[0]
+        if head[6] is None or head[2] in BARRIER_KINDS:
+            return [head]
+        group = []
+        for row in rows:
+            if row[6] != head[6] or row[2] in BARRIER_KINDS or row[5] > time.time():
+                break
+            if row is not head and self._status(row[7]) == "pending":
+                break  # Зависит от операции, которая ещё выполняется в этой же пачке
+            group.append(row)
+        return group
+
+    def _status(self, key):
+        """Статус операции с ключом key; None — ключа нет (или выполненная уже удалена purge)."""
+        if not key:
+            return None
+        row = self.conn.execute("SELECT status FROM outbox WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _drop_dependent(self, row):
+        """Операция, от которой зависит row, отброшена — row не выполняется."""
+        op_id, key, kind, _, _, _, _, after = row
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?",
+                (f"не выполнена: отброшена операция {after}", op_id),
+            )
+        logger.warning(f"⏭️ Операция outbox {key} ({kind}) пропущена: отброшена {after}")
+        if kind.startswith("sheets_"):
+            records_repo.invalidate()  # Локально применённое изменение не попадёт в лист
+
+    async def _run(self, row):
+        """Выполняет одну операцию; (успех, ошибка)."""
+        op_id, key, kind, payload, attempts, _, _, _ = row
+        with self.conn:
+            self.conn.execute("UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", (op_id,))
+        try:
+            ok = await asyncio.wait_for(HANDLERS[kind](json.loads(payload), attempts > 0), timeout=STEP_TIMEOUT)
+            return ok, None if ok else "операция вернула False"
+        except asyncio.TimeoutError:
+            return False, f"таймаут {STEP_TIMEOUT} сек."
+        except Exception as e:
+            return False, str(e)
+
+    async def flush(self) -> int:
+        """Выполняет готовые операции по порядку (пачки — одновременно); останавливается на неудачной."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        done = 0
+        async with self._flush_lock:
+            while True:
+                group = self._next_group()
+                if not group:
+                    break
+                for row in [r for r in group if self._status(r[7]) == "failed"]:
+                    self._drop_dependent(row)
+                    group.remove(row)
+                if not group:
+                    continue
+                results = await asyncio.gather(*(self._run(row) for row in group))
+                blocked = False
+                for row, (ok, error) in zip(group, results):
+                    if ok:
+                        with self.conn:
+                            self.conn.execute(
+                                "UPDATE outbox SET status = 'done', done_at = ?, last_error = NULL WHERE id = ?",
+                                (time.time(), row[0]),
+                            )
+                        done += 1
+                    elif not await self._failed(row, error):
+                        blocked = True
+                if blocked:
+                    break
+        if done:
+            logger.info(f"📮 Outbox: выполнено операций: {done}")
+        return done
+
+    async def _failed(self, row, error) -> bool:
+        """Учитывает неудачу. True — операция отброшена и очередь может идти дальше."""
+        op_id, key, kind, payload, attempts, _, _, _ = row
+        attempts += 1
+        if attempts < MAX_ATTEMPTS:
+            delay = RETRY_DELAY * 2 ** (attempts - 1)
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE outbox SET last_error = ?, next_try_at = ? WHERE id = ?",
+                    (error, time.time() + delay, op_id),
+                )
+            logger.warning(f"⚠️ Операция outbox {key} ({kind}) не удалась: {error}. Повтор через {delay} сек.")
+            return False
+
+        with self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'failed', last_error = ? WHERE id = ?", (error, op_id)
+            )
+        logger.error(f"❌ Операция outbox {key} ({kind}) отброшена после {attempts} попыток: {error}")
+        payload = json.loads(payload)
+        if kind.startswith("sheets_"):
+            records_repo.invalidate()  # В памяти может остаться то, чего нет в листе
+        for i, step in enumerate(payload.get("compensate") or ()):
+            try:
+                self.enqueue(step["kind"], step["payload"], key=f"{key}:compensate:{i}")
+                logger.warning(f"↩️ Компенсация для {key}: {step['kind']}")
+            except (KeyError, ValueError) as e:
+                logger.error(f"❌ Некорректная компенсация для {key}: {e}")
+        if self.on_failed:
+            try:
+                await self.on_failed(kind, payload, error)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика on_failed outbox: {e}")
+        return True
+
+    def purge(self, older_than=7 * 24 * 3600):
+        """Удаляет выполненные операции старше older_than секунд."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM outbox WHERE status = 'done' AND done_at < ?", (time.time() - older_than,)
+            )
+
+
+outbox = Outbox()
+# Незаписанные строки «Записи» не пропадают из памяти при перезагрузке листа
+records_repo.set_pending_source(lambda: outbox.pending_ops(("sheets_append", "sheets_update_row_by_id")))
+
+
+async def flush_outbox_job(context):
+    """Периодическая задача: страховочный сброс outbox (в т.ч. после перезапуска)."""
+    await outbox.flush()
+
+
+print("✅ Модуль outbox.py загружен.")
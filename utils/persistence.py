@@ -0,0 +1,214 @@
+# utils/persistence.py
+"""
+Хранение user_data / chat_data / bot_data бота в SQLite вместо PicklePersistence.
+
+PicklePersistence при каждом сохранении заново сериализовал весь словарь всех
+сессий в один файл, поэтому main() удалял bot_data.pickle при старте, а
+незавершённые записи (temp_booking, state) терялись при каждом деплое.
+
+Теперь каждая сессия — отдельная строка таблицы (вид, ID, pickle данных):
+- update_user_data пишет только одного пользователя (PTB вызывает его лишь для
+  тех, кого коснулись апдейты и задачи), и только если данные изменились;
+- при старте в память загружаются сессии, активные за PRELOAD_WINDOW (их видят
+  cleanup_stuck_reservations_job и release_reservation), остальные — лениво,
+  при первом апдейте пользователя (refresh_user_data);
+- WAL и synchronous=NORMAL: запись — доли миллисекунды, поэтому UPDATE_INTERVAL
+  короткий и состояние диалога после перезапуска почти не отстаёт.
+
+Пример:
+    persistence = SQLitePersistence()
+    application = ApplicationBuilder().token(TOKEN).persistence(persistence).build()
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import time
+
+from telegram.ext import BasePersistence
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_DB", "bot_data.db")
+UPDATE_INTERVAL = 5  # Секунды между сохранениями изменённых сессий (PTB по умолчанию — 60)
+PRELOAD_WINDOW = 2 * 60 * 60  # Сессии, менявшиеся за это время, загружаются при старте
+
+USER, CHAT, BOT, CALLBACK = "user", "chat", "bot", "callback"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    blob BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+CREATE INDEX IF NOT EXISTS data_updated ON data (kind, updated_at);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+
+def _digest(blob) -> bytes:
+    return hashlib.blake2b(blob, digest_size=16).digest()
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, path=PERSISTENCE_PATH, update_interval=UPDATE_INTERVAL, preload_window=PRELOAD_WINDOW):
+        super().__init__(update_interval=update_interval)
+        self.path = path
+        self.preload_window = preload_window
+        self._conn = None
+        self._loaded = {USER: set(), CHAT: set()}  # Чьи данные уже в памяти приложения
+        self._digests = {}  # (вид, ID) -> хэш последнего сохранённого pickle
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    # --- чтение и запись строк ---
+
+    def _read(self, kind, key):
+        row = self.conn.execute("SELECT blob FROM data WHERE kind = ? AND id = ?", (kind, key)).fetchone()
+        if row is None:
+            return None
+        try:
+            value = pickle.loads(row[0])
+        except Exception as e:
+            logger.error(f"❌ Не удалось прочитать сохранённые данные {kind} {key}: {e}")
+            return None
+        self._digests[(kind, key)] = _digest(row[0])
+        return value
+
+    def _write(self, kind, key, value):
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.error(f"❌ Не удалось сериализовать данные {kind} {key}: {e}")
+            return
+        digest = _digest(blob)
+        if self._digests.get((kind, key)) == digest:
+            return  # Не изменились — не пишем
+        self.conn.execute(
+            "INSERT INTO data (kind, id, blob, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(kind, id) DO UPDATE SET blob = excluded.blob, updated_at = excluded.updated_at",
+            (kind, key, blob, time.time()),
+        )
+        self._digests[(kind, key)] = digest
+
+    def _drop(self, kind, key):
+        self.conn.execute("DELETE FROM data WHERE kind = ? AND id = ?", (kind, key))
+        self._digests.pop((kind, key), None)
+        self._loaded.get(kind, set()).discard(key)
+
+    def _preload(self, kind) -> dict:
+        """Сессии вида kind, менявшиеся за preload_window; остальные подгрузит _refresh."""
+        rows = self.conn.execute(
+            "SELECT id FROM data WHERE kind = ? AND updated_at > ?", (kind, time.time() - self.preload_window)
+        ).fetchall()
+        result = {}
+        for (key,) in rows:
+            value = self._read(kind, key)
+            if value is not None:
+                result[key] = value
+            self._loaded[kind].add(key)
+        if result:
+            logger.info(f"💾 Восстановлено сессий ({kind}): {len(result)}")
+        return result
+
+    def _refresh(self, kind, key, data):
+        """Первый апдейт от пользователя/чата после старта: подмешиваем сохранённые данные."""
+        if key in self._loaded[kind]:
+            return
+        self._loaded[kind].add(key)
+        stored = self._read(kind, key)
+        if stored:
+            for name, value in stored.items():
+                data.setdefault(name, value)
+
+    # --- BasePersistence ---
+
+    async def get_user_data(self):
+        return self._preload(USER)
+
+    async def get_chat_data(self):
+        return self._preload(CHAT)
+
+    async def get_bot_data(self):
+        return self._read(BOT, 0) or {}
+
+    async def get_callback_data(self):
+        return self._read(CALLBACK, 0)
+
+    async def get_conversations(self, name):
+        rows = self.conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name, key, new_state):
+        if new_state is None:
+            self.conn.execute(
+                "DELETE FROM conversations WHERE name = ? AND key = ?", (name, json.dumps(list(key)))
+            )
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+            (name, json.dumps(list(key)), pickle.dumps(new_state)),
+        )
+
+    async def update_user_data(self, user_id, data):
+        self._loaded[USER].add(user_id)
+        self._write(USER, user_id, data)
+
+    async def update_chat_data(self, chat_id, data):
+        self._loaded[CHAT].add(chat_id)
+        self._write(CHAT, chat_id, data)
+
+    async def update_bot_data(self, data):
+        self._write(BOT, 0, data)
+
+    async def update_callback_data(self, data):
+        self._write(CALLBACK, 0, data)
+
+    async def drop_user_data(self, user_id):
+        self._drop(USER, user_id)
+
+    async def drop_chat_data(self, chat_id):
+        self._drop(CHAT, chat_id)
+
+    async def refresh_user_data(self, user_id, user_data):
+        self._refresh(USER, user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        self._refresh(CHAT, chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data):
+        pass  # bot_data целиком загружается при старте
+
+    async def flush(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # --- обслуживание ---
+
+    def purge(self, older_than=30 * 24 * 3600) -> int:
+        """Удаляет сессии пользователей и чатов, не менявшиеся older_than секунд."""
+        cursor = self.conn.execute(
+            "DELETE FROM data WHERE kind IN (?, ?) AND updated_at < ?", (USER, CHAT, time.time() - older_than)
+        )
+        self._digests.clear()  # Удалённые строки должны быть записаны заново при изменении
+        return cursor.rowcount
+
+
+print("✅ Модуль persistence.py загружен.")
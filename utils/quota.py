@@ -0,0 +1,143 @@
+# utils/quota.py
+"""
+Общий бюджет запросов к Google API с приоритетами.
+
+Квоты Google считаются на пользователя (у бота это один сервисный аккаунт),
+поэтому клики клиентов, действия админов и фоновые задачи тратят один и тот же
+лимит. Перед каждым HTTP-запросом (см. _GuardedHttpRequest в safe_google.py)
+берётся токен из корзины своего бюджета: чтение Sheets, запись Sheets, Calendar.
+
+Приоритет берётся из contextvar текущей задачи:
+- PRIORITY_INTERACTIVE — обработка действий клиента (ставится для каждого апдейта);
+- PRIORITY_ADMIN — действия администраторов;
+- PRIORITY_BACKGROUND — фоновые задачи (значение по умолчанию).
+
+Низкий приоритет не может опустошить корзину ниже своего «пола» (RESERVE) и
+пропускает вперёд ожидающих с более высоким приоритетом. Если токена нет дольше
+MAX_WAIT, запрос сбрасывается: вызывающий код получает обычный None/False и
+остаётся на кэше.
+"""
+import contextvars
+import logging
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_ADMIN = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_NAMES = ("interactive", "admin", "background")
+
+# Запросов в минуту на бюджет (лимиты Google на пользователя с запасом)
+BUDGETS = {
+    "sheets_read": 60,
+    "sheets_write": 60,
+    "calendar": 300,
+}
+RESERVE = (0.0, 0.2, 0.5)  # Доля корзины, которую приоритет не может занять
+MAX_WAIT = (10.0, 5.0, 1.0)  # Секунды ожидания токена, после чего запрос сбрасывается
+
+_priority = contextvars.ContextVar("google_priority", default=PRIORITY_BACKGROUND)
+
+
+def set_google_priority(priority: int):
+    """Приоритет запросов к Google для текущей задачи (и порождённых ею)."""
+    _priority.set(priority)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def google_priority(priority: int):
+    """Декоратор async-функции: все её запросы к Google идут с данным приоритетом."""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            token = _priority.set(priority)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _priority.reset(token)
+        return wrapper
+    return decorator
+
+
+class TokenBucket:
+    def __init__(self, name, per_minute, reserve=RESERVE, max_wait=MAX_WAIT):
+        self.name = name
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # Токенов в секунду
+        self.tokens = self.capacity
+        self.floors = [share * self.capacity for share in reserve]
+        self.max_wait = max_wait
+        self.granted = [0, 0, 0]
+        self.shed = [0, 0, 0]
+        self._updated = time.monotonic()
+        self._waiting = [0, 0, 0]
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int) -> bool:
+        """Берёт токен (ожидая в потоке не дольше max_wait); False — запрос сброшен."""
+        floor = self.floors[priority]
+        deadline = time.monotonic() + self.max_wait[priority]
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    ahead = any(self._waiting[p] for p in range(priority))
+                    if not ahead and self.tokens - 1 >= floor:
+                        self.tokens -= 1
+                        self.granted[priority] += 1
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed[priority] += 1
+                        logger.warning(
+                            f"🚦 Квота {self.name}: запрос ({PRIORITY_NAMES[priority]}) сброшен, "
+                            f"осталось токенов {self.tokens:.1f}"
+                        )
+                        return False
+                    shortage = max(floor + 1 - self.tokens, 0) / self.rate
+                    self._cond.wait(min(remaining, max(shortage, 0.05)))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                "tokens": round(self.tokens, 1),
+                "granted": dict(zip(PRIORITY_NAMES, self.granted)),
+                "shed": dict(zip(PRIORITY_NAMES, self.shed)),
+            }
+
+
+_buckets = {name: TokenBucket(name, per_minute) for name, per_minute in BUDGETS.items()}
+
+
+def acquire_quota(api: str, method: str = "GET") -> bool:
+    """Токен на один HTTP-запрос к api ('sheets' / 'calendar') с приоритетом текущей задачи."""
+    if api == "sheets":
+        bucket = _buckets["sheets_read" if method == "GET" else "sheets_write"]
+    else:
+        bucket = _buckets.get(api)
+    if bucket is None:
+        return True
+    return bucket.acquire(current_priority())
+
+
+def quota_status() -> dict:
+    return {name: bucket.stats() for name, bucket in _buckets.items()}
+
+
+print("✅ Модуль quota.py загружен.")
@@ -0,0 +1,394 @@
+# utils/records.py
+"""
+Репозиторий листа «Записи» в памяти.
+
+Лист загружается один раз, строки хранятся как Record (список из 15 колонок A–O
+с именованными полями), а поверх них поддерживаются вторичные индексы:
+по ID, по (специалист, дата), по телефону, по chat_id и по статусу.
+
+Обновление данных:
+- полная перезагрузка не чаще, чем раз в FULL_RELOAD_TTL секунд;
+- между полными перезагрузками — дочитывание «хвоста» листа (строки, добавленные
+  вне бота) не чаще, чем раз в TAIL_TTL секунд;
+- собственные записи бота применяются локально (apply_append / apply_update /
+  apply_update_row): добавления и обновления по ID — сразу после постановки в
+  outbox, ещё до записи в таблицу; обновления по номеру строки — после записи.
+
+Строки, которые бот поставил в outbox, но ещё не записал в лист, накладываются
+поверх данных листа после каждой полной загрузки и дочитывания хвоста (источник —
+set_pending_source, его задаёт outbox). Поэтому перезагрузка до сброса outbox не
+теряет свежую запись, и слот не выглядит свободным. У таких строк row_number = None:
+они стоят после всех строк листа, не участвуют в нумерации, и по номеру строки
+в них писать нельзя (только по ID, через outbox).
+
+Подписчики (subscribe) узнают о каждом изменении: on_records_reset(records)
+после полной загрузки и on_record_changed(record) после добавления/изменения строки.
+
+Обработчики получают только нужное подмножество строк без сетевого запроса
+и без линейного прохода по всей истории.
+"""
+import asyncio
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import SHEET_ID
+from .safe_google import safe_get_sheet_data
+from .row_index import row_index, sheet_title
+from .async_google import run_blocking
+
+logger = logging.getLogger(__name__)
+
+SHEET_NAME = "Записи"
+FIRST_DATA_ROW = 3
+LAST_COLUMN = "O"
+COLUMNS = 15
+FULL_RELOAD_TTL = 300  # Полная перезагрузка листа
+TAIL_TTL = 15  # Проверка новых строк в конце листа
+RETRY_AFTER_FAILURE = 10  # Пауза перед повторной загрузкой после ошибки
+
+# Индексы колонок
+ID, NAME, PHONE, CATEGORY, SERVICE, SPECIALIST, DATE, TIME, STATUS = range(9)
+CREATED_AT, NOTE, REMINDER_24H, REMINDER_1H, CHAT_ID, EVENT_ID = range(9, 15)
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def excel_number_to_date_str(value) -> str:
+    """46287.0 → '08.02.2026' (бот пишет даты как числа Excel, а читает строками)."""
+    return (_EXCEL_EPOCH + timedelta(days=int(float(value)))).strftime("%d.%m.%Y")
+
+
+def phone_key(phone) -> str:
+    """Ключ индекса по телефону: только цифры."""
+    return re.sub(r"\D", "", str(phone or ""))
+
+
+class Record(list):
+    """Строка листа «Записи» с именованным доступом к колонкам и номером строки в таблице."""
+
+    __slots__ = ("row_number",)
+
+    def __init__(self, values, row_number=None):
+        super().__init__(values)
+        self.row_number = row_number
+
+    id = property(lambda self: self[ID].strip())
+    name = property(lambda self: self[NAME].strip())
+    phone = property(lambda self: self[PHONE].strip())
+    category = property(lambda self: self[CATEGORY].strip())
+    service = property(lambda self: self[SERVICE].strip())
+    specialist = property(lambda self: self[SPECIALIST].strip())
+    date = property(lambda self: self[DATE].strip())
+    time = property(lambda self: self[TIME].strip())
+    status = property(lambda self: self[STATUS].strip())
+    chat_id = property(lambda self: self[CHAT_ID].strip())
+    event_id = property(lambda self: self[EVENT_ID].strip())
+
+    @property
+    def start_time(self) -> str:
+        """Время начала из диапазона '16:45-18:30'."""
+        return self.time.split("-")[0].strip()
+
+
+def normalize_row(values) -> list:
+    """Приводит строку к виду, в котором её возвращает Sheets: 15 строковых колонок, дата 'ДД.ММ.ГГГГ'."""
+    row = ["" if v is None else v for v in list(values)[:COLUMNS]]
+    row += [""] * (COLUMNS - len(row))
+    if isinstance(row[DATE], (int, float)):
+        try:
+            row[DATE] = excel_number_to_date_str(row[DATE])
+        except (ValueError, OverflowError):
+            pass
+    return [v if isinstance(v, str) else str(v) for v in row]
+
+
+class RecordsRepository:
+    def __init__(self, spreadsheet_id=SHEET_ID):
+        self.spreadsheet_id = spreadsheet_id
+        self._records = []  # Сначала строки листа (_sheet_count), за ними — ещё не записанные
+        self._sheet_count = 0
+        self._pending_source = None
+        self._by_id = {}
+        self._by_spec_date = {}
+        self._by_phone = {}
+        self._by_chat = {}
+        self._by_status = {}
+        self._loaded = False
+        self._full_at = 0.0
+        self._tail_at = 0.0
+        self._lock = threading.RLock()
+        self._refresh_lock = None  # asyncio.Lock создаётся в event loop
+        self._listeners = []
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    def set_pending_source(self, func):
+        """func() → [(id, kind, payload)] ещё не выполненных операций outbox (из любого потока)."""
+        self._pending_source = func
+
+    def _pending_ops(self):
+        if self._pending_source is None:
+            return []
+        try:
+            return self._pending_source()
+        except Exception as e:
+            logger.error(f"❌ Не удалось прочитать незаписанные операции outbox: {e}")
+            return []
+
+    def _notify(self, method, arg):
+        for listener in self._listeners:
+            try:
+                getattr(listener, method)(arg)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика {method} листа «Записи»: {e}")
+
+    # --- индексы ---
+
+    @staticmethod
+    def _keys(rec):
+        return (
+            (rec.id, rec.specialist and rec.date and (rec.specialist, rec.date),
+             phone_key(rec.phone), rec.chat_id, rec.status)
+        )
+
+    def _index(self, pos, rec):
+        rid, spec_date, phone, chat, status = self._keys(rec)
+        for index, key in ((self._by_id, rid), (self._by_spec_date, spec_date),
+                           (self._by_phone, phone), (self._by_chat, chat),
+                           (self._by_status, status)):
+            if key:
+                index.setdefault(key, []).append(pos)
+
+    def _unindex(self, pos, rec):
+        rid, spec_date, phone, chat, status = self._keys(rec)
+        for index, key in ((self._by_id, rid), (self._by_spec_date, spec_date),
+                           (self._by_phone, phone), (self._by_chat, chat),
+                           (self._by_status, status)):
+            positions = index.get(key)
+            if positions and pos in positions:
+                positions.remove(pos)
+                if not positions:
+                    del index[key]
+
+    def _rebuild(self, rows, pending_before):
+        with self._lock:
+            self._records = []
+            self._by_id, self._by_spec_date, self._by_phone = {}, {}, {}
+            self._by_chat, self._by_status = {}, {}
+            for values in rows:
+                self._add(values, FIRST_DATA_ROW + len(self._records))
+            self._sheet_count = len(self._records)
+            self._apply_overlay(pending_before)
+            self._notify("on_records_reset", list(self._records))
+
+    def _add(self, values, row_number=None):
+        pos = len(self._records)
+        rec = Record(normalize_row(values), row_number)
+        self._records.append(rec)
+        self._index(pos, rec)
+        return rec
+
+    def _in_sheet(self, record_id) -> bool:
+        return any(p < self._sheet_count for p in self._by_id.get(record_id, ()))
+
+    def _apply_overlay(self, pending_before):
+        """
+        Накладывает незаписанные операции outbox над листом. Берётся объединение
+        снимков до чтения листа и сейчас: операция, поставленная во время чтения,
+        не пропадёт; записанная за это время уже есть в прочитанных строках.
+        """
+        ops = {op_id: (kind, payload) for op_id, kind, payload in pending_before}
+        ops.update((op_id, (kind, payload)) for op_id, kind, payload in self._pending_ops())
+        for op_id in sorted(ops):
+            kind, payload = ops[op_id]
+            if sheet_title(payload.get("range") or payload.get("sheet") or "") != SHEET_NAME:
+                continue
+            if kind == "sheets_append":
+                for values in payload.get("rows") or ():
+                    record_id = str(values[0]).strip() if values else ""
+                    if record_id and not self._in_sheet(record_id):
+                        self._add(values)
+            elif kind == "sheets_update_row_by_id":
+                positions = self._by_id.get(str(payload.get("record_id", "")).strip())
+                if positions:
+                    self._replace(positions[0], payload["values"])
+
+    def _strip_overlay(self):
+        """Убирает незаписанные строки (они стоят после строк листа)."""
+        while len(self._records) > self._sheet_count:
+            pos = len(self._records) - 1
+            self._unindex(pos, self._records.pop())
+
+    def _replace(self, pos, values):
+        old = self._records[pos]
+        self._unindex(pos, old)
+        rec = Record(normalize_row(values), old.row_number)
+        self._records[pos] = rec
+        self._index(pos, rec)
+        return rec
+
+    def _select(self, index, key):
+        with self._lock:
+            return [self._records[p] for p in index.get(key, ())]
+
+    # --- загрузка ---
+
+    def load(self):
+        """Полная синхронная загрузка листа (выполняется в пуле google-io)."""
+        generation = row_index.generation(self.spreadsheet_id, SHEET_NAME)
+        pending_before = self._pending_ops()
+        rows = safe_get_sheet_data(self.spreadsheet_id, f"{SHEET_NAME}!A{FIRST_DATA_ROW}:{LAST_COLUMN}")
+        now = time.time()
+        if rows is None:
+            logger.error("❌ Не удалось загрузить лист «Записи», используем прежние данные")
+            self._full_at = self._tail_at = now - FULL_RELOAD_TTL + RETRY_AFTER_FAILURE
+            return False
+        self._rebuild(rows, pending_before)
+        row_index.load_column(self.spreadsheet_id, SHEET_NAME, rows, generation, FIRST_DATA_ROW)
+        self._loaded = True
+        self._full_at = self._tail_at = now
+        logger.info(f"📚 Лист «Записи» загружен в память: {len(rows)} строк")
+        return True
+
+    def load_tail(self):
+        """Дочитывает строки, появившиеся в конце листа после последней загрузки."""
+        with self._lock:
+            next_row = FIRST_DATA_ROW + self._sheet_count  # Незаписанные строки бота не в счёт
+        pending_before = self._pending_ops()
+        rows = safe_get_sheet_data(
+            self.spreadsheet_id, f"{SHEET_NAME}!A{next_row}:{LAST_COLUMN}"
+        )
+        self._tail_at = time.time()
+        if not rows:
+            return 0
+        with self._lock:
+            if FIRST_DATA_ROW + self._sheet_count != next_row:
+                return 0  # Пока шёл запрос, лист перезагрузили целиком
+            # Новые строки листа встают перед незаписанными: снимаем наложение и кладём заново
+            self._strip_overlay()
+            added = []
+            for values in rows:
+                added.append(self._add(values, FIRST_DATA_ROW + len(self._records)))
+            self._sheet_count = len(self._records)
+            self._apply_overlay(pending_before)
+            for rec in added:
+                self._notify("on_record_changed", rec)
+        added = len(added)
+        if added:
+            logger.info(f"📚 Дочитано {added} новых строк листа «Записи»")
+        return added
+
+    async def ensure_fresh(self):
+        now = time.time()
+        if self._loaded and now - self._tail_at < TAIL_TTL and now - self._full_at < FULL_RELOAD_TTL:
+            return
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            now = time.time()
+            if not self._loaded or now - self._full_at >= FULL_RELOAD_TTL:
+                await run_blocking(self.load, default=False)
+            elif now - self._tail_at >= TAIL_TTL:
+                await run_blocking(self.load_tail, default=0)
+
+    def invalidate(self):
+        """Следующее обращение перечитает лист целиком (например, после сортировки)."""
+        self._full_at = 0.0
+
+    # --- чтение ---
+
+    async def all(self):
+        await self.ensure_fresh()
+        with self._lock:
+            return list(self._records)
+
+    async def get(self, record_id):
+        """Первая строка с данным ID (как при поиске сверху вниз)."""
+        found = await self.by_id(record_id)
+        return found[0] if found else None
+
+    async def by_id(self, record_id):
+        await self.ensure_fresh()
+        return self._select(self._by_id, str(record_id).strip())
+
+    async def by_specialist_date(self, specialist, date_str):
+        await self.ensure_fresh()
+        return self._select(self._by_spec_date, (str(specialist).strip(), str(date_str).strip()))
+
+    async def by_phone(self, phone):
+        await self.ensure_fresh()
+        return self._select(self._by_phone, phone_key(phone))
+
+    async def by_chat_id(self, chat_id):
+        await self.ensure_fresh()
+        return self._select(self._by_chat, str(chat_id).strip())
+
+    async def by_status(self, status):
+        await self.ensure_fresh()
+        return self._select(self._by_status, status)
+
+    async def for_client(self, chat_id, phone=None):
+        """Записи клиента по chat_id и (если задан) телефону, в порядке листа."""
+        await self.ensure_fresh()
+        with self._lock:
+            positions = set(self._by_chat.get(str(chat_id).strip(), ()))
+            if phone:
+                positions.update(self._by_phone.get(phone_key(phone), ()))
+            return [self._records[p] for p in sorted(positions)]
+
+    def cached_by_specialist_date(self, specialist, date_str):
+        """Записи специалиста на дату из памяти (без проверки свежести и без await)."""
+        return self._select(self._by_spec_date, (str(specialist).strip(), str(date_str).strip()))
+
+    def by_row(self, row_number):
+        """Строка по номеру в таблице из памяти (без проверки свежести)."""
+        with self._lock:
+            pos = row_number - FIRST_DATA_ROW
+            return self._records[pos] if 0 <= pos < self._sheet_count else None
+
+    def max_numeric_id(self) -> int:
+        with self._lock:
+            return max((int(k) for k in self._by_id if k.isdigit()), default=0)
+
+    # --- локальное применение записей бота ---
+
+    def apply_append(self, values):
+        """Строка поставлена в outbox: видна сразу, номер строки появится после записи в лист."""
+        with self._lock:
+            rec = self._add(values)
+            self._notify("on_record_changed", rec)
+            return rec
+
+    def apply_update(self, record_id, values):
+        """Как safe_update_sheet_row_by_id: обновляет первую строку с данным ID."""
+        with self._lock:
+            positions = self._by_id.get(str(record_id).strip())
+            if not positions:
+                return None
+            rec = self._replace(positions[0], values)
+            self._notify("on_record_changed", rec)
+            return rec
+
+    def apply_update_row(self, row_number, values):
+        with self._lock:
+            pos = (row_number or 0) - FIRST_DATA_ROW
+            if 0 <= pos < self._sheet_count:
+                rec = self._replace(pos, values)
+                self._notify("on_record_changed", rec)
+                return rec
+        return None
+
+
+records_repo = RecordsRepository()
+
+
+async def refresh_records_job(context):
+    """Периодическая задача: подтягивает строки, добавленные или изменённые вне бота."""
+    await records_repo.ensure_fresh()
+
+print("✅ Модуль records.py загружен.")
@@ -1,81 +1,210 @@
 # utils/reminders.py
+"""
+Напоминания клиентам за 24 часа и за 1 час до записи.
+
+Вместо опроса листа «Записи» раз в минуту время каждого напоминания
+вычисляется один раз — при загрузке листа и при каждом изменении записи
+(RecordsRepository уведомляет подписчиков). Сроки лежат в min-куче, а на
+ближайший из них ставится ровно один job_queue.run_once. Перенос, отмена
+или отметка «✅» просто пересчитывают сроки записи; устаревшие элементы
+кучи отбрасываются при извлечении.
+"""
+import asyncio
+import heapq
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
 import pytz
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from config import TIMEZONE, SHEET_ID
-from .safe_google import safe_get_sheet_data, safe_update_sheet_row
+from .async_google import sheets, calendar
+from .write_behind import write_buffer
+from .records import records_repo, REMINDER_24H, REMINDER_1H
 from .admin import notify_admins
+from .dispatcher import dispatcher, PRIORITY_BULK
+from .quota import google_priority, PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
-async def send_reminders(context):
-    """
-    Фоновая задача: отправляет напоминания за 24ч и 1ч.
-    """
-    now = datetime.now(TIMEZONE)
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A2:P")
-
-    for i, row in enumerate(records, start=2): # start=2, потому что A2:P
-        if len(row) < 15 or row[8] != "подтверждено": # [8] = Статус
-            continue
-
-        record_id = row[0] # [0] = ID
-        name = row[1] # [1] = Имя
-        phone = row[2] # [2] = Телефон
-        date_str = row[6] # [6] = Дата
-        time_str = row[7] # [7] = Время
-        chat_id = row[13] # [13] = chat_id
-
-        try:
-            # Если время в формате "16:45-18:30", берем только начало
-            if "-" in time_str:
-                time_str = time_str.split("-")[0].strip()
-            
-            event_time = datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
-            event_time = TIMEZONE.localize(event_time)
-        except ValueError:
-            logger.error(f"❌ Неверный формат даты/времени в записи {record_id}: {date_str} {time_str}")
-            continue
-
-        # --- Напоминание за 24 часа ---
-        if abs((event_time - now).total_seconds() - 24*3600) < 300 and row[11] == "❌": # [11] = Напоминание 24ч
-            try:
-                # Загружаем текст из настроек (псевдокод, нужно реализовать get_setting)
-                # message_text = get_setting("Текст напоминания 24ч", f"Напоминаем: завтра у вас запись на {row[4]} к {row[5]} в {time_str}.")
-                message_text = f"Напоминаем: завтра у вас запись на {row[4]} к {row[5]} в {time_str}." # Временно
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=message_text,
-                    reply_markup=build_confirm_cancel_kb(record_id) # См. ниже
-                )
-                # Обновляем статус напоминания 24ч на "✅"
-                updated_row = row.copy()
-                updated_row[11] = "✅"
-                safe_update_sheet_row(SHEET_ID, "Записи", i, updated_row)
-                logger.info(f"📤 24ч напоминание отправлено {name} (ID: {record_id})")
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки 24ч напоминания {record_id}: {e}")
-                # Уведомляем админа
-                # admin_message = get_setting("Текст уведомления админу об ошибке", f"❌ Не удалось отправить напоминание клиенту {name}. Позвоните: {phone}.")
-                admin_message = f"❌ Не удалось отправить напоминание клиенту {name}. Позвоните: {phone}. Ошибка: {e}"
-                await notify_admins(context, admin_message)
+# (вид, за сколько до начала, колонка-отметка)
+REMINDERS = (
+    ("24h", timedelta(hours=24), REMINDER_24H),
+    ("1h", timedelta(hours=1), REMINDER_1H),
+)
+LATE_GRACE = 300  # Напоминание, опоздавшее больше чем на 5 минут (бот был выключен), не отправляем
 
-        # --- Напоминание за 1 час ---
-        if abs((event_time - now).total_seconds() - 3600) < 300 and row[12] == "❌": # [12] = Напоминание 1ч
-            try:
-                # message_text = get_setting("Текст напоминания 1ч", f"Через час у вас приём. Не опаздывайте!")
-                message_text = f"Через час у вас приём. Не опаздывайте!"
-                await context.bot.send_message(chat_id=chat_id, text=message_text)
-                # Обновляем статус напоминания 1ч на "✅"
-                updated_row = row.copy()
-                updated_row[12] = "✅"
-                safe_update_sheet_row(SHEET_ID, "Записи", i, updated_row)
-                logger.info(f"📤 1ч напоминание отправлено {name} (ID: {record_id})")
-            except Exception as e:
-                logger.error(f"❌ Ошибка отправки 1ч напоминания {record_id}: {e}")
-                admin_message = f"❌ Не удалось отправить 1ч напоминание клиенту {name}. Позвоните: {phone}. Ошибка: {e}"
-                await notify_admins(context, admin_message)
+def reminder_due_times(row) -> dict:
+    """{вид: timestamp} для неотправленных напоминаний подтверждённой записи."""
+    if row.status != "подтверждено" or not row.chat_id:
+        return {}
+    try:
+        event_time = TIMEZONE.localize(
+            datetime.strptime(f"{row.date} {row.start_time}", "%d.%m.%Y %H:%M")
+        )
+    except ValueError:
+        return {}
+    return {
+        kind: (event_time - before).timestamp()
+        for kind, before, column in REMINDERS
+        if row[column] == "❌"
+    }
+
+class ReminderScheduler:
+    def __init__(self):
+        self._heap = []  # (timestamp, номер строки, вид)
+        self._due = {}  # (номер строки, вид) -> актуальный timestamp
+        self._sent = set()  # (ID, вид, timestamp): отметка «✅» могла ещё не дойти до таблицы
+        self._lock = threading.Lock()
+        self._job_queue = None
+        self._loop = None
+        self._job = None
+        self._armed_at = None
+
+    # --- подписка на RecordsRepository (может вызываться из пула google-io) ---
+
+    def on_records_reset(self, records):
+        now = time.time()
+        with self._lock:
+            self._due = {}
+            self._sent = {s for s in self._sent if now - s[2] <= LATE_GRACE}
+            for row in records:
+                self._put(row, now)
+            self._heap = [(due, row, kind) for (row, kind), due in self._due.items()]
+            heapq.heapify(self._heap)
+        logger.info(f"⏰ Запланировано напоминаний: {len(self._heap)}")
+        self._request_arm()
+
+    def on_record_changed(self, row):
+        with self._lock:
+            for kind, _, _ in REMINDERS:
+                self._due.pop((row.row_number, kind), None)
+            for key in self._put(row, time.time()):
+                heapq.heappush(self._heap, (self._due[key], *key))
+        self._request_arm()
+
+    def _put(self, row, now):
+        keys = []
+        if row.row_number is None:
+            return keys  # Строка ещё в outbox: запланируем, когда она появится в листе
+        for kind, due in reminder_due_times(row).items():
+            if now - due <= LATE_GRACE and (row.id, kind, due) not in self._sent:
+                self._due[(row.row_number, kind)] = due
+                keys.append((row.row_number, kind))
+        return keys
+
+    # --- таймер ---
+
+    def start(self, job_queue):
+        """Регистрирует первую задачу: загрузка записей и построение кучи уже в event loop."""
+        self._job_queue = job_queue
+        records_repo.subscribe(self)
+        job_queue.run_once(self._bootstrap, when=10, name="reminders_bootstrap")
+
+    @google_priority(PRIORITY_BACKGROUND)
+    async def _bootstrap(self, context):
+        self._loop = asyncio.get_running_loop()
+        self.on_records_reset(await records_repo.all())
+
+    def _request_arm(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._arm)
+
+    def _arm(self):
+        """Ставит run_once на ближайшее актуальное напоминание (выполняется в event loop)."""
+        with self._lock:
+            while self._heap and self._due.get((self._heap[0][1], self._heap[0][2])) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            next_due = self._heap[0][0] if self._heap else None
+        if next_due == self._armed_at and (self._job is not None or next_due is None):
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+            self._job = None
+        self._armed_at = next_due
+        if next_due is not None:
+            self._job = self._job_queue.run_once(
+                self._fire, when=max(next_due - time.time(), 0), name="reminders"
+            )
+
+    @google_priority(PRIORITY_BACKGROUND)
+    async def _fire(self, context):
+        self._job = None
+        self._armed_at = None
+        due_now = []
+        with self._lock:
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now + 1:
+                due, row_number, kind = heapq.heappop(self._heap)
+                if self._due.get((row_number, kind)) == due:
+                    del self._due[(row_number, kind)]
+                    due_now.append((due, row_number, kind))
+
+        sends = []
+        for due, row_number, kind in due_now:
+            row = records_repo.by_row(row_number)
+            if row is None or time.time() - due > LATE_GRACE:
+                continue
+            # Запись могла измениться после планирования — сверяемся с актуальной строкой
+            if reminder_due_times(row).get(kind) != due:
+                continue
+            self._sent.add((row.id, kind, due))
+            sends.append(send_24h_reminder(context, row) if kind == "24h" else send_1h_reminder(context, row))
+        # Все напоминания срабатывания — параллельно, с лимитами скорости диспетчера
+        await asyncio.gather(*sends)
+
+        # Все отметки о напоминаниях за срабатывание — одним batchUpdate
+        await write_buffer.flush()
+        self._arm()
+
+reminder_scheduler = ReminderScheduler()
+
+async def send_24h_reminder(context, row):
+    i = row.row_number
+    record_id = row[0] # [0] = ID
+    name = row[1] # [1] = Имя
+    phone = row[2] # [2] = Телефон
+    time_str = row.start_time # [7] = Время, начало из "16:45-18:30"
+    chat_id = row[13] # [13] = chat_id
+    try:
+        # Загружаем текст из настроек (псевдокод, нужно реализовать get_setting)
+        # message_text = get_setting("Текст напоминания 24ч", f"Напоминаем: завтра у вас запись на {row[4]} к {row[5]} в {time_str}.")
+        message_text = f"Напоминаем: завтра у вас запись на {row[4]} к {row[5]} в {time_str}." # Временно
+        await dispatcher.send(
+            context.bot, chat_id, message_text, priority=PRIORITY_BULK,
+            reply_markup=build_confirm_cancel_kb(record_id) # См. ниже
+        )
+        # Обновляем статус напоминания 24ч на "✅" (L — пакетная запись после срабатывания)
+        write_buffer.queue_cell("Записи", f"L{i}", "✅")
+        current = records_repo.by_row(i) or row  # Другое напоминание этой строки могло уже обновить её
+        records_repo.apply_update_row(i, current[:11] + ["✅"] + current[12:])
+        logger.info(f"📤 24ч напоминание отправлено {name} (ID: {record_id})")
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки 24ч напоминания {record_id}: {e}")
+        # Уведомляем админа
+        # admin_message = get_setting("Текст уведомления админу об ошибке", f"❌ Не удалось отправить напоминание клиенту {name}. Позвоните: {phone}.")
+        admin_message = f"❌ Не удалось отправить напоминание клиенту {name}. Позвоните: {phone}. Ошибка: {e}"
+        await notify_admins(context, admin_message)
+
+async def send_1h_reminder(context, row):
+    i = row.row_number
+    record_id = row[0] # [0] = ID
+    name = row[1] # [1] = Имя
+    phone = row[2] # [2] = Телефон
+    chat_id = row[13] # [13] = chat_id
+    try:
+        # message_text = get_setting("Текст напоминания 1ч", f"Через час у вас приём. Не опаздывайте!")
+        message_text = f"Через час у вас приём. Не опаздывайте!"
+        await dispatcher.send(context.bot, chat_id, message_text, priority=PRIORITY_BULK)
+        # Обновляем статус напоминания 1ч на "✅" (M — пакетная запись после срабатывания)
+        write_buffer.queue_cell("Записи", f"M{i}", "✅")
+        current = records_repo.by_row(i) or row
+        records_repo.apply_update_row(i, current[:12] + ["✅"] + current[13:])
+        logger.info(f"📤 1ч напоминание отправлено {name} (ID: {record_id})")
+    except Exception as e:
+        logger.error(f"❌ Ошибка отправки 1ч напоминания {record_id}: {e}")
+        admin_message = f"❌ Не удалось отправить 1ч напоминание клиенту {name}. Позвоните: {phone}. Ошибка: {e}"
+        await notify_admins(context, admin_message)
 
 def build_confirm_cancel_kb(record_id: str):
     """Создаёт inline-клавиатуру для 24ч напоминания."""
@@ -88,15 +217,18 @@ def build_confirm_cancel_kb(record_id: str):
 async def handle_confirm_reminder(record_id: str, query, context):
     """Обрабатывает нажатие кнопки 'Подтверждаю' в напоминании."""
     try:
-        records = safe_get_sheet_data(SHEET_ID, "Записи!A2:P")
-        for idx, row in enumerate(records, start=2):
+        records = await records_repo.by_id(record_id)
+        for row in records:
+            idx = row.row_number
+            row = list(row)  # Копия: кэш записей меняется только через apply_update_row
             if len(row) > 0 and row[0] == record_id:
                 if len(row) < 12:
                     row.extend([""] * (12 - len(row)))
                 # Обновляем статус напоминания 24ч на "✅", если он был "❌"
                 if row[11] == "❌":
                     row[11] = "✅"
-                    safe_update_sheet_row(SHEET_ID, "Записи", idx, row)
+                    if await sheets.update_row("Записи", idx, row):
+                        records_repo.apply_update_row(idx, row)
                     await query.edit_message_text("✅ Спасибо! Ваша запись подтверждена.")
                     logger.info(f"✅ Клиент подтвердил запись {record_id}")
                 else:
@@ -110,19 +242,22 @@ async def handle_confirm_reminder(record_id: str, query, context):
 async def handle_cancel_reminder(record_id: str, query, context):
     """Обрабатывает нажатие кнопки 'Отменяю' в напоминании."""
     try:
-        records = safe_get_sheet_data(SHEET_ID, "Записи!A2:P")
-        for idx, row in enumerate(records, start=2):
+        records = await records_repo.by_id(record_id)
+        for row in records:
+            idx = row.row_number
+            row = list(row)  # Копия: кэш записей меняется только через apply_update_row
             if len(row) > 0 and row[0] == record_id:
                 if len(row) < 9:
                     row.extend([""] * (9 - len(row)))
                 # Меняем статус записи на "отменено"
                 row[8] = "отменено" # [8] = Статус
                 event_id = row[14] if len(row) > 14 else None # [14] = event_id
-                safe_update_sheet_row(SHEET_ID, "Записи", idx, row)
+                if await sheets.update_row("Записи", idx, row):
+                    records_repo.apply_update_row(idx, row)
 
                 # Удаляем событие из календаря
                 if event_id:
-                    safe_delete_calendar_event(CALENDAR_ID, event_id)
+                    await calendar.delete_event(event_id)
                     logger.info(f"캘 Календарное событие {event_id} удалено при отмене записи {record_id}")
 
                 await query.edit_message_text("❌ Запись отменена. Спасибо, что сообщили.")
@@ -0,0 +1,231 @@
+# utils/reservations.py
+"""
+Резервирование слотов в памяти: защита от двойной записи.
+
+Раньше два клиента могли одновременно пройти _validate_booking_checks для одного
+и того же времени: проверка читала таблицу, а запись шла отдельным запросом.
+Теперь все проверки занятости идут по таблице в памяти:
+- подтверждённые записи — из records_repo (индекс по специалисту и дате);
+- «холды» — жёлтые резервы «⏳ Бронь», которые reserve_slot ставит на время
+  оформления записи (один холд на чат).
+
+Интервалы хранятся в минутах от начала суток по ключу (специалист, дата), так
+что проверка пересечения — это проход по записям одного дня одного специалиста.
+Холд и есть блокировка интервала: пока он стоит, другие клиенты не могут занять
+пересекающееся время. Проверка и постановка холда (и проверка с фиксацией записи
+в finalize_booking) выполняются без await между ними, поэтому атомарны в event loop.
+
+Холды видны поиску слотов (find_available_slots вычитает их из свободного
+времени), живут не дольше HOLD_TTL — срока резерва RESERVATION_TIMEOUT с небольшим
+запасом — и сохраняются в небольшой JSON-снимок (HOLDS_SNAPSHOT), чтобы пережить
+перезапуск бота до истечения срока.
+
+Пример:
+    conflict = reservations.conflict(specialist, date_str, start, end, owner=chat_id)
+    if not conflict:
+        reservations.hold(chat_id, specialist, date_str, start, end)
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from config import RESERVATION_TIMEOUT
+from .records import records_repo
+from .services import get_service_catalog
+from .settings import get_setting
+
+logger = logging.getLogger(__name__)
+
+CONFIRMED_STATUS = "подтверждено"
+HOLD_TTL = RESERVATION_TIMEOUT + 30  # Запас: обычно холд снимает release_reservation
+# Перезапуск таймеров резерва (ввод имени, телефона) продлевает холд: extend(owner, HOLD_TTL)
+SNAPSHOT_PATH = os.getenv("HOLDS_SNAPSHOT", "holds.json")
+
+
+def time_to_minutes(value):
+    """'10:30' / '10:30-11:45' → 630; None, если не разобрать."""
+    try:
+        hours, minutes = str(value).split("-")[0].strip().split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, TypeError):
+        return None
+
+
+def service_minutes(service) -> int:
+    """Длительность услуги с буфером (как calculate_service_step в main.py)."""
+    total = get_service_catalog().total_minutes(str(service or "").strip())
+    if total is not None:
+        return total
+    return int(get_setting("Дефолтный шаг услуги", "60"))
+
+
+class Hold:
+    """Временный резерв слота клиентом, оформляющим запись."""
+
+    __slots__ = ("owner", "specialist", "date", "start", "end", "event_id", "created_at", "expires_at")
+
+    def __init__(self, owner, specialist, date, start, end, event_id=None, created_at=None, expires_at=None):
+        self.owner = owner
+        self.specialist = specialist
+        self.date = date
+        self.start = start
+        self.end = end
+        self.event_id = event_id
+        self.created_at = created_at or time.time()
+        self.expires_at = expires_at or self.created_at + HOLD_TTL
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SlotReservations:
+    def __init__(self, snapshot_path=SNAPSHOT_PATH):
+        self.snapshot_path = snapshot_path
+        self._holds = {}  # (специалист, дата) -> {владелец: Hold}
+        self._by_owner = {}  # владелец -> Hold
+        self._lock = threading.Lock()  # Поиск слотов читает холды из пула google-io
+        self._load_snapshot()
+
+    @staticmethod
+    def _key(specialist, date_str):
+        return (str(specialist or "").strip(), str(date_str or "").strip())
+
+    # --- занятость ---
+
+    def booked_intervals(self, specialist, date_str, ignore_record_id=None):
+        """[(начало, конец, описание)] подтверждённых записей специалиста на дату."""
+        intervals = []
+        for rec in records_repo.cached_by_specialist_date(specialist, date_str):
+            if rec.status != CONFIRMED_STATUS or (ignore_record_id and rec.id == str(ignore_record_id)):
+                continue
+            start = time_to_minutes(rec.time)
+            if start is None:
+                continue
+            intervals.append((start, start + service_minutes(rec.service), f"запись #{rec.id}"))
+        return intervals
+
+    def held_intervals(self, specialist, date_str, exclude_owner=None):
+        """[(начало, конец, описание)] холдов других клиентов на специалиста и дату."""
+        now = time.time()
+        with self._lock:
+            holds = list(self._holds.get(self._key(specialist, date_str), {}).values())
+        return [
+            (h.start, h.end, "бронь в процессе")
+            for h in holds
+            if h.owner != exclude_owner and h.expires_at > now
+        ]
+
+    def conflict(self, specialist, date_str, start, end, owner=None, ignore_record_id=None):
+        """Описание первого пересечения [start, end) с записями и чужими холдами или None."""
+        for busy_start, busy_end, label in (
+            self.booked_intervals(specialist, date_str, ignore_record_id)
+            + self.held_intervals(specialist, date_str, exclude_owner=owner)
+        ):
+            if busy_start < end and start < busy_end:
+                return label
+        return None
+
+    # --- холды ---
+
+    def hold(self, owner, specialist, date_str, start, end, event_id=None):
+        """Ставит холд владельца (прежний холд этого владельца снимается)."""
+        hold = Hold(owner, *self._key(specialist, date_str), start, end, event_id)
+        with self._lock:
+            self._expire_locked()
+            self._release_locked(owner)
+            self._put_locked(hold)
+            self._save_locked()
+        logger.info(f"🟡 Холд {hold.specialist} {hold.date} {start // 60:02d}:{start % 60:02d} для {owner}")
+        return hold
+
+    def attach_event(self, owner, event_id):
+        """Запоминает ID жёлтого события календаря для холда."""
+        with self._lock:
+            hold = self._by_owner.get(owner)
+            if hold:
+                hold.event_id = event_id
+                self._save_locked()
+
+    def extend(self, owner, seconds):
+        """Холд владельца живёт ещё seconds секунд (таймеры резерва перезапущены); False — холда нет."""
+        with self._lock:
+            hold = self._by_owner.get(owner)
+            if hold is None:
+                return False
+            hold.expires_at = time.time() + seconds
+            self._save_locked()
+        logger.info(f"🟡 Холд {hold.specialist} {hold.date} для {owner} продлён на {seconds} сек.")
+        return True
+
+    def get(self, owner):
+        with self._lock:
+            return self._by_owner.get(owner)
+
+    def release(self, owner):
+        """Снимает холд владельца; возвращает снятый Hold или None."""
+        with self._lock:
+            hold = self._release_locked(owner)
+            if hold:
+                self._save_locked()
+            return hold
+
+    def _put_locked(self, hold):
+        self._holds.setdefault((hold.specialist, hold.date), {})[hold.owner] = hold
+        self._by_owner[hold.owner] = hold
+
+    def _expire_locked(self):
+        now = time.time()
+        for owner in [o for o, h in self._by_owner.items() if h.expires_at <= now]:
+            hold = self._release_locked(owner)
+            logger.info(f"⌛ Холд {hold.specialist} {hold.date} для {owner} истёк")
+
+    def _release_locked(self, owner):
+        hold = self._by_owner.pop(owner, None)
+        if hold:
+            key = (hold.specialist, hold.date)
+            bucket = self._holds.get(key)
+            if bucket:
+                bucket.pop(owner, None)
+                if not bucket:
+                    del self._holds[key]
+        return hold
+
+    # --- снимок на диске ---
+
+    def _save_locked(self):
+        """Атомарно перезаписывает снимок (несколько холдов — доли миллисекунды)."""
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump([h.to_dict() for h in self._by_owner.values()], f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"❌ Не удалось сохранить снимок холдов: {e}")
+
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"❌ Не удалось прочитать снимок холдов: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for item in items:
+                try:
+                    hold = Hold(**item)
+                except TypeError:
+                    continue
+                if hold.expires_at > now:
+                    self._put_locked(hold)
+        if self._by_owner:
+            logger.info(f"🟡 Восстановлено холдов из снимка: {len(self._by_owner)}")
+
+
+reservations = SlotReservations()
+
+print("✅ Модуль reservations.py загружен.")
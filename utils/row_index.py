@@ -0,0 +1,101 @@
+# utils/row_index.py
+"""
+Индекс «ID записи → номер строки» для обновления строк по ID.
+
+safe_update_sheet_row_by_id раньше на каждый вызов скачивал всю колонку A и
+искал ID линейным проходом. Теперь номер строки берётся из индекса, который
+пополняется без отдельных запросов:
+- из ответа на append (updatedRange содержит номер первой добавленной строки);
+- из полной загрузки листа «Записи» (records_repo) и из сканирования колонки A;
+- после каждого успешного обновления.
+
+Сортировка листа переставляет строки, поэтому сбрасывает индекс листа.
+Результат сканирования, начатого до сброса, в индекс не попадает (поколения).
+
+Номер строки, подтверждённый не раньше ROW_TRUST_TTL секунд назад, используется
+сразу (одна запись — один запрос). Более старый номер сначала сверяется чтением
+одной ячейки; при несовпадении выполняется прежнее сканирование колонки.
+"""
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FIRST_DATA_ROW = 3
+ROW_TRUST_TTL = 30  # Секунды, в течение которых номер строки не перепроверяется
+
+_RANGE_ROW = re.compile(r"![A-Z]+(\d+)")
+
+
+def sheet_title(range_name) -> str:
+    """Название листа из диапазона: 'Записи'!A3:O → Записи."""
+    return str(range_name).split("!")[0].strip().strip("'")
+
+
+class RowIndex:
+    def __init__(self, trust_ttl=ROW_TRUST_TTL):
+        self.trust_ttl = trust_ttl
+        self._rows = {}  # (таблица, лист) -> {ID: (номер строки, когда подтверждён)}
+        self._generations = {}  # (таблица, лист) -> номер поколения (растёт при сбросе)
+        self._lock = threading.Lock()
+
+    def generation(self, spreadsheet_id, sheet) -> int:
+        with self._lock:
+            return self._generations.get((spreadsheet_id, sheet_title(sheet)), 0)
+
+    def lookup(self, spreadsheet_id, sheet, record_id):
+        """(номер строки, подтверждён недавно) или None."""
+        with self._lock:
+            entry = self._rows.get((spreadsheet_id, sheet_title(sheet)), {}).get(str(record_id).strip())
+        if entry is None:
+            return None
+        row, confirmed_at = entry
+        return row, time.monotonic() - confirmed_at < self.trust_ttl
+
+    def remember(self, spreadsheet_id, sheet, record_id, row):
+        with self._lock:
+            key = (spreadsheet_id, sheet_title(sheet))
+            self._rows.setdefault(key, {})[str(record_id).strip()] = (row, time.monotonic())
+
+    def load_column(self, spreadsheet_id, sheet, rows, generation, first_row=FIRST_DATA_ROW):
+        """
+        Заполняет индекс листа по прочитанным строкам (ID в первой колонке).
+        Как и прежний поиск, при повторах ID берётся первая строка сверху.
+        """
+        key = (spreadsheet_id, sheet_title(sheet))
+        now = time.monotonic()
+        mapping = {}
+        for i, row in enumerate(rows):
+            record_id = str(row[0]).strip() if row else ""
+            if record_id:
+                mapping.setdefault(record_id, (first_row + i, now))
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return False  # Лист пересортирован, пока шло чтение
+            self._rows[key] = mapping
+        return True
+
+    def note_append(self, spreadsheet_id, sheet, updated_range, values):
+        """Номера строк добавленных значений из updatedRange ответа append."""
+        match = _RANGE_ROW.search(str(updated_range or ""))
+        if not match:
+            return
+        first = int(match.group(1))
+        for offset, row in enumerate(values):
+            if row and str(row[0]).strip():
+                self.remember(spreadsheet_id, sheet, row[0], first + offset)
+
+    def forget_sheet(self, spreadsheet_id, sheet):
+        """Строки листа переставлены (сортировка): индекс больше не верен."""
+        with self._lock:
+            key = (spreadsheet_id, sheet_title(sheet))
+            self._rows.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+        logger.debug(f"🗂️ Индекс строк листа {key[1]} сброшен")
+
+
+row_index = RowIndex()
+
+print("✅ Модуль row_index.py загружен.")
@@ -3,11 +3,20 @@ import logging
 import time
 import json
 import os
+import random
+import threading
 from functools import wraps
+import httplib2
+import google_auth_httplib2
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
+from google.auth.exceptions import TransportError
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from config import GOOGLE_CREDENTIALS_JSON, SHEET_ID, TIMEZONE
+from .quota import acquire_quota
+from .row_index import row_index
 from datetime import datetime
 import pytz
 
@@ -15,69 +24,334 @@ logger = logging.getLogger(__name__)
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/calendar']
 
+# --- РЕЕСТР КЛИЕНТОВ GOOGLE API ---
+# Credentials парсятся один раз на процесс. Объекты service живут в thread-local:
+# httplib2.Http не потокобезопасен, поэтому у каждого потока свой keep-alive
+# клиент, а токен (общий для всех потоков) обновляется под блокировкой.
+HTTP_TIMEOUT = 30  # Секунды на один HTTP-запрос к Google
+TOKEN_REFRESH_MARGIN = 300  # Обновляем токен заранее, за 5 минут до истечения
+
+_credentials = None
+_credentials_lock = threading.Lock()
+_thread_clients = threading.local()
+
+
 def get_google_credentials():
-    try:
-        creds_data = json.loads(GOOGLE_CREDENTIALS_JSON)
-        credentials = Credentials.from_service_account_info(creds_data, scopes=SCOPES)
-        return credentials
-    except Exception as e:
-        logger.error(f"❌ Ошибка при создании credentials: {e}")
+    """Возвращает общий для процесса объект Credentials (создаётся один раз)."""
+    global _credentials
+    if _credentials is not None:
+        return _credentials
+    with _credentials_lock:
+        if _credentials is None:
+            try:
+                creds_data = json.loads(GOOGLE_CREDENTIALS_JSON)
+                _credentials = Credentials.from_service_account_info(creds_data, scopes=SCOPES)
+                logger.info("✅ Google credentials созданы (один раз на процесс)")
+            except Exception as e:
+                logger.error(f"❌ Ошибка при создании credentials: {e}")
+                return None
+    return _credentials
+
+
+def refresh_google_credentials(force=False):
+    """
+    Заранее обновляет access token, если он истекает в ближайшие TOKEN_REFRESH_MARGIN секунд.
+    Вызывается фоновой задачей, чтобы пользовательские запросы не ждали обновления токена.
+    """
+    credentials = get_google_credentials()
+    if not credentials:
+        return False
+    with _credentials_lock:
+        try:
+            expiry = credentials.expiry  # naive UTC
+            expiring = (
+                not credentials.valid
+                or expiry is None
+                or (expiry - datetime.utcnow()).total_seconds() < TOKEN_REFRESH_MARGIN
+            )
+            if force or expiring:
+                credentials.refresh(Request())
+                logger.info(f"🔑 Google токен обновлён, действует до {credentials.expiry}")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обновлении Google токена: {e}")
+            return False
+
+
+def _get_service(api_name, api_version):
+    """Возвращает service для текущего потока, создавая его при первом обращении."""
+    key = f"{api_name}_{api_version}"
+    service = getattr(_thread_clients, key, None)
+    if service is not None:
+        return service
+    credentials = get_google_credentials()
+    if not credentials:
         return None
+    authed_http = google_auth_httplib2.AuthorizedHttp(
+        credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT)
+    )
+    service = build(
+        api_name, api_version, http=authed_http, cache_discovery=False,
+        requestBuilder=_guarded_request_class(api_name),
+    )
+    setattr(_thread_clients, key, service)
+    logger.debug(f"🔧 Создан клиент {api_name} {api_version} для потока {threading.current_thread().name}")
+    return service
+
+
+def get_sheets_service():
+    return _get_service('sheets', 'v4')
+
+
+def get_calendar_service():
+    return _get_service('calendar', 'v3')
+
+
+def reset_google_clients():
+    """Сбрасывает клиента текущего потока (например, после обрыва соединения)."""
+    for key in ('sheets_v4', 'calendar_v3'):
+        if hasattr(_thread_clients, key):
+            delattr(_thread_clients, key)
+
+# --- ПОВТОРЫ И АВТОМАТ ЗАЩИТЫ (CIRCUIT BREAKER) ---
+# Каждый .execute() любого клиента проходит через автомат своего API (sheets / calendar).
+# Временные сбои (429, 5xx, сеть) превращаются в TransientGoogleError и повторяются
+# с экспоненциальной паузой и полным джиттером. После BREAKER_THRESHOLD сбоев подряд
+# автомат размыкается: BREAKER_RESET_TIMEOUT секунд запросы к этому API сразу
+# завершаются CircuitOpenError, а вызывающий код остаётся на закэшированных данных.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1  # Секунды
+RETRY_MAX_DELAY = 16
+BREAKER_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+
+class TransientGoogleError(Exception):
+    """Временный сбой Google API — запрос стоит повторить."""
+
+    def __init__(self, api, cause):
+        super().__init__(f"{api}: {cause}")
+        self.api = api
+        self.cause = cause
+
+    @property
+    def rejected(self) -> bool:
+        """429: Google отклонил запрос, не выполнив его, — повтор безопасен и для неидемпотентных операций."""
+        return isinstance(self.cause, HttpError) and self.cause.resp.status == 429
+
+
+class CircuitOpenError(Exception):
+    """Автомат API разомкнут — запрос не отправлялся."""
+
+
+class QuotaShedError(Exception):
+    """Квота API исчерпана для запросов этого приоритета (utils/quota.py) — запрос не отправлялся."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False  # В полуоткрытом состоянии пропускаем один пробный запрос
+        self._lock = threading.Lock()
 
-def retry_google_api(max_retries=3, delay=2):
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def before(self) -> bool:
+        """Пропускает запрос или бросает CircuitOpenError; True — это пробный запрос полуоткрытого автомата."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial):
+                raise CircuitOpenError(f"Google {self.name} временно недоступен")
+            if state == "half-open":
+                self._trial = True
+                return True
+            return False
+
+    def end_trial(self):
+        """Пробный запрос завершился, ничего не сказав о состоянии API (квота, неизвестная ошибка)."""
+        with self._lock:
+            self._trial = False
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"✅ Google {self.name} снова доступен, автомат замкнут")
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                if self.opened_at is None or self._trial:
+                    logger.warning(
+                        f"🔌 Google {self.name}: {self.failures} сбоев подряд, "
+                        f"запросы приостановлены на {self.reset_timeout} сек."
+                    )
+                self.opened_at = time.time()
+                self._trial = False
+
+
+_breakers = {"sheets": CircuitBreaker("sheets"), "calendar": CircuitBreaker("calendar")}
+_request_classes = {}
+
+
+def google_status():
+    """Состояние автоматов: {'sheets': 'closed', 'calendar': 'open'}."""
+    return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+class _GuardedHttpRequest(HttpRequest):
+    """HttpRequest, который проходит через автомат своего API и классифицирует ошибки."""
+
+    api = None
+
+    def execute(self, *args, **kwargs):
+        breaker = _breakers[self.api]
+        trial = breaker.before()
+        try:
+            if not acquire_quota(self.api, self.method):
+                raise QuotaShedError(f"квота Google {self.api} исчерпана для запросов этого приоритета")
+            result = super().execute(*args, **kwargs)
+        except HttpError as e:
+            if e.resp.status in RETRYABLE_STATUSES:
+                breaker.failure()
+                raise TransientGoogleError(self.api, e) from e
+            breaker.success()  # API ответил: ошибка в запросе, а не деградация сервиса
+            raise
+        except (OSError, httplib2.HttpLib2Error, TransportError) as e:
+            breaker.failure()
+            raise TransientGoogleError(self.api, e) from e
+        except BaseException:
+            # Отказ квоты или неожиданная ошибка: без этого пробный слот занят навсегда
+            if trial:
+                breaker.end_trial()
+            raise
+        breaker.success()
+        return result
+
+
+def _guarded_request_class(api_name):
+    if api_name not in _request_classes:
+        _request_classes[api_name] = type(
+            f"_{api_name.capitalize()}HttpRequest", (_GuardedHttpRequest,), {"api": api_name}
+        )
+    return _request_classes[api_name]
+
+
+def backoff_delay(attempt: int) -> float:
+    """Полный джиттер: случайная пауза от 0 до min(RETRY_MAX_DELAY, RETRY_BASE_DELAY·2^attempt)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def should_retry(error, idempotent: bool) -> bool:
+    """Добавление строки или создание события повторяем только если запрос точно не выполнен."""
+    return idempotent or error.rejected
+
+
+def retry_google_api(max_retries=MAX_RETRIES, default=None, idempotent=True):
+    """
+    Повторяет функцию при TransientGoogleError (в потоке, через time.sleep);
+    после исчерпания попыток или при разомкнутом автомате возвращает default.
+    idempotent=False — повтор только после 429 (иначе возможен дубль строки/события).
+    Асинхронный фасад (utils/async_google.py) вызывает исходную функцию
+    (wrapper.__wrapped__) и ждёт между попытками через asyncio.sleep.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except HttpError as e:
-                    if e.resp.status in [429, 500, 503]:
-                        if attempt < max_retries - 1:
-                            logger.warning(f"⚠️ Попытка {attempt + 1} не удалась в {func.__name__}: {e}. Повтор через {delay * (2 ** attempt)} сек...")
-                            time.sleep(delay * (2 ** attempt))
-                        else:
-                            logger.error(f"❌ Ошибка Google API после {max_retries} попыток в функции {func.__name__}: {e}")
-                            raise
-                    else:
-                        logger.error(f"❌ Неожиданная ошибка Google API в функции {func.__name__}: {e}")
-                        raise
-                except Exception as e:
-                    logger.error(f"❌ Неожиданная ошибка в функции {func.__name__}: {e}")
-                    raise
+                except CircuitOpenError as e:
+                    logger.warning(f"🔌 {func.__name__}: {e}")
+                    return default
+                except QuotaShedError as e:
+                    logger.warning(f"🚦 {func.__name__}: {e}")
+                    return default
+                except TransientGoogleError as e:
+                    if attempt == max_retries - 1 or not should_retry(e, idempotent):
+                        logger.error(f"❌ Ошибка Google API после {max_retries} попыток в функции {func.__name__}: {e}")
+                        return default
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"⚠️ Попытка {attempt + 1} не удалась в {func.__name__}: {e}. Повтор через {delay:.1f} сек...")
+                    time.sleep(delay)
+            return default
+        wrapper.retry_default = default
+        wrapper.max_retries = max_retries
+        wrapper.idempotent = idempotent
         return wrapper
     return decorator
 
 @retry_google_api()
 def safe_get_sheet_data(spreadsheet_id, range_name):
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_sheets_service()
+    if not service:
         return None
     try:
-        service = build('sheets', 'v4', credentials=credentials)
         result = service.spreadsheets().values().get(
             spreadsheetId=spreadsheet_id,
             range=range_name
         ).execute()
         values = result.get('values', [])
         return values
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка при чтении данных из таблицы: {e}")
         return None
 
 @retry_google_api()
+def safe_batch_get(spreadsheet_id, ranges):
+    """
+    Читает несколько диапазонов одним запросом values.batchGet.
+    Возвращает словарь {диапазон: список строк} в порядке запроса или None при ошибке.
+    """
+    ranges = list(ranges)
+    service = get_sheets_service()
+    if not service:
+        return None
+    try:
+        result = service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=ranges
+        ).execute()
+        value_ranges = result.get('valueRanges', [])
+        # Ответ приходит в том же порядке, что и запрос; ключуем исходными строками
+        return {
+            range_name: (value_ranges[i].get('values', []) if i < len(value_ranges) else [])
+            for i, range_name in enumerate(ranges)
+        }
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
+    except Exception as e:
+        logger.error(f"❌ Ошибка при пакетном чтении {ranges}: {e}")
+        return None
+
+@retry_google_api(default=False, idempotent=False)
 def safe_append_to_sheet(spreadsheet_id, sheet_name, values):
     print("\n" + "="*80)
     print("🔧🔧🔧 DEBUG SAFE_APPEND_TO_SHEET ВЫЗВАНА!")
     # ... принты ...
     
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_sheets_service()
+    if not service:
         print("❌ Нет credentials для Google API")
         return False
     
     try:
-        service = build('sheets', 'v4', credentials=credentials)
         body = {'values': values}
         print(f"🔧 Отправляю запрос к Google Sheets...")
         
@@ -89,23 +363,27 @@ def safe_append_to_sheet(spreadsheet_id, sheet_name, values):
         ).execute()
         
         print(f"🔧 Google Sheets ответил: {result}")
+        row_index.note_append(spreadsheet_id, sheet_name, result.get('updates', {}).get('updatedRange'), values)
         print(f"✅ Добавлено {result.get('updates', {}).get('updatedCells', 0)} ячеек в {sheet_name}")
         return True
 
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+
+        raise
+
     except Exception as e:
         print(f"❌❌❌ ОШИБКА в safe_append_to_sheet: {e}")
         import traceback
         traceback.print_exc()
         return False
 
-@retry_google_api()
+@retry_google_api(default=False)
 def safe_update_sheet_row(spreadsheet_id, sheet_name, row_index, values):
     """Обновляет строку в таблице по индексу строки"""
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_sheets_service()
+    if not service:
         return False
     try:
-        service = build('sheets', 'v4', credentials=credentials)
         range_name = f"{sheet_name}!A{row_index}"
         body = {'values': [values]}
         result = service.spreadsheets().values().update(
@@ -116,63 +394,109 @@ def safe_update_sheet_row(spreadsheet_id, sheet_name, row_index, values):
         ).execute()
         logger.info(f"✅ Обновлено {result.get('updatedCells', 0)} ячеек в строке {row_index}")
         return True
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении строки в таблице: {e}")
         return False
 
-@retry_google_api()
+@retry_google_api(default=False)
+def safe_batch_update_values(spreadsheet_id, data):
+    """
+    Записывает несколько диапазонов одним запросом values.batchUpdate.
+    data — список словарей {'range': 'Лист!A5', 'values': [[...]]}.
+    """
+    if not data:
+        return True
+    service = get_sheets_service()
+    if not service:
+        return False
+    try:
+        body = {'valueInputOption': 'RAW', 'data': data}
+        result = service.spreadsheets().values().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body=body
+        ).execute()
+        logger.info(f"✅ Пакетно обновлено {result.get('totalUpdatedCells', 0)} ячеек в {len(data)} диапазонах")
+        return True
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
+    except Exception as e:
+        logger.error(f"❌ Ошибка при пакетном обновлении {len(data)} диапазонов: {e}")
+        return False
+
+@retry_google_api(default=False)
 def safe_update_sheet_row_by_id(spreadsheet_id, sheet_name, record_id, updated_values):
     """Находит и обновляет строку по ID записи (более надежно)"""
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_sheets_service()
+    if not service:
         return False
     
     try:
-        service = build('sheets', 'v4', credentials=credentials)
-        
-        # 1. Сначала находим строку с нужным ID
-        # Читаем колонку A (ID записей) начиная с 3 строки
-        range_name = f"{sheet_name}!A3:A"
-        result = service.spreadsheets().values().get(
+        record_id = str(record_id).strip()
+        row_number = None
+
+        # 1. Номер строки из индекса; давно не подтверждённый сверяем по одной ячейке
+        known = row_index.lookup(spreadsheet_id, sheet_name, record_id)
+        if known:
+            row, trusted = known
+            if trusted:
+                row_number = row
+            else:
+                cell = service.spreadsheets().values().get(
+                    spreadsheetId=spreadsheet_id,
+                    range=f"{sheet_name}!A{row}"
+                ).execute().get('values', [])
+                if cell and cell[0] and str(cell[0][0]).strip() == record_id:
+                    row_number = row
+                else:
+                    logger.info(f"🗂️ Запись {record_id} больше не в строке {row}, ищем по колонке ID")
+
+        # 2. Нет в индексе или строка сместилась — читаем колонку A (ID записей) с 3 строки
+        if row_number is None:
+            generation = row_index.generation(spreadsheet_id, sheet_name)
+            result = service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=f"{sheet_name}!A3:A"
+            ).execute()
+            values = result.get('values', [])
+            row_index.load_column(spreadsheet_id, sheet_name, values, generation)
+            for i, row in enumerate(values):
+                if row and str(row[0]).strip() == record_id:
+                    # Нашли! Строка = индекс + 3 (т.к. данные с 3 строки)
+                    row_number = i + 3
+                    break
+
+        if row_number is None:
+            logger.error(f"❌ Запись с ID {record_id} не найдена в таблице")
+            return False
+
+        # 3. Обновляем строку
+        service.spreadsheets().values().update(
             spreadsheetId=spreadsheet_id,
-            range=range_name
+            range=f"{sheet_name}!A{row_number}",
+            valueInputOption='RAW',
+            body={'values': [updated_values]}
         ).execute()
+        row_index.remember(spreadsheet_id, sheet_name, record_id, row_number)
+
+        logger.info(f"✅ Обновлена запись {record_id} в строке {row_number}")
+        return True
+
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
         
-        values = result.get('values', [])
-        
-        # 2. Ищем нужный ID
-        for i, row in enumerate(values):
-            if row and str(row[0]).strip() == str(record_id):
-                # Нашли! Строка = индекс + 3 (т.к. данные с 3 строки)
-                row_number = i + 3
-                
-                # 3. Обновляем строку
-                update_range = f"{sheet_name}!A{row_number}"
-                body = {'values': [updated_values]}
-                
-                update_result = service.spreadsheets().values().update(
-                    spreadsheetId=spreadsheet_id,
-                    range=update_range,
-                    valueInputOption='RAW',
-                    body=body
-                ).execute()
-                
-                logger.info(f"✅ Обновлена запись {record_id} в строке {row_number}")
-                return True
-        
-        logger.error(f"❌ Запись с ID {record_id} не найдена в таблице")
-        return False
+        raise
         
     except Exception as e:
         logger.error(f"❌ Ошибка при обновлении записи {record_id}: {e}")
         return False
 
+@retry_google_api()
 def safe_get_calendar_events(calendar_id, time_min, time_max):
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_calendar_service()
+    if not service:
         return None
     try:
-        service = build('calendar', 'v3', credentials=credentials)
         events_result = service.events().list(
             calendarId=calendar_id,
             timeMin=time_min,
@@ -182,16 +506,61 @@ def safe_get_calendar_events(calendar_id, time_min, time_max):
         ).execute()
         events = events_result.get('items', [])
         return events
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка при чтении событий из календаря: {e}")
         return None
 
+CALENDAR_PAGE_SIZE = 2500  # Максимум событий на страницу events.list
+
+
+@retry_google_api()
+def safe_sync_calendar_events(calendar_id, sync_token=None, time_min=None):
+    """
+    Выгрузка событий для зеркала календаря.
+    sync_token=None — полная выгрузка (с time_min), иначе только изменения с момента sync_token
+    (удалённые события приходят со status='cancelled').
+    Возвращает (события, next_sync_token, полная_выгрузка) или None при ошибке.
+    Если sync_token устарел (410 Gone), автоматически выполняется полная выгрузка.
+    """
+    service = get_calendar_service()
+    if not service:
+        return None
+    params = {'calendarId': calendar_id, 'singleEvents': True, 'maxResults': CALENDAR_PAGE_SIZE}
+    if sync_token:
+        params['syncToken'] = sync_token
+    elif time_min:
+        params['timeMin'] = time_min
+    items = []
+    try:
+        page_token = None
+        while True:
+            if page_token:
+                params['pageToken'] = page_token
+            result = service.events().list(**params).execute()
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items, result.get('nextSyncToken'), not sync_token
+    except HttpError as e:
+        if sync_token and e.resp.status == 410:
+            logger.warning("⚠️ syncToken календаря устарел, выполняю полную синхронизацию")
+            return safe_sync_calendar_events(calendar_id, None, time_min)
+        logger.error(f"❌ Ошибка синхронизации календаря: {e}")
+        return None
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
+    except Exception as e:
+        logger.error(f"❌ Ошибка синхронизации календаря: {e}")
+        return None
+
+@retry_google_api(idempotent=False)
 def safe_create_calendar_event(calendar_id, summary, start_time, end_time, color_id=None, description=None):
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_calendar_service()
+    if not service:
         return None
     try:
-        service = build('calendar', 'v3', credentials=credentials)
         
         # Убедимся, что время в правильном формате с часовым поясом
         # Если пришло datetime object, конвертируем в строку с часовым поясом
@@ -214,6 +583,8 @@ def safe_create_calendar_event(calendar_id, summary, start_time, end_time, color
         created_event = service.events().insert(calendarId=calendar_id, body=event).execute()
         logger.info(f"✅ Событие '{summary}' создано в календаре")
         return created_event.get('id')
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка при создании события в календаре: {e}")
         return None
@@ -231,12 +602,11 @@ def safe_update_calendar_event(calendar_id, event_id, summary=None, start_time=N
     logger.info(f"🔄 end_time: {end_time}")
     logger.info(f"🔄 color_id: {color_id}")
 
-    creds = get_google_credentials()
-    if not creds:
+    service = get_calendar_service()
+    if not service:
         logger.error("❌ Нет credentials для Google API")
         return None
     try:
-        service = build('calendar', 'v3', credentials=creds)
         
         # Сначала получаем текущее событие
         logger.info(f"🔄 Получаю событие {event_id} из календаря...")
@@ -266,6 +636,10 @@ def safe_update_calendar_event(calendar_id, event_id, summary=None, start_time=N
         logger.info(f"✅ Событие обновлено: {updated_event.get('id')}")
         return updated_event.get('id')
         
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        
+        raise
+        
     except Exception as e:
         logger.error("❌❌❌ КРИТИЧЕСКАЯ ОШИБКА в safe_update_calendar_event!")
         logger.error(f"❌ Тип ошибки: {type(e).__name__}")
@@ -283,20 +657,22 @@ def safe_update_calendar_event(calendar_id, event_id, summary=None, start_time=N
         
         return None
 
+@retry_google_api(default=False)
 def safe_delete_calendar_event(calendar_id, event_id):
-    credentials = get_google_credentials()
-    if not credentials:
+    service = get_calendar_service()
+    if not service:
         return False
     try:
-        service = build('calendar', 'v3', credentials=credentials)
         service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
         logger.info(f"✅ Событие {event_id} удалено из календаря")
         return True
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка при удалении события {event_id}: {e}")
         return False
 
-@retry_google_api()
+@retry_google_api(default=False)
 def safe_sort_sheet_records(spreadsheet_id):
     """
     Сортирует лист 'Записи' по дате (колонка G) и времени (колонка H)
@@ -304,13 +680,11 @@ def safe_sort_sheet_records(spreadsheet_id):
     """
     try:
         logger.info(f"🔄 Начинаю сортировку таблицы 'Записи'...")
-        credentials = get_google_credentials()
-        if not credentials:
+        service = get_sheets_service()
+        if not service:
             logger.error("❌ Нет credentials для Google API")
             return False
         
-        service = build('sheets', 'v4', credentials=credentials)
-        
         # 1. Находим sheet_id листа "Записи" (с .strip() для надёжности)
         logger.info("🔍 Ищу лист 'Записи'...")
         spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
@@ -366,8 +740,9 @@ def safe_sort_sheet_records(spreadsheet_id):
             ]
         }
         
-        # 3. Выполняем сортировку
+        # 3. Выполняем сортировку (строки переставятся — индекс ID → строка больше не верен)
         logger.info("🔧 Отправляю запрос на сортировку...")
+        row_index.forget_sheet(spreadsheet_id, 'Записи')
         result = service.spreadsheets().batchUpdate(
             spreadsheetId=spreadsheet_id,
             body=sort_request
@@ -376,6 +751,10 @@ def safe_sort_sheet_records(spreadsheet_id):
         logger.info("✅ Таблица 'Записи' отсортирована успешно")
         return True
         
+    except (TransientGoogleError, CircuitOpenError, QuotaShedError):
+        
+        raise
+        
     except Exception as e:
         logger.error(f"❌ Ошибка при сортировке таблицы: {e}")
         import traceback
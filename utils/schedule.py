@@ -0,0 +1,203 @@
+# utils/schedule.py
+"""
+Предварительно разобранный недельный график из листа «График специалистов».
+
+Строки вида «Анна | маникюр, педикюр | 10:00-14:00,15:00-20:00 | выходной | ...»
+разбираются один раз в ScheduleIndex:
+- по каждому специалисту — множество категорий и интервалы (в минутах) на каждый день недели;
+- для каждой пары (день недели, категория) — заранее готовый список работающих специалистов.
+
+Индекс хранится в регионе «schedule» единого кэша (utils/cache.py) с TTL
+SCHEDULE_TTL секунд и перестраивается только когда содержимое листа изменилось.
+"""
+import logging
+from datetime import time as dt_time
+
+from config import SHEET_ID
+from .safe_google import safe_get_sheet_data
+from .cache import cache
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_RANGE = "График специалистов!A3:I"
+SCHEDULE_TTL = 60
+DAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+DAY_OFF = "выходной"
+FIRST_DAY_COLUMN = 2  # C = Пн ... I = Вс
+DEFAULT_WORK_INTERVALS = [(10 * 60, 20 * 60)]  # Если график не удалось разобрать
+
+
+def parse_time_minutes(value: str) -> int:
+    """'09:30' → 570, '9' → 540."""
+    parts = value.strip().split(":")
+    hour = int(parts[0])
+    minute = int(parts[1]) if len(parts) > 1 else 0
+    return hour * 60 + minute
+
+
+def parse_schedule_cell(cell: str):
+    """
+    Разбирает ячейку графика:
+    'выходной' → [], '10:00-14:00,15:00-20:00' → [(600, 840), (900, 1200)].
+    Пустая ячейка или ячейка без '-' → None. Ошибка формата → ValueError.
+    """
+    cell = str(cell or "").strip()
+    if cell.lower() == DAY_OFF:
+        return []
+    if "-" not in cell:
+        return None
+    intervals = []
+    for part in cell.split(","):
+        part = part.strip()
+        if "-" in part:
+            start_str, end_str = part.split("-")
+            intervals.append((parse_time_minutes(start_str), parse_time_minutes(end_str)))
+    return intervals
+
+
+class SpecialistSchedule:
+    """Строка графика одного специалиста (или заведения)."""
+
+    __slots__ = ("name", "categories", "category_text", "row_len", "cells", "intervals")
+
+    def __init__(self, row):
+        self.name = str(row[0]).strip()
+        categories = str(row[1]).strip().lower() if len(row) > 1 else ""
+        self.category_text = categories  # Строка категорий как в листе (для поиска подстрокой)
+        self.row_len = len(row)  # Sheets не возвращает пустые ячейки в конце строки
+        self.categories = frozenset(c.strip() for c in categories.split(",") if c.strip())
+        self.cells = [
+            str(row[FIRST_DAY_COLUMN + d]).strip() if FIRST_DAY_COLUMN + d < len(row) else ""
+            for d in range(7)
+        ]
+        self.intervals = []
+        for day, cell in enumerate(self.cells):
+            try:
+                self.intervals.append(parse_schedule_cell(cell))
+            except (ValueError, IndexError) as e:
+                logger.error(f"❌ Ошибка парсинга графика {self.name} ({DAY_NAMES[day]}: '{cell}'): {e}")
+                self.intervals.append(None)
+
+    def is_day_off(self, weekday: int) -> bool:
+        return self.cells[weekday].lower() == DAY_OFF
+
+    def works_on(self, weekday: int) -> bool:
+        """Есть непустой график и это не выходной."""
+        return bool(self.cells[weekday]) and not self.is_day_off(weekday)
+
+    def day_listed(self, weekday: int) -> bool:
+        """Ячейка дня есть в строке и это не выходной; пустая ячейка — рабочий день с графиком по умолчанию."""
+        return FIRST_DAY_COLUMN + weekday < self.row_len and not self.is_day_off(weekday)
+
+    def has_category(self, category: str) -> bool:
+        return str(category or "").strip().lower() in self.categories
+
+    def day_intervals(self, weekday: int):
+        """Интервалы работы в минутах; None — график не задан или не разобран."""
+        return self.intervals[weekday]
+
+    def day_end(self, weekday: int):
+        """Самое позднее окончание работы в этот день (в минутах) или None."""
+        intervals = self.intervals[weekday]
+        return max(end for _, end in intervals) if intervals else None
+
+    def day_end_time(self, weekday: int):
+        """То же, что day_end, но как datetime.time (None, если не задано)."""
+        end = self.day_end(weekday)
+        if end is None:
+            return None
+        try:
+            return dt_time(end // 60, end % 60)
+        except ValueError:
+            return None
+
+
+class ScheduleIndex:
+    def __init__(self, rows=()):
+        self.specialists = []
+        self._by_name = {}
+        self._working = {}  # (день недели, категория | None) -> [SpecialistSchedule]
+        for row in rows:
+            if not row or not str(row[0]).strip():
+                continue
+            spec = SpecialistSchedule(row)
+            self.specialists.append(spec)
+            self._by_name.setdefault(spec.name, spec)
+        for weekday in range(7):
+            working = [s for s in self.specialists if s.works_on(weekday)]
+            self._working[(weekday, None)] = working
+            for spec in working:
+                for category in spec.categories:
+                    self._working.setdefault((weekday, category), []).append(spec)
+
+    def __len__(self):
+        return len(self.specialists)
+
+    def get(self, name):
+        return self._by_name.get(str(name or "").strip())
+
+    def working(self, weekday: int, category: str = None):
+        """Кто работает в этот день недели (и, если задано, в этой категории) — в порядке листа."""
+        key = str(category).strip().lower() if category else None
+        return list(self._working.get((weekday, key), ()))
+
+    def any_mode_candidates(self, weekday: int, category: str):
+        """
+        Специалисты для режима «любой» в find_available_slots — по его исходным правилам:
+        категория ищется подстрокой в строке категорий («Парикмахер, Стилист» подходит
+        и для «стилист»), пустая ячейка дня не исключает специалиста (см. day_listed).
+        """
+        needle = str(category or "").lower()
+        return [
+            s for s in self.specialists
+            if s.row_len > 1 and needle in s.category_text and s.day_listed(weekday)
+        ]
+
+    def in_category(self, category: str):
+        """Специалисты категории, работающие хотя бы в один день недели."""
+        seen = {}
+        for weekday in range(7):
+            for spec in self._working.get((weekday, str(category).strip().lower()), ()):
+                seen.setdefault(spec.name, spec)
+        return [s for s in self.specialists if s.name in seen]
+
+
+_fingerprint = None
+
+
+def _build_index(rows, current) -> ScheduleIndex:
+    """Индекс из строк листа; если строки не изменились — прежний объект."""
+    global _fingerprint
+    fingerprint = hash(tuple(tuple(str(c) for c in row) for row in rows))
+    if current is not None and fingerprint == _fingerprint:
+        return current
+    _fingerprint = fingerprint
+    index = ScheduleIndex(rows)
+    logger.info(f"🗓️ Индекс графика перестроен: {len(index)} строк")
+    return index
+
+
+def _load_index():
+    rows = safe_get_sheet_data(SHEET_ID, SCHEDULE_RANGE)
+    if rows is None:
+        return None
+    region = cache.region("schedule")
+    return _build_index(rows, region.value if region.loaded else None)
+
+
+cache.register("schedule", _load_index, ttl=SCHEDULE_TTL, empty=ScheduleIndex())
+
+
+def get_schedule_index(force: bool = False) -> ScheduleIndex:
+    """Синхронный доступ (из пула google-io); force=True — перечитать лист немедленно."""
+    if force:
+        return cache.refresh("schedule")
+    return cache.get("schedule")
+
+
+async def load_schedule_index() -> ScheduleIndex:
+    """Асинхронный доступ для обработчиков: устаревший индекс обновляется в фоне."""
+    return await cache.aget("schedule")
+
+
+print("✅ Модуль schedule.py загружен.")
@@ -0,0 +1,151 @@
+# utils/services.py
+"""
+Каталог услуг из листа «Услуги» (A: категория, B: название, C: длительность,
+D: буфер, E: шаг, F: цена, G: описание).
+
+Лист разбирается один раз в ServiceCatalog: числа уже приведены к int,
+поиск по названию — через словарь, а не линейным проходом по строкам.
+Каталог хранится в регионе «services» единого кэша (utils/cache.py) с TTL
+SERVICES_TTL секунд и перестраивается только если содержимое листа изменилось.
+"""
+import logging
+import re
+
+from config import SHEET_ID
+from .safe_google import safe_get_sheet_data
+from .cache import cache
+
+logger = logging.getLogger(__name__)
+
+SERVICES_RANGE = "Услуги!A3:G"
+SERVICES_TTL = 300
+
+
+def _parse_int(value, empty=None):
+    """'45' → 45; пустое значение → empty; мусор → None."""
+    if not value:
+        return empty
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _cell(row, index) -> str:
+    return str(row[index]).strip() if len(row) > index else ""
+
+
+def _parse_price(value):
+    """'1 500 ₽' → 1500; None, если цены нет."""
+    clean = re.sub(r"[^\d.]", "", str(value or "").strip())
+    if not clean:
+        return None
+    try:
+        return int(float(clean))
+    except (ValueError, OverflowError):
+        return None
+
+
+class ServiceEntry:
+    """Одна строка листа «Услуги» с разобранными значениями."""
+
+    __slots__ = ("row", "category", "name", "duration", "buffer", "step",
+                 "price", "price_value", "description")
+
+    def __init__(self, row):
+        self.row = row
+        self.category = row[0] if row else ""
+        self.name = row[1] if len(row) > 1 else ""
+        self.duration = _parse_int(_cell(row, 2))  # None — не задана или не число
+        self.buffer = _parse_int(_cell(row, 3), empty=0)
+        self.step = _parse_int(_cell(row, 4))
+        self.price = row[5] if len(row) > 5 else ""
+        self.price_value = _parse_price(self.price)
+        self.description = _cell(row, 6)
+
+    @property
+    def valid(self) -> bool:
+        """Длительность и буфер корректно заданы."""
+        return self.duration is not None and self.buffer is not None
+
+    @property
+    def total(self):
+        """Длительность + буфер в минутах или None, если данные некорректны."""
+        return self.duration + self.buffer if self.valid else None
+
+
+class ServiceCatalog:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.entries = [ServiceEntry(row) for row in self.rows if row]
+        self._by_name = {}
+        self._by_category = {}
+        for entry in self.entries:
+            if entry.name:
+                # Как и при линейном поиске, побеждает первая строка с таким названием
+                self._by_name.setdefault(entry.name, entry)
+            if entry.category:
+                self._by_category.setdefault(entry.category, []).append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def total_minutes(self, name, default=None):
+        entry = self._by_name.get(name)
+        return entry.total if entry and entry.valid else default
+
+    def categories(self):
+        """Категории в порядке листа."""
+        return list(self._by_category)
+
+    def in_category(self, category):
+        return list(self._by_category.get(category, ()))
+
+
+_fingerprint = None
+
+
+def _build_catalog(rows, current) -> ServiceCatalog:
+    """Каталог из строк листа; если строки не изменились — прежний объект."""
+    global _fingerprint
+    fingerprint = hash(tuple(tuple(str(c) for c in row) for row in rows))
+    if current is not None and fingerprint == _fingerprint:
+        return current
+    _fingerprint = fingerprint
+    catalog = ServiceCatalog(rows)
+    logger.info(f"💅 Каталог услуг перестроен: {len(catalog)} услуг")
+    return catalog
+
+
+def _load_catalog():
+    rows = safe_get_sheet_data(SHEET_ID, SERVICES_RANGE)
+    if rows is None:
+        return None
+    region = cache.region("services")
+    return _build_catalog(rows, region.value if region.loaded else None)
+
+
+cache.register("services", _load_catalog, ttl=SERVICES_TTL, empty=ServiceCatalog())
+
+
+def get_service_catalog(force: bool = False) -> ServiceCatalog:
+    """Синхронный доступ; force=True — перечитать лист немедленно."""
+    if force:
+        return cache.refresh("services")
+    return cache.get("services")
+
+
+async def load_service_catalog() -> ServiceCatalog:
+    """Асинхронный доступ для обработчиков: устаревший каталог обновляется в фоне."""
+    return await cache.aget("services")
+
+
+def invalidate_service_catalog():
+    """Следующее обращение обновит каталог (в фоне, пока отдаётся прежний)."""
+    cache.invalidate("services")
+
+
+print("✅ Модуль services.py загружен.")
@@ -1,55 +1,68 @@
 # utils/settings.py
 import logging
 from .safe_google import safe_get_sheet_data
+from .cache import cache
 from config import SHEET_ID
 
 logger = logging.getLogger(__name__)
 
-# Глобальный словарь для кэширования настроек
-_cached_settings = {}
+SETTINGS_RANGE = "Настройки!A3:C"
+SETTINGS_TTL = 300  # 5 минут
+REQUIRED_SETTINGS = ("Время начала работы", "Время окончания работы")
 
-def load_settings_from_table():
+
+def _load_settings():
     """
-    Загружает настройки из листа "Настройки" и кэширует их.
+    Читает лист "Настройки" в словарь.
     Ожидается структура: A3:C → Ключ, Значение, Описание.
     (A1 — название листа, A2 — заголовки, данные — с A3)
+    None — если лист прочитать не удалось (в кэше останутся прежние настройки).
     """
-    global _cached_settings
-    try:
-        # Читаем с A3 — данные начинаются с 3-й строки!
-        settings_data = safe_get_sheet_data(SHEET_ID, "Настройки!A3:C")
-    except Exception as e:
-        logger.exception("❌ Не удалось загрузить настройки из таблицы: %s", e)
-        _cached_settings = {}
-        return
+    settings_data = safe_get_sheet_data(SHEET_ID, SETTINGS_RANGE)
+    if settings_data is None:
+        return None
 
     new_settings = {}
     for row in settings_data:
-        # Убедимся, что в строке достаточно данных (Ключ и Значение обязательны)
-        if len(row) >= 2:
-            key = row[0].strip()
-            value = row[1].strip()
-            new_settings[key] = value
-        else:
+        # Ключ и Значение обязательны
+        if len(row) >= 2 and str(row[0]).strip() and str(row[1]).strip():
+            new_settings[str(row[0]).strip()] = str(row[1]).strip()
+        elif any(str(c).strip() for c in row):
             logger.warning(f"⚠️ Неполная строка в листе 'Настройки': {row}")
 
-    _cached_settings = new_settings
-    logger.info(f"✅ Настройки загружены и кэшированы. Ключи: {list(_cached_settings.keys())}")
+    missing = [k for k in REQUIRED_SETTINGS if k not in new_settings]
+    if missing:
+        logger.warning(f"! Отсутствуют настройки: {missing}")
+    logger.info(f"✅ Настройки загружены и кэшированы. Ключи: {list(new_settings.keys())}")
+    return new_settings
+
+
+cache.register("settings", _load_settings, ttl=SETTINGS_TTL, empty={})
+
+
+def load_settings_from_table():
+    """Немедленно перечитывает лист "Настройки" и возвращает словарь настроек."""
+    return cache.refresh("settings")
+
+
+def get_settings():
+    """Все настройки; устаревший словарь отдаётся сразу и обновляется в фоне."""
+    return cache.get("settings")
 
 
 def get_setting(key: str, default_value=None):
     """
     Возвращает значение настройки по ключу.
     Если настройка не найдена, возвращает default_value.
-    Автоматически загружает настройки, если кэш пуст.
     """
-    if not _cached_settings:
-        logger.warning("⚠️ Настройки не загружены. Загружаю...")
-        load_settings_from_table()
-
-    value = _cached_settings.get(key, default_value)
+    value = get_settings().get(key, default_value)
     logger.debug(f"⚙️ Получена настройка '{key}': {value} (по умолчанию: {default_value})")
     return value
 
 
+def invalidate_settings():
+    """Следующее обращение обновит настройки (в фоне, пока отдаются прежние)."""
+    cache.invalidate("settings")
+
+
 logger.info("✅ Модуль settings.py загружен.")
@@ -0,0 +1,86 @@
+# utils/singleflight.py
+"""
+Объединение одинаковых одновременных чтений (single-flight).
+
+Когда двадцать пользователей в одну секунду открывают выбор времени, каждый
+запускал собственное чтение одного и того же диапазона. SingleFlight держит
+по ключу (таблица, диапазон) не больше одного запроса в полёте: остальные
+вызывающие ждут его и получают тот же результат. Дополнительно результат
+считается свежим fresh_for секунд — запросы сразу после ответа тоже не идут в сеть.
+
+Каждый получает свою копию строк, поэтому изменение результата одним
+обработчиком не видно другим. После записи в таблицу вызывается forget():
+следующие чтения снова идут в Google.
+
+Пример:
+    reads = SingleFlight("sheets", fresh_for=1.0)
+    rows = await reads.do((SHEET_ID, "Записи!A3:O"), fetch, "Записи!A3:O")
+"""
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(result):
+    """Копия результата чтения: список строк или {диапазон: список строк}."""
+    if isinstance(result, list):
+        return [list(row) if isinstance(row, list) else row for row in result]
+    if isinstance(result, dict):
+        return {key: _copy(value) for key, value in result.items()}
+    return result
+
+
+class SingleFlight:
+    def __init__(self, name, fresh_for=0.0):
+        self.name = name
+        self.fresh_for = fresh_for
+        self._inflight = {}  # ключ -> asyncio.Task
+        self._recent = {}  # ключ -> (время ответа, результат)
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Выполняет await func(*args, **kwargs) или присоединяется к уже идущему вызову
+        с тем же ключом. Неудачный результат (None) не кэшируется.
+        """
+        self.calls += 1
+        recent = self._recent.get(key)
+        if recent and time.monotonic() - recent[0] < self.fresh_for:
+            self.shared += 1
+            return _copy(recent[1])
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        else:
+            self.shared += 1
+            logger.debug(f"🔗 {self.name}: присоединяемся к запросу {key}")
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return _copy(await asyncio.shield(task))
+
+    def _finished(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        else:
+            return  # После forget() результат старого запроса не запоминаем
+        if task.cancelled() or task.exception() is not None:
+            return
+        result = task.result()
+        if result is not None and self.fresh_for > 0:
+            self._recent[key] = (time.monotonic(), result)
+
+    def forget(self):
+        """Данные изменились: новые вызовы не присоединяются к старым запросам и не берут их результат."""
+        self._inflight.clear()
+        self._recent.clear()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+print("✅ Модуль singleflight.py загружен.")
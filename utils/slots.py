@@ -5,16 +5,28 @@ from datetime import datetime, timedelta
 import pytz
 from config import TIMEZONE, SHEET_ID, CALENDAR_ID
 from .safe_google import (
-    safe_get_sheet_data,
-    safe_get_calendar_events,
     safe_create_calendar_event,
     safe_update_calendar_event,
     safe_delete_calendar_event
 )
 from .settings import get_setting # Импортируем для получения количества дней генерации
+from .schedule import get_schedule_index, DAY_NAMES, DEFAULT_WORK_INTERVALS
+from .services import get_service_catalog
+from .calendar_mirror import calendar_mirror
+from .reservations import reservations
+from .availability import (
+    DEFAULT_SERVICE_DURATION,
+    first_future_minute,
+    format_minutes,
+    free_starts,
+)
 
 logger = logging.getLogger(__name__)
 
+# find_available_slots не обращается к таблице: записи — из records_repo (вместе с ещё
+# не записанными в лист), холды — из reservations, график и услуги — из индексов.
+# Вызывающий код освежает records_repo (await records_repo.ensure_fresh()) перед поиском.
+
 def generate_slots_for_n_days(days_ahead: int = None):
     """
     Генерирует слоты на N дней вперёд, начиная с *завтра*.
@@ -31,114 +43,78 @@ def generate_slots_for_n_days(days_ahead: int = None):
     logger.info(f"🔄 Генерация слотов на {days_ahead} дней вперёд...")
     # Начинаем с *завтра*
     start_date = datetime.now(TIMEZONE).date() + timedelta(days=1)
-    specialists_schedule = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") # Читаем A-I для дней недели
-    services = safe_get_sheet_data(SHEET_ID, "Услуги!A2:G") # Читаем A-G для Шага
-
-    # Получаем уже существующие события на период генерации
-    time_min = start_date.isoformat() + "T00:00:00"
-    time_max = (start_date + timedelta(days=days_ahead + 1)).isoformat() + "T23:59:59"
-    existing_events = safe_get_calendar_events(CALENDAR_ID, time_min, time_max)
+    schedule = get_schedule_index()
+    services = get_service_catalog().entries # Категория, название и шаг услуги
 
+    # Уже существующие события на период генерации — из зеркала календаря
+    # (после первой загрузки оно запрашивает у Google только изменения)
+    calendar_mirror.ensure_fresh_blocking()
     busy_slots = set()
-    for event in existing_events:
-        start = event["start"].get("dateTime")
-        if start:
-            dt = datetime.fromisoformat(start.replace("Z", "+00:00"))
-            dt = dt.astimezone(TIMEZONE)
-            date_str = dt.strftime("%d.%m.%Y")
-            time_str = dt.strftime("%H:%M")
-            # Описание может содержать информацию о специалисте
-            description = event.get("description", "")
-            # Пример: "Клиент: ..., тел.: ..." или "Бронь (в процессе) к Анна..."
-            # Пытаемся извлечь имя специалиста из описания или использовать summary
-            specialist = event.get("summary", "").split(" к ")[-1] if " к " in event.get("summary", "") else "unknown"
-            if " к " in description:
-                specialist = description.split(" к ")[-1].split(" ")[0] # Простое извлечение имени специалиста
-            busy_slots.add((date_str, time_str, specialist))
+    for days_offset in range(0, days_ahead + 2):
+        for event in calendar_mirror.events_on(start_date + timedelta(days=days_offset)):
+            busy_slots.add((event.start.strftime("%d.%m.%Y"), event.start.strftime("%H:%M"), event.specialist))
 
     for days_offset in range(0, days_ahead):
         target_date = start_date + timedelta(days=days_offset)
         target_date_str = target_date.strftime("%d.%m.%Y")
 
-        # Получаем день недели (Пн, Вт и т.д.)
-        day_name = target_date.strftime("%a")
-        short_day_map = {"Mon": "Пн", "Tue": "Вт", "Wed": "Ср", "Thu": "Чт", "Fri": "Пт", "Sat": "Сб", "Sun": "Вс"}
-        target_short_day = short_day_map.get(day_name)
-
-        if not target_short_day:
-            logger.warning(f"⚠️ Не удалось определить день недели для {target_date_str}")
-            continue
-
-        for row in specialists_schedule:
-            if len(row) < 8: # Убедимся, что в строке достаточно данных (A-H)
-                continue
-            specialist_name = row[0]
+        for spec_schedule in schedule.working(target_date.weekday()):
+            specialist_name = spec_schedule.name
             if specialist_name == "Название организации": # Пропускаем строку с расписанием заведения
                 continue
 
-            # Получаем рабочее время из колонки для конкретного дня недели
-            work_time_str = row[1:].get(target_short_day) # Псевдокод, нужно правильно индексировать
-            # Индекс колонки: Пн=1, Вт=2, ..., Вс=7 (относительно A=0)
-            day_col_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(target_short_day) + 1
-            if day_col_index >= len(row):
-                continue # Специалист не работает в этот день (нет данных в колонке)
-            work_time_str = row[day_col_index]
-
-            if work_time_str.lower().strip() == "выходной":
-                continue # Специалист не работает в этот день
-
-            # Предполагаем формат HH:MM-HH:MM
-            if "-" not in work_time_str:
-                logger.warning(f"⚠️ Неверный формат времени в графике специалиста {specialist_name} на {target_date_str}: {work_time_str}")
+            work_intervals = spec_schedule.day_intervals(target_date.weekday())
+            if not work_intervals:
+                logger.warning(f"⚠️ Неверный формат времени в графике специалиста {specialist_name} на {target_date_str}: {spec_schedule.cells[target_date.weekday()]}")
                 continue
 
-            start_time_str, end_time_str = work_time_str.split("-", 1)
-            start_time_str = start_time_str.strip()
-            end_time_str = end_time_str.strip()
-
-            try:
-                start_dt = TIMEZONE.localize(datetime.strptime(f"{target_date_str} {start_time_str}", "%d.%m.%Y %H:%M"))
-                end_dt = TIMEZONE.localize(datetime.strptime(f"{target_date_str} {end_time_str}", "%d.%m.%Y %H:%M"))
-            except ValueError as e:
-                logger.error(f"❌ Ошибка парсинга времени для {specialist_name} на {target_date_str}: {e}")
-                continue
+            for interval_start, interval_end in work_intervals:
+                day_start = TIMEZONE.localize(datetime.combine(target_date, datetime.min.time()))
+                start_dt = day_start + timedelta(minutes=interval_start)
+                end_dt = day_start + timedelta(minutes=interval_end)
 
-            # Перебираем все услуги
-            for service_row in services:
-                if len(service_row) < 7: # Убедимся, что Шаг (F) доступен
-                    continue
-
-                # category, name, duration, buffer, step, price, description
-                # Индексы: A=0, B=1, ..., F=5, G=6
-                step_minutes = int(service_row[5]) # Колонка 'Шаг (мин)'
+                # Перебираем все услуги
+                for service in services:
+                    step_minutes = service.step # Колонка E 'Шаг (мин)'
+                    if not step_minutes:
+                        continue
 
-                current_dt = start_dt
-                while current_dt + timedelta(minutes=step_minutes) <= end_dt:
-                    date_str = current_dt.strftime("%d.%m.%Y")
-                    time_str = current_dt.strftime("%H:%M")
+                    current_dt = start_dt
+                    while current_dt + timedelta(minutes=step_minutes) <= end_dt:
+                        date_str = current_dt.strftime("%d.%m.%Y")
+                        time_str = current_dt.strftime("%H:%M")
 
-                    # Проверяем, не занят ли слот
-                    if (date_str, time_str, specialist_name) not in busy_slots:
-                        event_summary = f"Свободно ({service_row[0]})" # Категория услуги в скобках
-                        event_id = safe_create_calendar_event(
-                            calendar_id=CALENDAR_ID,
-                            summary=event_summary,
-                            start_time=current_dt.isoformat(),
-                            end_time=(current_dt + timedelta(minutes=step_minutes)).isoformat(),
-                            color_id="11", # Серый
-                            description=f"Свободный слот для {service_row[1]} у {specialist_name}" # Название услуги
-                        )
-                        logger.debug(f"📅 Сгенерирован слот: {specialist_name}, {date_str} {time_str}, {service_row[1]} (ID: {event_id})")
-                    else:
-                        logger.debug(f"⏳ Слот занят, пропускаем: {specialist_name}, {date_str} {time_str}")
+                        # Проверяем, не занят ли слот
+                        if (date_str, time_str, specialist_name) not in busy_slots:
+                            event_summary = f"Свободно ({service.category})" # Категория услуги в скобках
+                            event_id = safe_create_calendar_event(
+                                calendar_id=CALENDAR_ID,
+                                summary=event_summary,
+                                start_time=current_dt.isoformat(),
+                                end_time=(current_dt + timedelta(minutes=step_minutes)).isoformat(),
+                                color_id="11", # Серый
+                                description=f"Свободный слот для {service.name} у {specialist_name}" # Название услуги
+                            )
+                            if event_id:
+                                calendar_mirror.apply_created(
+                                    event_id, event_summary, current_dt.isoformat(),
+                                    (current_dt + timedelta(minutes=step_minutes)).isoformat(),
+                                    "11", f"Свободный слот для {service.name} у {specialist_name}",
+                                )
+                            logger.debug(f"📅 Сгенерирован слот: {specialist_name}, {date_str} {time_str}, {service.name} (ID: {event_id})")
+                        else:
+                            logger.debug(f"⏳ Слот занят, пропускаем: {specialist_name}, {date_str} {time_str}")
 
-                    current_dt += timedelta(minutes=step_minutes)
+                        current_dt += timedelta(minutes=step_minutes)
 
     logger.info(f"✅ Генерация слотов на {days_ahead} дней завершена.")
 
-def find_available_slots(service_type: str, subservice: str, date_str: str = None, selected_specialist: str = None, priority: str = "date"):
+def find_available_slots(service_type: str, subservice: str, date_str: str = None, selected_specialist: str = None, priority: str = "date", owner=None):
     """
     Находит доступные слоты на основе типа услуги, подуслуги, даты, специалиста и приоритета.
+    Занятость берётся из памяти: подтверждённые записи records_repo (включая стоящие
+    в outbox) и холды. Время под чужими холдами (слоты в процессе оформления) считается занятым;
+    собственный холд клиента owner (chat_id) не мешает ему выбрать время заново.
     Возвращает список словарей с ключами: time, specialist, available_specialists (для "Любой").
     """
     logger.info(f"🎯 ПОИСК СЛОТОВ: Дата={date_str}, Специалист={selected_specialist}, Услуга={subservice} ({service_type})")
@@ -159,15 +135,18 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
     if not selected_specialist:
         logger.warning("⚠️ selected_specialist пустой, но продолжаем...")
     
+    # === 0. УСЛУГИ И ГРАФИК — ИЗ ИНДЕКСОВ, ЗАПИСИ — ИЗ records_repo ===
+    catalog = get_service_catalog()
+    schedule = get_schedule_index()
+    
     # === 1. ПОЛУЧАЕМ ГРАФИК РАБОТЫ СПЕЦИАЛИСТА ===
-    # УБЕРИТЕ: from config import CALENDAR_ID, TIMEZONE, SHEET_ID (уже импортировано)
     import datetime as dt_module  # для избежания конфликта имен
     
     # Определяем день недели
     try:
         search_date = dt_module.datetime.strptime(date_str, "%d.%m.%Y")
-        day_names = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        day_of_week = day_names[search_date.weekday()]
+        weekday = search_date.weekday()
+        day_of_week = DAY_NAMES[weekday]
         logger.info(f"День недели для {date_str}: {day_of_week}")
     except Exception as e:
         logger.error(f"Ошибка определения дня недели: {e}")
@@ -181,19 +160,8 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
         is_any_mode = True
         logger.info(f"🔍 РЕЖИМ 'ЛЮБОЙ': ищем всех специалистов категории '{service_type}'")
         
-        # 1. Находим всех специалистов этой категории
-        schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
-        for row in schedule_data:
-            if len(row) > 1 and row[0] and row[0].strip():
-                spec_name = row[0].strip()
-                spec_categories = row[1].strip().lower() if len(row) > 1 else ""
-                
-                if service_type.lower() in spec_categories:
-                    # Проверяем, работает ли в этот день
-                    day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(day_of_week) + 2
-                    if day_index < len(row) and row[day_index].strip().lower() != "выходной":
-                        all_specialists_in_category.append(spec_name)
-                        logger.info(f"  ✓ {spec_name} работает в {day_of_week}")
+        # 1. Все специалисты этой категории, работающие в этот день
+        all_specialists_in_category = [s.name for s in schedule.any_mode_candidates(weekday, service_type)]
         
         if not all_specialists_in_category:
             logger.error(f"❌ Нет работающих специалистов категории '{service_type}' на {date_str}")
@@ -202,63 +170,23 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
         logger.info(f"📋 Все специалисты категории: {all_specialists_in_category}")
     
     # Получаем график специалиста (если не "Любой")
-    schedule_data = safe_get_sheet_data(SHEET_ID, "График специалистов!A3:I") or []
     work_intervals = []  # список интервалов в минутах [(start_minutes, end_minutes), ...]
     
     if not is_any_mode:
-        # Существующая логика для конкретного специалиста
-        for row in schedule_data:
-            if len(row) > 0 and row[0] == selected_specialist:
-                day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(day_of_week) + 2
-                
-                if day_index < len(row):
-                    schedule = row[day_index].strip()
-                    if schedule.lower() == "выходной":
-                        logger.info(f"{selected_specialist} не работает в {day_of_week}")
-                        return []
-                    elif "-" in schedule:
-                        try:
-                            if "," in schedule:
-                                interval_strings = schedule.split(",")
-                                for interval_str in interval_strings:
-                                    interval_str = interval_str.strip()
-                                    if "-" in interval_str:
-                                        start_str, end_str = interval_str.split("-")
-                                        start_hour = int(start_str.split(":")[0])
-                                        start_minute = int(start_str.split(":")[1]) if ":" in start_str and len(start_str.split(":")) > 1 else 0
-                                        end_hour = int(end_str.split(":")[0])
-                                        end_minute = int(end_str.split(":")[1]) if ":" in end_str and len(end_str.split(":")) > 1 else 0
-                                        
-                                        start_in_minutes = start_hour * 60 + start_minute
-                                        end_in_minutes = end_hour * 60 + end_minute
-                                        
-                                        work_intervals.append((start_in_minutes, end_in_minutes))
-                                        logger.info(f"  Интервал в минутах: {start_str}-{end_str} ({start_in_minutes}-{end_in_minutes} мин)")
-                            else:
-                                start_str, end_str = schedule.split("-")
-                                start_hour = int(start_str.split(":")[0])
-                                start_minute = int(start_str.split(":")[1]) if ":" in start_str and len(start_str.split(":")) > 1 else 0
-                                end_hour = int(end_str.split(":")[0])
-                                end_minute = int(end_str.split(":")[1]) if ":" in end_str and len(end_str.split(":")) > 1 else 0
-                                
-                                start_in_minutes = start_hour * 60 + start_minute
-                                end_in_minutes = end_hour * 60 + end_minute
-                                
-                                work_intervals.append((start_in_minutes, end_in_minutes))
-                                logger.info(f"  Интервал в минутах: {start_str}-{end_str} ({start_in_minutes}-{end_in_minutes} мин)")
-                            
-                            logger.info(f"График {selected_specialist}: {schedule} (интервалы в минутах: {work_intervals})")
-                        except Exception as e:
-                            logger.error(f"Ошибка парсинга графика: {e}")
-                            work_intervals = [(10*60, 20*60)]
-                break
+        spec_schedule = schedule.get(selected_specialist)
+        if spec_schedule and spec_schedule.is_day_off(weekday):
+            logger.info(f"{selected_specialist} не работает в {day_of_week}")
+            return []
+        if spec_schedule:
+            work_intervals = spec_schedule.day_intervals(weekday) or []
+            logger.info(f"График {selected_specialist}: {spec_schedule.cells[weekday]} (интервалы в минутах: {work_intervals})")
     
     # Для "Любой" будем обрабатывать каждого специалиста отдельно
     if is_any_mode:
         # Рабочие интервалы для "Любой" будут обрабатываться позже
         pass
     elif not work_intervals:
-        work_intervals = [(10*60, 20*60)]
+        work_intervals = list(DEFAULT_WORK_INTERVALS)
     
     # Получаем текущее время
     now = dt_module.datetime.now(TIMEZONE)
@@ -273,18 +201,14 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
         logger.error(f"Ошибка проверки даты: {e}")
     
     # === 2. ПОЛУЧАЕМ ДЛИТЕЛЬНОСТЬ УСЛУГИ ===
-    service_duration = 60
+    service_duration = DEFAULT_SERVICE_DURATION
     service_buffer = 0
-    services_data = safe_get_sheet_data(SHEET_ID, "Услуги!A3:G") or []
-    for row in services_data:
-        if len(row) > 1 and row[1] == subservice:
-            try:
-                service_duration = int(row[2]) if row[2] else 60
-                service_buffer = int(row[3]) if len(row) > 3 and row[3] else 0
-                logger.info(f"Услуга '{subservice}': {service_duration} мин + буфер {service_buffer} мин")
-            except Exception as e:
-                logger.error(f"Ошибка парсинга длительности услуги: {e}")
-            break
+    service = catalog.get(subservice)
+    if service and service.valid:
+        service_duration, service_buffer = service.duration, service.buffer
+        logger.info(f"Услуга '{subservice}': {service_duration} мин + буфер {service_buffer} мин")
+    elif service:
+        logger.error(f"Ошибка парсинга длительности услуги '{subservice}': {service.row[2:4]}")
     
     total_duration = service_duration + service_buffer
     
@@ -305,8 +229,6 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
     # === 3. ПОЛУЧАЕМ ЗАНЯТЫЕ ИНТЕРВАЛЫ ===
     busy_intervals_by_specialist = {}
     
-    records = safe_get_sheet_data(SHEET_ID, "Записи!A3:O") or []
-    
     if is_any_mode:
         logger.info(f"=== DEBUG SLOTS: Ищу занятые слоты для ВСЕХ специалистов на {date_str} ===")
         target_specialists = all_specialists_in_category
@@ -314,148 +236,40 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
         logger.info(f"=== DEBUG SLOTS: Ищу занятые слоты для {selected_specialist} на {date_str} ===")
         target_specialists = [selected_specialist]
     
-    for idx, r in enumerate(records, start=3):
-        if len(r) > 7:
-            record_date = str(r[6]).strip()
-            record_specialist = str(r[5]).strip() if len(r) > 5 else ""
-            record_status = str(r[8]).strip() if len(r) > 8 else ""
-            record_time = str(r[7]).strip()
-            
-            if (record_date == date_str and 
-                record_status == "подтверждено" and
-                record_specialist in target_specialists):
-             
-                logger.info(f"Запись {idx}: дата='{record_date}', спец='{record_specialist}', время='{record_time}' ✓ ПОДХОДИТ!")
-                
-                try:
-                    if "-" in record_time:
-                        start_time_str = record_time.split("-")[0].strip()
-                    else:
-                        start_time_str = record_time
+    # Записи специалистов на дату — по индексу (специалист, дата), без чтения листа
+    for spec in target_specialists:
+        for busy_start, busy_end, label in reservations.booked_intervals(spec, date_str):
+            busy_intervals_by_specialist.setdefault(spec, []).append((busy_start, busy_end))
+            logger.info(f"   Занято: {format_minutes(busy_start)}-{format_minutes(busy_end)} ({label})")
 
-                    logger.info(f"  ОТЛАДКА: Парсим '{record_date} {start_time_str}'")
-                    
-                    naive_datetime = dt_module.datetime.strptime(f"{record_date} {start_time_str}", "%d.%m.%Y %H:%M")
-                    
-                    if naive_datetime.tzinfo is None:
-                        start_dt = TIMEZONE.localize(naive_datetime)
-                    else:
-                        start_dt = naive_datetime
-                    
-                    record_service = str(r[4]).strip() if len(r) > 4 else ""
-                    record_service_duration = 60
-                    
-                    for svc_row in services_data:
-                        if len(svc_row) > 1 and svc_row[1] == record_service:
-                            try:
-                                base_duration = int(svc_row[2]) if svc_row[2] else 60
-                                buffer_duration = int(svc_row[3]) if len(svc_row) > 3 and svc_row[3] else 0
-                                record_service_duration = base_duration + buffer_duration
-                                break
-                            except (ValueError, TypeError):
-                                pass
-                    
-                    end_dt = start_dt + dt_module.timedelta(minutes=record_service_duration)
-                    
-                    start_minutes = start_dt.hour * 60 + start_dt.minute
-                    end_minutes = end_dt.hour * 60 + end_dt.minute
-                    
-                    if record_specialist not in busy_intervals_by_specialist:
-                        busy_intervals_by_specialist[record_specialist] = []
-                    busy_intervals_by_specialist[record_specialist].append((start_minutes, end_minutes))
-                    
-                    logger.info(f"   Занято: {start_time_str}-{end_dt.strftime('%H:%M')} ({record_service}, {record_service_duration} мин)")
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка обработки записи {idx}: {e}")
+    # Холды других клиентов («⏳ Бронь») занимают время так же, как записи
+    for spec in target_specialists:
+        for hold_start, hold_end, _ in reservations.held_intervals(spec, date_str, exclude_owner=owner):
+            busy_intervals_by_specialist.setdefault(spec, []).append((hold_start, hold_end))
     
     logger.info(f"=== DEBUG SLOTS: Найдено занятых интервалов ===")
     
     # === 4. ГЕНЕРИРУЕМ СВОБОДНЫЕ СЛОТЫ ===
     available_slots = []
+    # Слоты, начало которых уже прошло, отсекаются одной маской
+    not_before = first_future_minute(search_date.date(), now)
     
     if is_any_mode:
         # === РЕЖИМ "ЛЮБОЙ": собираем слоты по времени ===
         time_to_specialists = {}
         
-        # Вспомогательная функция для получения интервалов работы
+        # Интервалы работы специалиста из индекса графика; пустая ячейка — график по умолчанию
         def get_spec_intervals(spec_name):
-            for row in schedule_data:
-                if len(row) > 0 and row[0] == spec_name:
-                    day_index = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"].index(day_of_week) + 2
-                    if day_index < len(row):
-                        schedule = row[day_index].strip()
-                        if schedule.lower() == "выходной":
-                            return []
-                        elif "-" in schedule:
-                            intervals = []
-                            if "," in schedule:
-                                parts = schedule.split(",")
-                                for part in parts:
-                                    part = part.strip()
-                                    if "-" in part:
-                                        start_str, end_str = part.split("-")
-                                        start_hour = int(start_str.split(":")[0])
-                                        start_minute = int(start_str.split(":")[1]) if ":" in start_str and len(start_str.split(":")) > 1 else 0
-                                        end_hour = int(end_str.split(":")[0])
-                                        end_minute = int(end_str.split(":")[1]) if ":" in end_str and len(end_str.split(":")) > 1 else 0
-                                        
-                                        start_in_minutes = start_hour * 60 + start_minute
-                                        end_in_minutes = end_hour * 60 + end_minute
-                                        intervals.append((start_in_minutes, end_in_minutes))
-                            else:
-                                start_str, end_str = schedule.split("-")
-                                start_hour = int(start_str.split(":")[0])
-                                start_minute = int(start_str.split(":")[1]) if ":" in start_str and len(start_str.split(":")) > 1 else 0
-                                end_hour = int(end_str.split(":")[0])
-                                end_minute = int(end_str.split(":")[1]) if ":" in end_str and len(end_str.split(":")) > 1 else 0
-                                
-                                start_in_minutes = start_hour * 60 + start_minute
-                                end_in_minutes = end_hour * 60 + end_minute
-                                intervals.append((start_in_minutes, end_in_minutes))
-                            return intervals
-            return [(10*60, 20*60)]
+            spec_schedule = schedule.get(spec_name)
+            return (spec_schedule and spec_schedule.day_intervals(weekday)) or list(DEFAULT_WORK_INTERVALS)
         
-        # Для каждого специалиста
+        # Для каждого специалиста: свободные начала считаются битовыми масками
         for spec in all_specialists_in_category:
             spec_intervals = get_spec_intervals(spec)
             spec_busy = busy_intervals_by_specialist.get(spec, [])
             
-            for interval_start, interval_end in spec_intervals:
-                current_minutes = interval_start
-                while current_minutes + total_duration <= interval_end:
-                    
-                    # Проверяем, не прошло ли время
-                    hour = current_minutes // 60
-                    minute = current_minutes % 60
-                    time_str = f"{hour:02d}:{minute:02d}"
-                    
-                    try:
-                        slot_dt = TIMEZONE.localize(
-                            dt_module.datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
-                        )
-                        if slot_dt < now:
-                            current_minutes += 15
-                            continue
-                    except Exception:
-                        pass
-                    
-                    slot_start = current_minutes
-                    slot_end = current_minutes + total_duration
-                    
-                    # Проверяем занятость
-                    slot_free = True
-                    for busy_start, busy_end in spec_busy:
-                        if not (slot_end <= busy_start or slot_start >= busy_end):
-                            slot_free = False
-                            break
-                    
-                    if slot_free:
-                        if time_str not in time_to_specialists:
-                            time_to_specialists[time_str] = []
-                        time_to_specialists[time_str].append(spec)
-                    
-                    current_minutes += 15
+            for slot_start in free_starts(spec_intervals, spec_busy, total_duration, not_before):
+                time_to_specialists.setdefault(format_minutes(slot_start), []).append(spec)
         
         # Преобразуем в формат для бота
         for time_str, specialists in sorted(time_to_specialists.items()):
@@ -476,44 +290,15 @@ def find_available_slots(service_type: str, subservice: str, date_str: str = Non
         # === ОБЫЧНЫЙ РЕЖИМ ===
         logger.info(f"Генерация слотов по интервалам: {work_intervals}")
         
-        for interval_start, interval_end in work_intervals:
-            current_minutes = interval_start
-            while current_minutes + total_duration <= interval_end:
-                
-                hour = current_minutes // 60
-                minute = current_minutes % 60
-                time_str = f"{hour:02d}:{minute:02d}"
-                
-                try:
-                    slot_dt = TIMEZONE.localize(
-                        dt_module.datetime.strptime(f"{date_str} {time_str}", "%d.%m.%Y %H:%M")
-                    )
-                    if slot_dt < now:
-                        current_minutes += 15
-                        continue
-                except Exception as e:
-                    logger.error(f"Ошибка проверки времени слота: {e}")
-                
-                slot_start = current_minutes
-                slot_end = current_minutes + total_duration
-                
-                slot_overlaps = False
-                spec_busy = busy_intervals_by_specialist.get(selected_specialist, [])
-                for busy_start, busy_end in spec_busy:
-                    if not (slot_end <= busy_start or slot_start >= busy_end):
-                        slot_overlaps = True
-                        break
-                
-                if not slot_overlaps:
-                    available_slots.append({
-                        "time": time_str,
-                        "specialist": selected_specialist,
-                        "available_specialists": [selected_specialist],
-                        "available_count": 1,
-                        "is_any_mode": False
-                    })
-                
-                current_minutes += 15
+        spec_busy = busy_intervals_by_specialist.get(selected_specialist, [])
+        for slot_start in free_starts(work_intervals, spec_busy, total_duration, not_before):
+            available_slots.append({
+                "time": format_minutes(slot_start),
+                "specialist": selected_specialist,
+                "available_specialists": [selected_specialist],
+                "available_count": 1,
+                "is_any_mode": False
+            })
     
     logger.info(f"Сгенерировано {len(available_slots)} свободных слотов")
     
@@ -0,0 +1,67 @@
+# utils/update_processor.py
+"""
+Параллельная обработка апдейтов разных чатов.
+
+По умолчанию PTB обрабатывает апдейты строго по одному, и медленный запрос к
+Google (даже через async_google) задерживает ответы всем пользователям. С
+concurrent_updates апдейты обрабатываются одновременно, но тогда два нажатия
+одного пользователя могут выполняться вперемешку: user_data["state"],
+temp_booking и защита от повторных нажатий рассчитаны на последовательную
+обработку.
+
+PerChatUpdateProcessor пропускает одновременно до MAX_CONCURRENT_UPDATES
+апдейтов, а апдейты одного чата (или пользователя, если чата нет) — по очереди,
+в порядке поступления.
+
+Пример:
+    application = ApplicationBuilder().token(TOKEN).concurrent_updates(PerChatUpdateProcessor()).build()
+"""
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = 16  # Апдейтов, обрабатываемых одновременно
+
+
+def _update_key(update):
+    """Чат апдейта, иначе пользователь; None — апдейт ни к кому не привязан."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # ключ чата -> [asyncio.Lock, сколько апдейтов его ждут или держат]
+
+    async def do_process_update(self, update, coroutine):
+        key = _update_key(update)
+        if key is None:
+            await coroutine
+            return
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def initialize(self):
+        logger.info(f"⚡ Параллельная обработка апдейтов: до {self.max_concurrent_updates}, по чатам — по очереди")
+
+    async def shutdown(self):
+        self._locks.clear()
+
+
+print("✅ Модуль update_processor.py загружен.")
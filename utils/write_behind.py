@@ -0,0 +1,108 @@
+# utils/write_behind.py
+"""
+Отложенная пакетная запись в Google Sheets.
+
+Фоновые задачи (напоминания, лист ожидания, обратные звонки) меняют статусы
+во многих строках за один проход. Вместо отдельного values.update на каждую
+строку изменения копятся в буфере и уходят одним values.batchUpdate:
+в конце прохода задачи, по периодической задаче и при остановке бота.
+
+Повторная запись в тот же диапазон до сброса заменяет предыдущую.
+Неудачный пакет возвращается в буфер (если его не перекрыла более новая запись)
+и повторяется при следующем сбросе, но не более MAX_ATTEMPTS раз.
+"""
+import logging
+import threading
+
+from config import SHEET_ID
+from .safe_google import safe_batch_update_values
+from .async_google import run_blocking, WRITE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+FLUSH_INTERVAL = 5  # Секунды между периодическими сбросами буфера
+
+
+class SheetWriteBuffer:
+    def __init__(self, spreadsheet_id=SHEET_ID, max_attempts=MAX_ATTEMPTS):
+        self.spreadsheet_id = spreadsheet_id
+        self.max_attempts = max_attempts
+        self._pending = {}  # диапазон -> (values, номер попытки)
+        self._lock = threading.Lock()
+
+    def queue(self, range_name, values):
+        """Ставит в очередь запись диапазона (values — двумерный список)."""
+        with self._lock:
+            self._pending[range_name] = (values, 0)
+
+    def queue_row(self, sheet_name, row_index, values):
+        """Ставит в очередь запись целой строки, начиная с колонки A."""
+        self.queue(f"{sheet_name}!A{row_index}", [list(values)])
+
+    def queue_cell(self, sheet_name, cell, value):
+        """Ставит в очередь запись одной ячейки, например queue_cell("Записи", "L5", "✅")."""
+        self.queue(f"{sheet_name}!{cell}", [[value]])
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _take(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _requeue(self, batch):
+        with self._lock:
+            for range_name, (values, attempt) in batch.items():
+                if range_name in self._pending:
+                    continue  # Уже есть более свежая запись в этот диапазон
+                if attempt + 1 >= self.max_attempts:
+                    logger.error(f"❌ Запись в {range_name} отброшена после {self.max_attempts} попыток")
+                    continue
+                self._pending[range_name] = (values, attempt + 1)
+
+    @staticmethod
+    def _to_request(batch):
+        return [{'range': r, 'values': v} for r, (v, _) in batch.items()]
+
+    async def flush(self):
+        """Отправляет накопленные изменения одним batchUpdate (не блокируя event loop)."""
+        batch = self._take()
+        if not batch:
+            return True
+        ok = await run_blocking(
+            safe_batch_update_values, self.spreadsheet_id, self._to_request(batch),
+            timeout=WRITE_TIMEOUT, default=False,
+        )
+        if not ok:
+            logger.warning(f"⚠️ Пакетная запись {len(batch)} диапазонов не удалась, повторим позже")
+            self._requeue(batch)
+        return ok
+
+    def flush_sync(self):
+        """Синхронный сброс — для остановки бота, когда event loop уже закрыт."""
+        batch = self._take()
+        if not batch:
+            return True
+        try:
+            ok = safe_batch_update_values(self.spreadsheet_id, self._to_request(batch))
+        except Exception as e:
+            logger.error(f"❌ Ошибка сброса буфера записи при остановке: {e}")
+            ok = False
+        if not ok:
+            logger.error(f"❌ При остановке не записаны диапазоны: {list(batch)}")
+        return ok
+
+
+write_buffer = SheetWriteBuffer()
+
+
+async def flush_write_buffer_job(context):
+    """Периодическая задача: сбрасывает всё, что накопилось за FLUSH_INTERVAL."""
+    if write_buffer.pending_count():
+        await write_buffer.flush()
+
+
+print("✅ Модуль write_behind.py загружен.")